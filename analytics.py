@@ -0,0 +1,263 @@
+# =============================================
+# analytics.py
+# Аналитика цен по маршрутам: колоночное хранение на array,
+# инкрементальные медиана / перцентили / тренд
+# =============================================
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from array import array
+from bisect import bisect_left, insort
+
+from ati_client import normalize_price
+from config import ANALYTICS_ROUTE_WINDOW, ANALYTICS_SEEN_SIZE
+from render_cache import RenderCache
+
+logger = logging.getLogger("analytics")
+
+# Сглаживание тренда: быстрая и медленная экспоненциальные средние
+_FAST_ALPHA = 0.3
+_SLOW_ALPHA = 0.05
+
+# Меньше стольких откликов — статистике маршрута не верим
+MIN_SAMPLES = 5
+
+# Прогрев из зеркала: столько откликов за раз, между пачками — отдать цикл событий
+_WARM_UP_BATCH = 500
+
+
+class RouteStats:
+    """
+    Колонки одного маршрута (array('d')) + отсортированная копия цен.
+
+    Добавление — вставка в отсортированный массив (bisect + memmove),
+    медиана и перцентили — обращение по индексу, тренд — по двум EWMA.
+    Хранятся последние window откликов, старые вытесняются.
+    """
+
+    __slots__ = ("window", "prices", "weights", "timestamps", "sorted_prices", "fast", "slow")
+
+    def __init__(self, window: int = ANALYTICS_ROUTE_WINDOW):
+        self.window = window
+        self.prices = array("d")
+        self.weights = array("d")
+        self.timestamps = array("d")
+        self.sorted_prices = array("d")
+        self.fast = 0.0
+        self.slow = 0.0
+
+    def add(self, price: float, weight: float, ts: float):
+        self.prices.append(price)
+        self.weights.append(weight)
+        self.timestamps.append(ts)
+        insort(self.sorted_prices, price)
+
+        if len(self.prices) > self.window:
+            oldest = self.prices.pop(0)
+            self.weights.pop(0)
+            self.timestamps.pop(0)
+            del self.sorted_prices[bisect_left(self.sorted_prices, oldest)]
+
+        if len(self.prices) == 1:
+            self.fast = self.slow = price
+        else:
+            self.fast += _FAST_ALPHA * (price - self.fast)
+            self.slow += _SLOW_ALPHA * (price - self.slow)
+
+    def __len__(self) -> int:
+        return len(self.sorted_prices)
+
+    def percentile(self, q: float) -> float:
+        data = self.sorted_prices
+        if not data:
+            return 0.0
+
+        # линейная интерполяция между соседними значениями
+        pos = (len(data) - 1) * q
+        lo = int(pos)
+        hi = min(lo + 1, len(data) - 1)
+        return data[lo] + (data[hi] - data[lo]) * (pos - lo)
+
+    @property
+    def median(self) -> float:
+        return self.percentile(0.5)
+
+    @property
+    def trend(self) -> float:
+        """
+        Отношение недавнего уровня цен к долгосрочному минус 1 (0.05 = +5%)
+        """
+        return self.fast / self.slow - 1 if self.slow else 0.0
+
+    def price_per_ton(self) -> float | None:
+        total_weight = 0.0
+        total_price = 0.0
+
+        for price, weight in zip(self.prices, self.weights):
+            if weight > 0:
+                total_weight += weight
+                total_price += price
+
+        return total_price / total_weight if total_weight else None
+
+
+def _route_key(from_city: str, to_city: str, with_nds: bool) -> tuple:
+    return from_city.strip().lower(), to_city.strip().lower(), with_nds
+
+
+def _weight(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PriceAnalytics:
+    """
+    Цены откликов по маршрутам (город погрузки, город выгрузки, с НДС / без).
+    Каждый отклик учитывается один раз (по ResponseId среди последних seen_size).
+    """
+
+    def __init__(self, window: int = ANALYTICS_ROUTE_WINDOW, seen_size: int = ANALYTICS_SEEN_SIZE):
+        self.window = window
+        self._routes: dict[tuple, RouteStats] = {}
+        self._seen = RenderCache(seen_size, name="analytics_seen")
+
+    def record(self, load: dict, r: dict, ts: float | None = None) -> bool:
+        response_id = r.get("ResponseId")
+        if response_id is None or self._seen.get(str(response_id)):
+            return False
+
+        price = normalize_price(r)
+        if price is None:
+            return False
+
+        self._add(str(response_id), load["from_city"], load["to_city"], load.get("weight"), price, ts)
+        return True
+
+    def _add(self, response_id: str, from_city: str, to_city: str, weight, price: tuple, ts: float | None):
+        self._seen.put(response_id, True)
+
+        value, with_nds = price
+        key = _route_key(from_city, to_city, with_nds)
+
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = RouteStats(self.window)
+
+        stats.add(value, _weight(weight), ts or time.time())
+
+    def record_many(self, load: dict, responses: list):
+        for r in responses:
+            self.record(load, r)
+
+    def route(self, from_city: str, to_city: str, with_nds: bool) -> RouteStats | None:
+        return self._routes.get(_route_key(from_city, to_city, with_nds))
+
+    def price_hint(self, load: dict, r: dict) -> str:
+        """
+        Подсказка «vs. медиана маршрута» для уведомления — O(1)
+        """
+        price = normalize_price(r)
+        if price is None:
+            return ""
+
+        value, with_nds = price
+        stats = self.route(load["from_city"], load["to_city"], with_nds)
+        if stats is None or len(stats) < MIN_SAMPLES:
+            return ""
+
+        median = stats.median
+        if not median:
+            return ""
+
+        diff = value / median - 1
+
+        if abs(diff) < 0.02:
+            verdict = "на уровне медианы"
+        elif diff < 0:
+            verdict = f"🟢 на {-diff:.0%} ниже медианы"
+        else:
+            verdict = f"🔴 на {diff:.0%} выше медианы"
+
+        return f"📊 {verdict} ({int(median):,} ₽, n={len(stats)})"
+
+    def describe(self, from_city: str, to_city: str) -> list:
+        """
+        Строки для /stats по обоим вариантам НДС
+        """
+        lines = []
+
+        for with_nds in (True, False):
+            stats = self.route(from_city, to_city, with_nds)
+            if stats is None or not len(stats):
+                continue
+
+            per_ton = stats.price_per_ton()
+            lines += [
+                f"<b>{'С НДС' if with_nds else 'Без НДС'}</b> — откликов: {len(stats)}",
+                f"   медиана: {int(stats.median):,} ₽",
+                f"   p10 / p25 / p75 / p90: "
+                f"{int(stats.percentile(0.1)):,} / {int(stats.percentile(0.25)):,} / "
+                f"{int(stats.percentile(0.75)):,} / {int(stats.percentile(0.9)):,} ₽",
+                f"   тренд: {stats.trend:+.1%}",
+            ]
+            if per_ton:
+                lines.append(f"   ≈ {int(per_ton):,} ₽/т")
+
+        return lines
+
+    # -----------------------------------------
+    # Прогрев из локального зеркала (mirror.py)
+    # -----------------------------------------
+
+    @staticmethod
+    def _read_mirror(path: str) -> list:
+        """
+        Выполняется в потоке: чтение, json.loads и разбор цены.
+        Возвращает (response_id, from_city, to_city, weight, price, seen)
+        """
+        db = sqlite3.connect(path)
+        try:
+            rows = db.execute(
+                "SELECT l.from_city, l.to_city, l.weight, r.raw, r.seen"
+                " FROM responses r JOIN loads l ON l.seq = ("
+                "   SELECT MAX(seq) FROM loads"
+                "   WHERE manager = r.manager AND load_id = r.load_id AND status = 'active'"
+                " )"
+                " ORDER BY r.seq"
+            ).fetchall()
+        finally:
+            db.close()
+
+        parsed = []
+        for from_city, to_city, weight, raw, seen in rows:
+            r = json.loads(raw)
+            response_id = r.get("ResponseId")
+            price = normalize_price(r)
+            if response_id is not None and price is not None:
+                parsed.append((str(response_id), from_city, to_city, weight, price, seen))
+
+        return parsed
+
+    async def warm_up(self, mirror_path: str):
+        try:
+            rows = await asyncio.to_thread(self._read_mirror, mirror_path)
+        except sqlite3.Error as e:
+            logger.warning("[Analytics] зеркало недоступно: %s", e)
+            return
+
+        # в цикле событий — только вставка, пачками
+        for start in range(0, len(rows), _WARM_UP_BATCH):
+            for response_id, from_city, to_city, weight, price, seen in rows[start:start + _WARM_UP_BATCH]:
+                if not self._seen.get(response_id):
+                    self._add(response_id, from_city, to_city, weight, price, seen)
+            await asyncio.sleep(0)
+
+        logger.info("[Analytics] загружено откликов: %s, маршрутов: %s", len(self._seen), len(self._routes))
+
+
+price_analytics = PriceAnalytics()
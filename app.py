@@ -0,0 +1,57 @@
+# =============================================
+# app.py
+# Фабрика приложения: явно связывает клиента ATI, состояние,
+# планировщик и бота. Тяжёлые ресурсы создаются здесь, а не при импорте
+# =============================================
+
+import asyncio
+import logging
+
+logger = logging.getLogger("app")
+
+
+class App:
+    """
+    Собранное приложение: bot и dp для aiogram, start() — фоновые части
+    """
+
+    def __init__(self, bot, dp):
+        self.bot = bot
+        self.dp = dp
+        self._background: list = []
+
+    def start(self, with_jobs: bool = True):
+        """
+        Вызывать изнутри работающего цикла событий
+        """
+        from config import MIRROR_DB_PATH
+        from ati_client import load_cities
+        from analytics import price_analytics
+
+        # справочник городов и статистика цен — в фоне, не задерживая старт
+        self._background += [
+            asyncio.create_task(asyncio.to_thread(load_cities)),
+            asyncio.create_task(price_analytics.warm_up(MIRROR_DB_PATH)),
+        ]
+
+        if with_jobs:
+            from scheduler import start_scheduler
+            start_scheduler()
+
+    def stop(self):
+        for task in self._background:
+            task.cancel()
+
+
+def create_app() -> App:
+    import scheduler
+    import telegram_bot
+
+    dp = telegram_bot.create_dispatcher()
+
+    scheduler.bind_notifier(
+        new_response=telegram_bot.notify_new_response,
+        update_result=telegram_bot.notify_update_result,
+    )
+
+    return App(bot=telegram_bot.get_bot(), dp=dp)
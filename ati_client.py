@@ -5,27 +5,109 @@
 
 import httpx
 import json
+import logging
 import os
-from config import MANAGERS
+import re
+import threading
+import time
+
+import metrics
+import offload
+import tracing
+from render_cache import RenderCache
+from config import MANAGERS, LOADS_PAGE_SIZE, LOADS_MAX_PAGES, CONDITIONAL_CACHE_SIZE
+from config import OFFLOAD_JSON_BYTES, OFFLOAD_LOADS_MIN_ITEMS
 
 ATI_BASE_URL = "https://api.ati.su"
 TIMEOUT = 20.0
 
+logger = logging.getLogger("ati")
+
 # =============================================
 # Загрузка городов
 # =============================================
 
 _CITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.json")
-_CITY_NAMES: dict[str, str] = {}
+# Справочник грузится при первом обращении (или заранее, load_cities() в потоке
+# при старте бота) — импорт модуля его не читает
+_CITY_NAMES: dict[str, str] | None = None
+_cities_lock = threading.Lock()
+
+
+def load_cities() -> dict[str, str]:
+    global _CITY_NAMES
+
+    with _cities_lock:
+        if _CITY_NAMES is not None:
+            return _CITY_NAMES
+
+        names = {}
+        try:
+            with open(_CITIES_FILE, "r", encoding="utf-8") as f:
+                names = json.load(f)
+            logger.info("[Cities] Загружено %s городов", len(names))
+        except FileNotFoundError:
+            logger.warning("[Cities] ВНИМАНИЕ: cities.json не найден!")
+        except Exception as e:
+            logger.error("[Cities] Ошибка загрузки cities.json: %s", e)
+
+        _CITY_NAMES = names
+        return names
+
+
+# =============================================
+# HTTP-клиент
+# =============================================
+
+# Транспорт и хуки можно подменить: запись и воспроизведение трафика (cassette.py)
+_transport: httpx.AsyncBaseTransport | None = None
+_response_hooks: list = []
+
+
+def set_transport(transport: httpx.AsyncBaseTransport | None):
+    global _transport
+    _transport = transport
 
-try:
-    with open(_CITIES_FILE, "r", encoding="utf-8") as f:
-        _CITY_NAMES = json.load(f)
-    print(f"[Cities] Загружено {len(_CITY_NAMES)} городов")
-except FileNotFoundError:
-    print("[Cities] ВНИМАНИЕ: cities.json не найден!")
-except Exception as e:
-    print(f"[Cities] Ошибка загрузки cities.json: {e}")
+
+def add_response_hook(hook):
+    _response_hooks.append(hook)
+
+
+def endpoint_name(path: str) -> str:
+    """
+    /v1.0/loads/123/responses -> /v1.0/loads/{id}/responses (метка для логов и метрик)
+    """
+    return "/".join(
+        "{id}" if re.search(r"\d", part) and not part.startswith("v1") else part
+        for part in path.split("/")
+    )
+
+
+async def _mark_request_start(request: httpx.Request):
+    request.extensions["started"] = time.monotonic()
+
+
+async def _log_response(response: httpx.Response):
+    started = response.request.extensions.get("started")
+    latency = time.monotonic() - started if started else 0.0
+    endpoint = endpoint_name(response.request.url.path)
+
+    metrics.observe("ati_latency_seconds", latency, endpoint=endpoint)
+    logger.debug(
+        "%s %s", response.request.method, endpoint,
+        extra={"endpoint": endpoint, "status": response.status_code, "latency": round(latency, 3)},
+    )
+
+
+def new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=TIMEOUT,
+        transport=_transport,
+        event_hooks={
+            "request": [_mark_request_start],
+            "response": [_log_response, *_response_hooks],
+        },
+    )
 
 
 # =============================================
@@ -42,7 +124,8 @@ def get_headers(manager_key: str) -> dict:
 def city_name(city_id) -> str:
     if city_id is None:
         return "—"
-    return _CITY_NAMES.get(str(city_id), f"г.{city_id}")
+    names = _CITY_NAMES if _CITY_NAMES is not None else load_cities()
+    return names.get(str(city_id), f"г.{city_id}")
 
 
 # =============================================
@@ -52,7 +135,7 @@ async def delete_load(manager_key: str, load_id: str) -> dict:
     url = f"{ATI_BASE_URL}/v1.0/loads/{load_id}"
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        async with new_client() as client:
             response = await client.delete(url, headers=get_headers(manager_key))
     except httpx.RequestError as e:
         return {"success": False, "reason": str(e)}
@@ -109,62 +192,261 @@ def parse_load(load: dict) -> dict:
     }
 
 
+def _parse_loads(loads: list) -> list:
+    return [parse_load(load) for load in loads]
+
+
+async def parse_loads(loads: list) -> list:
+    """
+    parse_load для страницы грузов; длинные страницы — в пуле потоков
+    """
+    return await offload.run(
+        _parse_loads, loads, size=len(loads), threshold=OFFLOAD_LOADS_MIN_ITEMS, kind="parse_loads",
+    )
+
+
+# =============================================
+# Цена отклика
+# =============================================
+
+def normalize_price(r: dict) -> tuple[float, bool] | None:
+    """
+    Цена отклика и признак НДС: (сумма, с НДС) или None, если цены нет
+    """
+    nds_price = r.get("NdsPrice") or 0
+    not_nds_price = r.get("NotNdsPrice") or 0
+    price_value = r.get("Price") or 0
+    pay_attr = r.get("PayAttributes", 0) or 0
+
+    try:
+        nds_price = float(nds_price)
+        not_nds_price = float(not_nds_price)
+        price_value = float(price_value)
+    except (TypeError, ValueError):
+        return None
+
+    # приоритет — явные поля
+    if nds_price > 0:
+        return nds_price, True
+    elif not_nds_price > 0:
+        return not_nds_price, False
+
+    # fallback через PayAttributes
+    elif price_value > 0:
+        return price_value, bool(pay_attr & 8)
+
+    return None
+
+
 # =============================================
 # Безопасный JSON
 # =============================================
 
+def _decode_response(response: httpx.Response):
+    content = response.content
+    # как json.loads(bytes): кодировка по первым байтам (utf-8 / utf-16 / utf-32)
+    return offload.decode_json(content.decode(json.detect_encoding(content), "surrogatepass"))
+
+
 async def safe_json(response: httpx.Response):
+    # большие ответы (тысячи грузов) разбираются в пуле потоков по частям
     try:
-        return response.json()
+        with tracing.span("ati.decode", bytes=len(response.content)):
+            if len(response.content) < OFFLOAD_JSON_BYTES:
+                return response.json()
+            return await offload.run(
+                _decode_response, response,
+                size=len(response.content), threshold=OFFLOAD_JSON_BYTES, kind="json",
+            )
     except Exception:
-        print(f"[ATI] Ошибка JSON: {response.text[:300]}")
+        logger.error("[ATI] Ошибка JSON: %s", response.text[:300])
         return None
 
 
 # =============================================
-# Получение МОИХ грузов (исправленная логика)
+# Условные запросы (ETag / Last-Modified) и сжатие
 # =============================================
 
-async def get_my_loads(manager_key: str) -> list:
-    url = f"{ATI_BASE_URL}/v1.0/loads"
+# (manager_key, url, стабильные параметры) -> {"etag", "last_modified", "data", "wire_bytes"}.
+# Ответ на 304 нужно чем-то отдать, поэтому разобранные данные хранятся —
+# но не больше CONDITIONAL_CACHE_SIZE последних страниц (LRU)
+_validators = RenderCache(CONDITIONAL_CACHE_SIZE, name="conditional")
 
-    try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.get(url, headers=get_headers(manager_key))
-    except httpx.RequestError as e:
-        print(f"[ATI] Ошибка сети get_my_loads: {e}")
-        return []
+
+def _wire_bytes(response: httpx.Response) -> int:
+    # байты по сети (до распаковки gzip/br); Content-Length — если поток уже прочитан транспортом
+    return (
+        response.num_bytes_downloaded
+        or int(response.headers.get("Content-Length") or 0)
+        or len(response.content)
+    )
+
+
+def _count_transfer(endpoint: str, response: httpx.Response):
+    wire = _wire_bytes(response)
+    decoded = len(response.content)
+
+    metrics.inc("ati_bytes_received", wire, endpoint=endpoint)
+    if decoded > wire:
+        metrics.inc("ati_bytes_saved", decoded - wire, endpoint=endpoint, reason="compression")
+
+
+async def get_json_conditional(client: httpx.AsyncClient, manager_key: str, url: str,
+                               params: dict | None = None, volatile: tuple = ()):
+    """
+    GET с If-None-Match / If-Modified-Since, если ATI раньше вернул валидаторы.
+
+    Возвращает (status, data, modified). На 304 отдаётся ранее разобранный
+    результат без повторного разбора JSON и modified=False.
+    Параметры из volatile (например, dateFrom) не входят в ключ кэша:
+    для них сработает только ETag, который сервер сверяет с актуальным ответом.
+    """
+    params = params or {}
+    stable = tuple(sorted((k, str(v)) for k, v in params.items() if k not in volatile))
+    key = (manager_key, url, stable)
+    cached = _validators.get(key)
+
+    headers = get_headers(manager_key)
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"] and not volatile:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = await client.get(url, headers=headers, params=params)
+    endpoint = endpoint_name(response.request.url.path)
+
+    if response.status_code == 304 and cached:
+        metrics.inc("ati_not_modified", endpoint=endpoint)
+        metrics.inc("ati_bytes_saved", cached["wire_bytes"], endpoint=endpoint, reason="not_modified")
+        return 200, cached["data"], False
+
+    _count_transfer(endpoint, response)
 
     if response.status_code != 200:
-        print(f"[ATI] Ошибка получения грузов: {response.status_code}")
-        return []
+        return response.status_code, None, True
 
     data = await safe_json(response)
-    if not data:
-        return []
 
-    # 👉 Получаем список всех грузов
-    loads = data if isinstance(data, list) else data.get("loads", [])
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
 
-    print(f"[{manager_key}] всего грузов: {len(loads)}")
+    if data is not None and (etag or last_modified):
+        _validators.put(key, {
+            "etag": etag,
+            "last_modified": last_modified,
+            "data": data,
+            "wire_bytes": _wire_bytes(response),
+        })
+    else:
+        _validators.discard(key)
 
-    # =============================================
-    # 🔥 ФИЛЬТР ПО contact_id (ключевой фикс)
-    # =============================================
+    return 200, data, True
 
-    manager_contact_id = MANAGERS[manager_key].get("contact_id")
 
-    if manager_contact_id is not None:
-        filtered_loads = [
-            load for load in loads
-            if str(load.get("ContactId1")) == str(manager_contact_id)
-        ]
+# =============================================
+# Получение МОИХ грузов (постранично)
+# =============================================
+
+def _filter_own_loads(loads: list, manager_contact_id) -> list:
+    if manager_contact_id is None:
+        return loads
+
+    return [
+        load for load in loads
+        if str(load.get("ContactId1")) == str(manager_contact_id)
+    ]
+
+
+class IncompleteLoadsError(Exception):
+    """
+    Список грузов оборвался после первой страницы (ошибка сети / ATI или
+    LOADS_MAX_PAGES): уже отданные страницы верны, но грузы из остальных
+    не получены — по такому списку нельзя решать, что груз снят
+    """
+
+
+async def get_my_loads(manager_key: str):
+    """
+    Асинхронный генератор: отдаёт грузы менеджера страницами по мере загрузки.
+
+    Фильтр по contact_id передаётся в ATI параметром contactId, а на случай,
+    если API его проигнорирует, повторяется локально на каждой странице —
+    в памяти одновременно держится только одна страница.
 
-        print(f"[{manager_key}] после фильтра: {len(filtered_loads)}")
+    Ошибка на первой странице — пустой список, как раньше; на следующих
+    страницах (и при упоре в LOADS_MAX_PAGES) — IncompleteLoadsError
+    после уже отданных страниц.
+    """
+    url = f"{ATI_BASE_URL}/v1.0/loads"
+
+    manager_contact_id = MANAGERS[manager_key].get("contact_id")
 
-        return filtered_loads
+    params = {"take": LOADS_PAGE_SIZE}
+    if manager_contact_id:
+        params["contactId"] = manager_contact_id
+
+    total = 0
+    own = 0
+    skip = 0
+    prev_first_id = None
+
+    async with new_client() as client:
+        for _ in range(LOADS_MAX_PAGES):
+            try:
+                status, data, _ = await get_json_conditional(
+                    client, manager_key, url, {**params, "skip": skip},
+                )
+            except httpx.RequestError as e:
+                logger.error("[ATI] Ошибка сети get_my_loads: %s", e, extra={"manager": manager_key})
+                if skip:
+                    raise IncompleteLoadsError(f"сеть, skip={skip}") from e
+                break
+
+            if status != 200:
+                logger.error(
+                    "[ATI] Ошибка получения грузов: %s", status,
+                    extra={"manager": manager_key, "status": status},
+                )
+                if skip:
+                    raise IncompleteLoadsError(f"статус {status}, skip={skip}")
+                break
+
+            if not data:
+                break
+
+            page = data if isinstance(data, list) else data.get("loads", [])
+            if not page:
+                break
+
+            # API проигнорировал skip и вернул ту же страницу повторно
+            first_id = page[0].get("Id")
+            if skip and first_id == prev_first_id:
+                break
+            prev_first_id = first_id
+
+            total += len(page)
+
+            # 🔥 ФИЛЬТР ПО contact_id (страховка, если contactId не применился)
+            own_page = _filter_own_loads(page, manager_contact_id)
+            own += len(own_page)
+
+            if own_page:
+                yield own_page
+
+            # последняя страница или API отдал весь список без постраничности
+            if len(page) != LOADS_PAGE_SIZE:
+                break
+
+            skip += len(page)
+        else:
+            logger.warning(
+                "[ATI] список грузов обрезан на %s страницах (ATI_LOADS_MAX_PAGES)", LOADS_MAX_PAGES,
+                extra={"manager": manager_key},
+            )
+            raise IncompleteLoadsError(f"LOADS_MAX_PAGES={LOADS_MAX_PAGES}")
 
-    return loads
+    logger.info("всего грузов: %s, своих: %s", total, own, extra={"manager": manager_key})
 
 
 # =============================================
@@ -175,14 +457,20 @@ async def get_load_responses(manager_key: str, load_id: str) -> list:
     url = f"{ATI_BASE_URL}/v1.0/loads/{load_id}/responses"
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        async with new_client() as client:
             response = await client.get(url, headers=get_headers(manager_key))
     except httpx.RequestError as e:
-        print(f"[ATI] Ошибка сети get_load_responses: {e}")
+        logger.error(
+            "[ATI] Ошибка сети get_load_responses: %s", e,
+            extra={"manager": manager_key, "load_id": load_id},
+        )
         return []
 
     if response.status_code != 200:
-        print(f"[ATI] get_load_responses error: {response.status_code}")
+        logger.error(
+            "[ATI] get_load_responses error: %s", response.status_code,
+            extra={"manager": manager_key, "load_id": load_id, "status": response.status_code},
+        )
         return []
 
     data = await safe_json(response)
@@ -202,7 +490,7 @@ async def renew_load(manager_key: str, load_id: str) -> dict:
     url = f"{ATI_BASE_URL}/v1.0/loads/{load_id}/renew"
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        async with new_client() as client:
             response = await client.put(url, headers=get_headers(manager_key))
     except httpx.RequestError as e:
         return {"success": False, "load_id": load_id, "reason": str(e)}
@@ -211,7 +499,12 @@ async def renew_load(manager_key: str, load_id: str) -> dict:
         return {"success": True, "load_id": load_id}
 
     if response.status_code == 429:
-        return {"success": False, "load_id": load_id, "reason": "Слишком много запросов"}
+        return {
+            "success": False,
+            "load_id": load_id,
+            "reason": "Слишком много запросов",
+            "rate_limited": True,
+        }
 
     data = await safe_json(response)
     reason = None
@@ -239,21 +532,24 @@ async def get_new_responses(manager_key: str, date_from: str) -> list:
     }
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.get(
-                url,
-                headers=get_headers(manager_key),
-                params=params
+        async with new_client() as client:
+            status, data, _ = await get_json_conditional(
+                client, manager_key, url, params, volatile=("dateFrom",),
             )
     except httpx.RequestError as e:
-        print(f"[ATI] ошибка new_responses: {e}")
+        logger.error("[ATI] ошибка new_responses: %s", e, extra={"manager": manager_key})
         return []
 
-    if response.status_code != 200:
-        print(f"[ATI] new_responses status: {response.status_code}")
+    if status != 200:
+        logger.error(
+            "[ATI] new_responses status: %s", status,
+            extra={"manager": manager_key, "status": status},
+        )
         return []
 
-    data = await safe_json(response)
+    # на 304 отдаём прошлый ответ, а не []: если прошлый запуск прервался до
+    # set_last_response_check, те же отклики нужно обработать ещё раз
+    # (уже отправленные отсекает is_known_response)
     if not data:
         return []
 
@@ -266,18 +562,71 @@ async def get_firm_rating(manager_key: str, firm_id: int, contact_id: int):
     url = f"{ATI_BASE_URL}/v1.0/firms/{firm_id}/contacts/{contact_id}/summary"
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
+        async with new_client() as client:
             response = await client.get(url, headers=get_headers(manager_key))
     except httpx.RequestError as e:
-        print(f"[ATI] rating error: {e}")
+        logger.error("[ATI] rating error: %s", e, extra={"manager": manager_key})
         return None
 
     if response.status_code != 200:
-        print(f"[ATI] rating status: {response.status_code}")
+        logger.error(
+            "[ATI] rating status: %s", response.status_code,
+            extra={"manager": manager_key, "status": response.status_code},
+        )
         return None
 
     data = await safe_json(response)
     if not data:
         return None
 
-    return data.get("score")
\ No newline at end of file
+    return data.get("score")
+
+
+# =============================================
+# Контакты фирмы (онбординг менеджеров, check_contacts.py)
+# =============================================
+
+async def get_my_contact(client: httpx.AsyncClient, manager_key: str) -> dict | None:
+    """
+    Контакт, которому принадлежит токен менеджера
+    """
+    url = f"{ATI_BASE_URL}/v1.0/firms/mycontact"
+
+    try:
+        response = await client.get(url, headers=get_headers(manager_key))
+    except httpx.RequestError as e:
+        logger.error("[ATI] Ошибка сети mycontact: %s", e, extra={"manager": manager_key})
+        return None
+
+    if response.status_code != 200:
+        logger.error(
+            "[ATI] mycontact error: %s", response.status_code,
+            extra={"manager": manager_key, "status": response.status_code},
+        )
+        return None
+
+    data = await safe_json(response)
+    return data if isinstance(data, dict) else None
+
+
+async def get_firm_contacts(client: httpx.AsyncClient, manager_key: str) -> list:
+    url = f"{ATI_BASE_URL}/v1.0/firms/contacts"
+
+    try:
+        response = await client.get(url, headers=get_headers(manager_key))
+    except httpx.RequestError as e:
+        logger.error("[ATI] Ошибка сети firms/contacts: %s", e, extra={"manager": manager_key})
+        return []
+
+    if response.status_code != 200:
+        logger.error(
+            "[ATI] firms/contacts error: %s", response.status_code,
+            extra={"manager": manager_key, "status": response.status_code},
+        )
+        return []
+
+    data = await safe_json(response)
+    if not data:
+        return []
+
+    return data if isinstance(data, list) else (data.get("contacts") or data.get("items") or [])
@@ -0,0 +1,118 @@
+# bench_conditional.py
+# Проверка условных запросов к ATI на mock-сервере: python bench_conditional.py [--polls 20]
+#
+# Mock-сервер отдаёт ETag и отвечает 304 на совпадающий If-None-Match.
+# Проверяется цепочка 200 → 304 → тот же разобранный результат, modified=False,
+# метрики ati_not_modified / ati_bytes_saved, 304 для /loads/new/responses
+# (прошлый ответ, а не []), ограничение кэша по ATI_CONDITIONAL_CACHE_SIZE.
+# В конце — сколько байт сэкономлено за --polls опросов.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+
+# до импорта ati_client: токен нужен только для проверки формата,
+# база состояния — во временной папке
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+os.environ.setdefault("ATI_ALEXANDER_ACCESS_TOKEN", "bench-token")
+
+import httpx
+
+import ati_client
+import metrics
+
+
+class MockAti:
+    """
+    Тело ответа зависит от пути и стабильных параметров; ETag — хэш тела
+    """
+
+    def __init__(self):
+        self.statuses: list = []
+        self.bodies: dict = {}
+
+    def body(self, request: httpx.Request) -> bytes:
+        if request.url.path.endswith("/responses"):
+            data = [{"ResponseId": 1, "LoadId": "load-1"}]
+        else:
+            skip = int(request.url.params.get("skip", 0))
+            data = [{"Id": f"load-{skip + i}", "ContactId1": 0} for i in range(3)]
+        return json.dumps(data).encode()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = self.body(request)
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+
+        if request.headers.get("If-None-Match") == etag:
+            self.statuses.append(304)
+            return httpx.Response(304, headers={"ETag": etag})
+
+        self.statuses.append(200)
+        return httpx.Response(200, content=body, headers={"ETag": etag, "Content-Type": "application/json"})
+
+
+def check(condition: bool, message: str):
+    print(("  ✅ " if condition else "  ❌ ") + message)
+    if not condition:
+        raise SystemExit(1)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=20)
+    args = parser.parse_args()
+
+    server = MockAti()
+    ati_client.set_transport(httpx.MockTransport(server))
+    url = f"{ati_client.ATI_BASE_URL}/v1.0/loads"
+    endpoint = "/v1.0/loads"
+
+    print("200 → 304:")
+    async with ati_client.new_client() as client:
+        status1, data1, modified1 = await ati_client.get_json_conditional(
+            client, "alexander", url, {"skip": 0},
+        )
+        status2, data2, modified2 = await ati_client.get_json_conditional(
+            client, "alexander", url, {"skip": 0},
+        )
+
+    check(server.statuses == [200, 304], f"статусы сервера {server.statuses}")
+    check(status1 == status2 == 200, "оба вызова отдают 200")
+    check(modified1 and not modified2, "modified: True, затем False")
+    check(data2 is data1, "на 304 — тот же разобранный результат, без повторного разбора")
+    check(metrics.get_counter("ati_not_modified", endpoint=endpoint) == 1, "ati_not_modified = 1")
+    saved = metrics.get_counter("ati_bytes_saved", endpoint=endpoint, reason="not_modified")
+    check(saved > 0, f"ati_bytes_saved(not_modified) = {saved:g}")
+
+    print("/loads/new/responses:")
+    first = await ati_client.get_new_responses("alexander", "2026-01-01T00:00:00Z")
+    # тот же dateFrom — как после прерванного запуска, не дошедшего до set_last_response_check
+    again = await ati_client.get_new_responses("alexander", "2026-01-01T00:00:00Z")
+    check(server.statuses[-2:] == [200, 304], "второй запрос — 304")
+    check(again == first and again, "на 304 отдаётся прошлый ответ, а не []")
+
+    print("Кэш ответов:")
+    size = ati_client._validators.maxsize
+    async with ati_client.new_client() as client:
+        for skip in range(size * 2):
+            await ati_client.get_json_conditional(client, "alexander", url, {"skip": skip * 100})
+    check(len(ati_client._validators) == size, f"не больше {size} страниц в кэше")
+
+    print(f"\n{args.polls} опросов одной страницы:")
+    before = metrics.get_counter("ati_bytes_saved", endpoint=endpoint, reason="not_modified")
+    received_before = metrics.get_counter("ati_bytes_received", endpoint=endpoint)
+    async with ati_client.new_client() as client:
+        for _ in range(args.polls):
+            await ati_client.get_json_conditional(client, "alexander", url, {"skip": 0})
+
+    saved = metrics.get_counter("ati_bytes_saved", endpoint=endpoint, reason="not_modified") - before
+    received = metrics.get_counter("ati_bytes_received", endpoint=endpoint) - received_before
+    print(f"  получено: {received:g} Б, сэкономлено: {saved:g} Б")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
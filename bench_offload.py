@@ -0,0 +1,131 @@
+# bench_offload.py
+# Бенчмарк задержки цикла событий: python bench_offload.py [--loads 20000] [--responses 3000]
+#
+# Пока идёт разбор большого ответа ATI, parse_load и отрисовка откликов,
+# отдельная корутина каждую 1 мс меряет, насколько поздно она просыпается.
+# Сравниваются два режима: всё в цикле событий и вынос в пул потоков (offload.py).
+# На ответах в десятки МБ остаточная задержка — полный проход сборщика
+# мусора (gc), который держит GIL в любом потоке.
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+
+# до импорта telegram_bot: токен нужен только для проверки формата,
+# база состояния — во временной папке
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+
+import httpx
+
+import ati_client
+import telegram_bot
+from bench_render import make_responses
+
+_OFF = 10 ** 12
+
+
+def make_loads_payload(count: int, seed: int = 1) -> bytes:
+    rnd = random.Random(seed)
+    loads = []
+
+    for i in range(count):
+        loads.append({
+            "Id": f"load-{i}",
+            "LoadNumber": f"N{i}",
+            "Loading": {
+                "CityId": rnd.randint(1, 5000),
+                "LoadingCargos": [{"Weight": rnd.randint(1, 25), "Name": "Стройматериалы"}],
+            },
+            "Unloading": {"CityId": rnd.randint(1, 5000)},
+            "Cargo": {"Weight": rnd.randint(1, 25), "CargoTypeName": "Тент"},
+            "CanBeRenewed": rnd.random() < 0.5,
+            "RenewRestriction": "",
+            "ContactId1": 1,
+            "OfferCount": rnd.randint(0, 30),
+            "Note": "Погрузка с 9 до 18, документы на месте " * 3,
+        })
+
+    return json.dumps(loads, ensure_ascii=False).encode()
+
+
+async def measure(work) -> tuple[float, float, float]:
+    """
+    (время работы, p99 задержки цикла, максимум задержки) в секундах
+    """
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    # сборка мусора от прошлого прогона не должна попасть в замер
+    gc.collect()
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+
+    done = True
+    await task
+
+    lags.sort()
+    return elapsed, lags[int(len(lags) * 0.99)], lags[-1]
+
+
+async def scenario(payload: bytes, responses: list):
+    # новый Response на каждый прогон, как от настоящего запроса
+    response = httpx.Response(200, content=payload, headers={"Content-Type": "application/json"})
+
+    data = await ati_client.safe_json(response)
+    await ati_client.parse_loads(data)
+
+    telegram_bot._render_cache.clear()
+    await telegram_bot.render_responses_lines(responses, "📋 Все отклики:")
+
+
+def set_thresholds(json_bytes: int, items: int):
+    ati_client.OFFLOAD_JSON_BYTES = json_bytes
+    ati_client.OFFLOAD_LOADS_MIN_ITEMS = items
+    telegram_bot.OFFLOAD_MIN_ITEMS = items
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loads", type=int, default=20000)
+    parser.add_argument("--responses", type=int, default=3000)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    payload = make_loads_payload(args.loads)
+    responses = make_responses(args.responses)
+
+    print(f"Грузов: {args.loads} ({len(payload) / 1e6:.1f} МБ), откликов: {args.responses}")
+
+    for title, thresholds in (("в цикле событий", (_OFF, _OFF)), ("в пуле потоков", (0, 0))):
+        set_thresholds(*thresholds)
+
+        results = [await measure(lambda: scenario(payload, responses)) for _ in range(args.runs)]
+        elapsed = min(r[0] for r in results)
+        p99 = min(r[1] for r in results)
+        worst = min(r[2] for r in results)
+
+        print(
+            f"  {title:16} работа: {elapsed * 1000:7.1f} мс, "
+            f"lag p99: {p99 * 1000:6.1f} мс, макс: {worst * 1000:6.1f} мс"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
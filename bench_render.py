@@ -0,0 +1,93 @@
+# bench_render.py
+# Бенчмарк отрисовки откликов: python bench_render.py [--responses 1000] [--views 20]
+#
+# Сравнивает холодную отрисовку (пустой кэш) и повторные просмотры
+# того же груза (кэш строк откликов).
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+# до импорта telegram_bot: токен нужен только для проверки формата,
+# база состояния — во временной папке
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+
+import telegram_bot
+from telegram_bot import build_responses_lines
+
+
+def make_responses(count: int, seed: int = 1) -> list:
+    """
+    Синтетические отклики со всеми вариантами цены, которые разбирает format_price
+    """
+    rnd = random.Random(seed)
+    price_variants = [
+        lambda p: {"NdsPrice": p},
+        lambda p: {"NotNdsPrice": p},
+        lambda p: {"Price": p, "PayAttributes": 8},
+        lambda p: {"Price": p, "PayAttributes": 0},
+        lambda p: {"Price": str(p)},
+        lambda p: {"Price": "договорная"},
+        lambda p: {},
+    ]
+
+    responses = []
+    for i in range(count):
+        price = rnd.randint(10, 300) * 1000
+        r = {
+            "ResponseId": f"resp-{i}",
+            "LoadId": "load-1",
+            "IsOutdated": rnd.random() < 0.05,
+            "FirmName": f"ООО Перевозчик {i}",
+            "FirmInfo": {
+                "FullFirmName": f"ООО «Перевозчик {i}»",
+                "TotalScore": rnd.uniform(-5, 50),
+                "Contact": {
+                    "Name": f"Иван {i}",
+                    "Mobile": f"8 (9{rnd.randint(10, 99)}) {rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(10, 99)}",
+                },
+            },
+            "Note": rnd.choice(["", "Готов завтра", "Тент 20т, без НДС", None]),
+        }
+        r.update(rnd.choice(price_variants)(price))
+        responses.append(r)
+
+    return responses
+
+
+def bench(responses: list, views: int) -> tuple[float, float]:
+    telegram_bot._render_cache.clear()
+
+    started = time.perf_counter()
+    build_responses_lines(responses, "📋 Все отклики:")
+    cold = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(views):
+        build_responses_lines(responses, "📋 Все отклики:")
+    warm = (time.perf_counter() - started) / views
+
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--responses", type=int, default=1000)
+    parser.add_argument("--views", type=int, default=20)
+    args = parser.parse_args()
+
+    responses = make_responses(args.responses)
+    cold, warm = bench(responses, args.views)
+
+    n = len(responses)
+    print(f"Откликов: {n}, повторных просмотров: {args.views}")
+    print(f"  без кэша: {cold * 1000:8.2f} мс  ({n / cold:10.0f} откликов/с)")
+    print(f"  из кэша:  {warm * 1000:8.2f} мс  ({n / warm:10.0f} откликов/с)")
+    print(f"  ускорение: x{cold / warm:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bench_trace_summary.py
+# Проверка trace_summary.py на маленьком JSONL с известным ответом:
+#   python bench_trace_summary.py
+#
+# 20 апдейтов обработчика show_responses длительностью 1..20 мс и 4 апдейта
+# loads_handler по 100 мс: p50 / p95 / max по методу ближайшего ранга,
+# средние части (ATI / отрисовка / Telegram), фильтр --hours и спаны без корня.
+
+import json
+import os
+import tempfile
+
+import trace_summary
+
+_MS = 1_000_000
+
+
+def _span(trace_id: str, span_id: str, parent: str, name: str, start_ms: float, duration_ms: float) -> dict:
+    return {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "parentSpanId": parent,
+        "name": name,
+        # целые наносекунды: base_ms * 1e6 уже не помещается в точность float
+        "startTimeUnixNano": round(start_ms * 1000) * 1000,
+        "endTimeUnixNano": round((start_ms + duration_ms) * 1000) * 1000,
+        "attributes": {},
+    }
+
+
+def sample_spans(base_ms: float) -> list:
+    spans = []
+
+    for i in range(1, 21):
+        trace_id = f"s{i}"
+        start = base_ms + i * 1000
+        spans.append(_span(trace_id, "root", "", "show_responses", start, i))
+        # ATI — половина обработчика, отрисовка — 0.25 мс, Bot API — 0.1 мс
+        spans.append(_span(trace_id, "a", "root", "ati.GET /v1.0/loads/{id}/responses", start, i / 2))
+        spans.append(_span(trace_id, "r", "root", "render", start + i / 2, 0.25))
+        spans.append(_span(trace_id, "t", "root", "tg.SendMessage", start + i / 2 + 0.25, 0.1))
+
+    for i in range(4):
+        spans.append(_span(f"l{i}", "root", "", "loads_handler", base_ms + 30000 + i * 1000, 100))
+
+    # дочерний спан без корня (трасса оборвалась) — не учитывается
+    spans.append(_span("orphan", "x", "root", "ati.GET /v1.0/loads", base_ms, 5000))
+
+    # трасса старше окна --hours
+    spans.append(_span("old", "root", "", "show_responses", base_ms - 10 * 3600 * 1000, 9999))
+
+    return spans
+
+
+def check(condition: bool, message: str):
+    print(("  ✅ " if condition else "  ❌ ") + message)
+    if not condition:
+        raise SystemExit(1)
+
+
+def close(a: float, b: float) -> bool:
+    return abs(a - b) < 1e-6
+
+
+def main():
+    base_ms = 1_700_000_000_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traces.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for s in sample_spans(base_ms):
+                f.write(json.dumps(s) + "\n")
+            f.write("не json\n")
+
+        since_ns = int((base_ms - 3600 * 1000) * _MS)
+        rows = {row["handler"]: row for row in trace_summary.summarize(trace_summary.read_traces(path, since_ns))}
+        rows_all = {row["handler"]: row for row in trace_summary.summarize(trace_summary.read_traces(path))}
+
+    print("Перцентили:")
+    show = rows["show_responses"]
+    check(show["count"] == 20, f"show_responses: n = {show['count']}")
+    check(close(show["p50"], 10), f"p50 = {show['p50']:g} (ожидается 10)")
+    check(close(show["p95"], 19), f"p95 = {show['p95']:g} (ожидается 19)")
+    check(close(show["max"], 20), f"max = {show['max']:g}")
+
+    loads = rows["loads_handler"]
+    check(close(loads["p95"], 100) and loads["count"] == 4, "loads_handler: n = 4, p95 = 100")
+    check(list(rows) == ["loads_handler", "show_responses"], "сортировка по p95")
+
+    print("Части:")
+    check(close(show["parts"]["ATI"], 5.25), f"ATI в среднем {show['parts']['ATI']:g} мс")
+    check(close(show["parts"]["отрисовка"], 0.25), f"отрисовка {show['parts']['отрисовка']:g} мс")
+    check(close(show["parts"]["Telegram"], 0.1), f"Telegram {show['parts']['Telegram']:g} мс")
+    check(not loads["parts"], "у loads_handler частей нет, спан без корня не учтён")
+
+    print("Фильтр по времени:")
+    check(rows_all["show_responses"]["count"] == 21, "без --hours старая трасса учитывается")
+    check(close(rows_all["show_responses"]["max"], 9999), "и попадает в max")
+
+    print("Крайние случаи _percentile:")
+    check(trace_summary._percentile([7.0], 0.95) == 7.0, "один замер")
+    check(trace_summary._percentile(list(range(1, 101)), 0.95) == 95, "1..100: p95 = 95")
+    check(trace_summary._percentile([3, 1, 2], 0.5) == 2, "несортированный вход")
+
+
+if __name__ == "__main__":
+    main()
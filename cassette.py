@@ -0,0 +1,135 @@
+# =============================================
+# cassette.py
+# Запись трафика ATI и Telegram в компактные кассеты
+# (gzip JSON lines) с вычищенными токенами и телефонами
+# =============================================
+
+import gzip
+import json
+import logging
+import re
+import time
+
+import httpx
+
+logger = logging.getLogger("cassette")
+
+# Ключи, значения которых никогда не попадают в кассету
+_SECRET_KEYS = {"access_token", "refresh_token", "token", "authorization"}
+# Ключи с телефонами (ATI: Mobile / Telephone, Telegram: phone_number)
+_PHONE_KEYS = {"mobile", "telephone", "phone", "phone_number", "fax"}
+# Текстовые поля, в которых телефон может встретиться внутри строки
+_TEXT_KEYS = {"note", "comment", "text", "caption", "description"}
+_PHONE_RE = re.compile(r"\+?\d[\d\s\-()]{8,}\d")
+# Токен бота Telegram внутри URL / текста
+_BOT_TOKEN_RE = re.compile(r"\d{5,}:[A-Za-z0-9_-]{30,}")
+
+# Заголовки ответа ATI, которые нужны при воспроизведении
+_KEEP_HEADERS = ("content-type", "etag", "last-modified")
+
+
+def _mask_phone(value: str) -> str:
+    # сохраняем форму (длину и разделители), чтобы format_phone работал так же
+    return re.sub(r"\d", "0", value)
+
+
+def _mask_phone_in_text(match: re.Match) -> str:
+    text = match.group()
+    # даты и короткие номера не трогаем
+    if sum(c.isdigit() for c in text) < 10:
+        return text
+    return _mask_phone(text)
+
+
+def scrub(value, key: str = ""):
+    """
+    Рекурсивно вычищает секреты и телефоны из JSON-совместимого значения
+    """
+    lower = key.lower()
+
+    if isinstance(value, dict):
+        return {k: scrub(v, k) for k, v in value.items()}
+
+    if isinstance(value, list):
+        return [scrub(v, key) for v in value]
+
+    if isinstance(value, str):
+        if lower in _SECRET_KEYS:
+            return "***"
+        if lower in _PHONE_KEYS:
+            return _mask_phone(value)
+        value = _BOT_TOKEN_RE.sub("***", value)
+        if lower in _TEXT_KEYS:
+            value = _PHONE_RE.sub(_mask_phone_in_text, value)
+        return value
+
+    return value
+
+
+class CassetteRecorder:
+    """
+    Пишет события в кассету: ответы ATI (хук httpx) и апдейты Telegram
+    (outer-middleware диспетчера). Время — секунды от начала записи.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._started = time.monotonic()
+
+    def _write(self, entry: dict):
+        entry["t"] = round(time.monotonic() - self._started, 3)
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+        self._file.write("\n")
+
+    async def on_ati_response(self, response: httpx.Response):
+        await response.aread()
+
+        try:
+            body = scrub(response.json())
+        except Exception:
+            body = scrub(response.text)
+
+        request = response.request
+        params = scrub(dict(request.url.params))
+
+        self._write({
+            "kind": "ati",
+            "method": request.method,
+            "path": request.url.path,
+            "params": params,
+            "status": response.status_code,
+            "headers": {
+                k: v for k, v in response.headers.items() if k.lower() in _KEEP_HEADERS
+            },
+            "body": body,
+        })
+
+    async def telegram_middleware(self, handler, event, data):
+        self._write({
+            "kind": "tg",
+            "update": scrub(event.model_dump(mode="json", exclude_none=True, by_alias=True)),
+        })
+        return await handler(event, data)
+
+    def close(self):
+        self._file.close()
+
+
+def install_recorder(path: str, dp) -> CassetteRecorder:
+    """
+    Включает запись: хук на все запросы ati_client и middleware на апдейты dp
+    """
+    import ati_client
+
+    recorder = CassetteRecorder(path)
+    ati_client.add_response_hook(recorder.on_ati_response)
+    dp.update.outer_middleware(recorder.telegram_middleware)
+
+    logger.info("[Cassette] запись трафика в %s", path)
+    return recorder
+
+
+def load_cassette(path: str) -> list:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
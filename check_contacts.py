@@ -1,37 +1,236 @@
 # check_contacts.py
-# python check_contacts.py
+# Онбординг менеджеров: определяет contact_id каждого менеджера по его токену
+#
+#   python check_contacts.py                 # показать, что найдено
+#   python check_contacts.py --write         # записать contact_id в реестр менеджеров
+#   python check_contacts.py --only igor,olga --refresh
+#
+# Все менеджеры опрашиваются параллельно через один HTTP-клиент (пул соединений).
+# /firms/mycontact — на каждого менеджера, /firms/contacts — один раз на фирму;
+# ответы кэшируются в CONTACTS_CACHE_PATH на CONTACTS_CACHE_HOURS.
 
-import httpx
+import argparse
 import asyncio
+import hashlib
 import json
-from config import MANAGERS
+import os
+import time
 
-async def main():
-    async with httpx.AsyncClient() as client:
-        for key, mgr in MANAGERS.items():
-            token = mgr.get("access_token", "")
-            if "ВАШ_ACCESS_TOKEN" in token:
-                print(f"[{key}] Пропускаю — нет токена")
-                continue
-
-            # Получаем контакты фирмы
-            r = await client.get(
-                "https://api.ati.su/v1.0/firms/contacts",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            print(f"\n[{key}] contacts: {r.status_code}")
+import ati_client
+from config import MANAGERS, CONTACTS_CACHE_PATH, CONTACTS_CACHE_HOURS
+
+_PLACEHOLDERS = ("ВАШ_ACCESS_TOKEN", "your_")
+
+
+def has_token(record: dict) -> bool:
+    token = record.get("access_token") or ""
+    return bool(token) and not any(p in token for p in _PLACEHOLDERS)
+
+
+def _token_key(token: str) -> str:
+    # в кэше — только отпечаток токена, не сам токен
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def _contact_id(contact: dict | None) -> int:
+    contact = contact or {}
+    return int(contact.get("ContactId") or contact.get("Id") or contact.get("id") or 0)
+
+
+def _firm_id(contact: dict | None) -> str:
+    contact = contact or {}
+    return str(contact.get("FirmId") or contact.get("AtiId") or contact.get("firm_id") or "")
+
+
+# =============================================
+# Кэш ответов
+# =============================================
+
+class ContactsCache:
+    """
+    {"mycontact": {отпечаток токена: {"at", "data"}}, "firms": {firm_id: {"at", "data"}}}
+    """
+
+    def __init__(self, path: str, ttl: float, refresh: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.data = {"mycontact": {}, "firms": {}}
+
+        if not refresh and os.path.exists(path):
             try:
-                data = r.json()
-                print(json.dumps(data, ensure_ascii=False, indent=2))
-            except:
-                print(r.text[:1000])
-
-            # Также смотрим кто я (текущий контакт)
-            r2 = await client.get(
-                "https://api.ati.su/v1.0/firms/mycontact",
-                headers={"Authorization": f"Bearer {token}"}
-            )
-            print(f"\n[{key}] mycontact: {r2.status_code}")
-            print(r2.text[:500])
-
-asyncio.run(main())
\ No newline at end of file
+                with open(path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ кэш {path} не прочитан: {e}")
+
+    def get(self, section: str, key: str):
+        entry = self.data[section].get(key)
+        if entry and time.time() - entry["at"] < self.ttl:
+            return entry["data"]
+        return None
+
+    def put(self, section: str, key: str, value):
+        self.data[section][key] = {"at": time.time(), "data": value}
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# =============================================
+# Опрос ATI
+# =============================================
+
+async def resolve_all(keys: list, cache: ContactsCache, concurrency: int) -> dict:
+    """
+    manager_key -> {"contact_id", "source", "firm_id", "firm_contacts", "raw"}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with ati_client.new_client() as client:
+
+        async def my_contact(key: str):
+            token_key = _token_key(MANAGERS[key]["access_token"])
+            cached = cache.get("mycontact", token_key)
+            if cached is not None:
+                return cached
+
+            async with semaphore:
+                contact = await ati_client.get_my_contact(client, key)
+            if contact:
+                cache.put("mycontact", token_key, contact)
+            return contact
+
+        contacts = dict(zip(keys, await asyncio.gather(*(my_contact(k) for k in keys))))
+
+        # список контактов фирмы — один запрос на фирму, токеном любого её менеджера
+        firm_owner: dict[str, str] = {}
+        for key, contact in contacts.items():
+            firm_owner.setdefault(_firm_id(contact) or f"?{key}", key)
+
+        async def firm_contacts(firm_id: str, key: str):
+            cached = cache.get("firms", firm_id) if not firm_id.startswith("?") else None
+            if cached is not None:
+                return cached
+
+            async with semaphore:
+                items = await ati_client.get_firm_contacts(client, key)
+            if items and not firm_id.startswith("?"):
+                cache.put("firms", firm_id, items)
+            return items
+
+        firms = dict(zip(
+            firm_owner,
+            await asyncio.gather(*(firm_contacts(f, k) for f, k in firm_owner.items())),
+        ))
+
+    results = {}
+    for key, contact in contacts.items():
+        firm_id = _firm_id(contact) or f"?{key}"
+        items = firms.get(firm_id) or []
+
+        contact_id = _contact_id(contact)
+        source = "mycontact" if contact_id else ""
+
+        # mycontact не ответил — ищем менеджера по имени среди контактов фирмы
+        if not contact_id:
+            name = (MANAGERS[key].get("name") or "").strip().lower()
+            same_name = [c for c in items if (c.get("Name") or "").strip().lower() == name]
+            if name and len(same_name) == 1:
+                contact_id = _contact_id(same_name[0])
+                source = "по имени"
+
+        results[key] = {
+            "contact_id": contact_id,
+            "source": source,
+            "firm_id": firm_id if not firm_id.startswith("?") else "",
+            "firm_contacts": len(items),
+            "raw": {"mycontact": contact, "contacts": items},
+        }
+
+    return results
+
+
+def write_results(results: dict) -> list:
+    """
+    Записывает найденные contact_id в реестр менеджеров; возвращает изменённые ключи
+    """
+    changed = [
+        key for key, res in results.items()
+        if res["contact_id"] and res["contact_id"] != MANAGERS[key].get("contact_id")
+    ]
+
+    # файл реестра перезаписывается один раз — на последнем изменении
+    for key in changed:
+        MANAGERS.upsert(
+            {**MANAGERS[key], "contact_id": results[key]["contact_id"]},
+            persist=key == changed[-1],
+        )
+
+    return changed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="contact_id менеджеров по их токенам ATI")
+    parser.add_argument("--only", help="ключи менеджеров через запятую")
+    parser.add_argument("--write", action="store_true", help="записать contact_id в реестр менеджеров")
+    parser.add_argument("--refresh", action="store_true", help="не использовать кэш ответов")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--raw", action="store_true", help="показать ответы ATI целиком")
+    args = parser.parse_args()
+
+    keys = [k for k in MANAGERS if has_token(MANAGERS[k])]
+    if args.only:
+        wanted = {k.strip() for k in args.only.split(",")}
+        keys = [k for k in keys if k in wanted]
+
+    skipped = [k for k in MANAGERS if not has_token(MANAGERS[k])]
+    for key in skipped:
+        print(f"[{key}] Пропускаю — нет токена")
+
+    if not keys:
+        return
+
+    cache = ContactsCache(CONTACTS_CACHE_PATH, CONTACTS_CACHE_HOURS * 3600, refresh=args.refresh)
+
+    started = time.monotonic()
+    results = await resolve_all(keys, cache, args.concurrency)
+    cache.save()
+
+    print(f"\nМенеджеров: {len(keys)}, за {time.monotonic() - started:.1f} с\n")
+    for key in keys:
+        res = results[key]
+        old = MANAGERS[key].get("contact_id") or "—"
+        new = res["contact_id"] or "не найден"
+        source = f" ({res['source']})" if res["source"] else ""
+        print(
+            f"[{key}] contact_id: {old} → {new}{source}, "
+            f"фирма: {res['firm_id'] or '—'}, контактов в фирме: {res['firm_contacts']}"
+        )
+        if args.raw:
+            print(json.dumps(res["raw"], ensure_ascii=False, indent=2))
+
+    if not args.write:
+        print("\nЗапустите с --write, чтобы сохранить contact_id")
+        return
+
+    changed = write_results(results)
+    if not changed:
+        print("\nНечего менять")
+    elif MANAGERS.path:
+        print(f"\n✅ {MANAGERS.path}: обновлено {len(changed)}")
+    else:
+        # реестр из переменных окружения — файл писать некуда
+        print("\nMANAGERS_FILE не задан или не найден, добавьте в .env:")
+        for key in changed:
+            print(f"ATI_{key.upper()}_CONTACT_ID={results[key]['contact_id']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,6 @@
 # config.py
 import os
+import logging
 from dotenv import load_dotenv
 
 # Загружаем .env из корня проекта
@@ -11,19 +12,17 @@ load_dotenv()
 
 CLIENT_ID = os.getenv("ATI_CLIENT_ID", "")
 
-MANAGERS = {
-    "alexander": {
-        "name": "Александр",
-        "access_token": os.getenv("ATI_ALEXANDER_ACCESS_TOKEN", ""),
-        # contact_id лучше хранить как int, но безопаснее читать как str и приводить
-        "contact_id": int(os.getenv("ATI_ALEXANDER_CONTACT_ID", "0") or 0),
-    },
-    "igor": {
-        "name": "Игорь",
-        "access_token": os.getenv("ATI_IGOR_ACCESS_TOKEN", ""),
-        "contact_id": int(os.getenv("ATI_IGOR_CONTACT_ID", "0") or 0),
-    },
-}
+# Размер страницы при выгрузке грузов и ограничение на число страниц
+LOADS_PAGE_SIZE = int(os.getenv("ATI_LOADS_PAGE_SIZE", "100"))
+LOADS_MAX_PAGES = int(os.getenv("ATI_LOADS_MAX_PAGES", "200"))
+# Сколько последних ответов с ETag / Last-Modified держать для ответа на 304
+CONDITIONAL_CACHE_SIZE = int(os.getenv("ATI_CONDITIONAL_CACHE_SIZE", "64"))
+
+# Реестр менеджеров (managers.py): JSON / YAML / SQLite-файл.
+# Если файл не задан или не найден — два менеджера из переменных окружения, как раньше
+MANAGERS_FILE = os.getenv("MANAGERS_FILE", "")
+# Как часто проверять файл реестра на изменения (секунды)
+MANAGERS_RELOAD_SECONDS = int(os.getenv("MANAGERS_RELOAD_SECONDS", "30"))
 
 # =============================================
 # Telegram
@@ -31,20 +30,152 @@ MANAGERS = {
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
-TELEGRAM_CHAT_IDS = {
-    "alexander": int(os.getenv("TELEGRAM_CHAT_ID_ALEXANDER", "0") or 0),
-    "igor": int(os.getenv("TELEGRAM_CHAT_ID_IGOR", "0") or 0),
-}
-# AUTH (используем те же chat_id как user_id)
-USERS = {
-    v: k for k, v in TELEGRAM_CHAT_IDS.items()
-}
+# =============================================
+# Менеджеры
+# =============================================
+
+from managers import ManagerRegistry  # noqa: E402
+
+
+def _env_managers() -> list:
+    return [
+        {
+            "key": "alexander",
+            "name": "Александр",
+            "access_token": os.getenv("ATI_ALEXANDER_ACCESS_TOKEN", ""),
+            "contact_id": os.getenv("ATI_ALEXANDER_CONTACT_ID", "0"),
+            "chat_id": os.getenv("TELEGRAM_CHAT_ID_ALEXANDER", "0"),
+        },
+        {
+            "key": "igor",
+            "name": "Игорь",
+            "access_token": os.getenv("ATI_IGOR_ACCESS_TOKEN", ""),
+            "contact_id": os.getenv("ATI_IGOR_CONTACT_ID", "0"),
+            "chat_id": os.getenv("TELEGRAM_CHAT_ID_IGOR", "0"),
+        },
+    ]
+
+
+if MANAGERS_FILE and os.path.exists(MANAGERS_FILE):
+    # файл читается при первом обращении к реестру, не при импорте config
+    MANAGERS = ManagerRegistry.from_file(MANAGERS_FILE, lazy=True)
+else:
+    if MANAGERS_FILE:
+        logging.getLogger("config").warning(
+            "⚠️ MANAGERS_FILE=%s не найден — менеджеры из переменных окружения", MANAGERS_FILE
+        )
+    # без path: нечего перечитывать, и пустой источник не «удалит» менеджеров
+    MANAGERS = ManagerRegistry(_env_managers())
+
+# Живые представления реестра: manager_key -> chat_id и user_id -> manager_key
+TELEGRAM_CHAT_IDS = MANAGERS.chat_ids
+# AUTH (по умолчанию user_id = chat_id менеджера)
+USERS = MANAGERS.users
+
+# Подписки на отклики (subscriptions.py): групповые чаты, руководители,
+# подменяющие менеджеры со своими фильтрами. Пусто — только чат менеджера
+SUBSCRIPTIONS_FILE = os.getenv("SUBSCRIPTIONS_FILE", "")
+SUBSCRIPTIONS_RELOAD_SECONDS = int(os.getenv("SUBSCRIPTIONS_RELOAD_SECONDS", "30"))
+# Сколько уведомлений отправлять в секунду при рассылке по подпискам
+FANOUT_PER_SECOND = int(os.getenv("FANOUT_PER_SECOND", "25"))
 
 # =============================================
 # Настройки планировщика
 # =============================================
 
 UPDATE_INTERVAL_MINUTES = int(os.getenv("UPDATE_INTERVAL_MINUTES", "60"))
+# Сколько грузов обновлять за один запуск автообновления (0 — все).
+# Порядок — renewal.py: закреплённые, с меньшим числом откликов, давно не обновлявшиеся
+RENEW_BUDGET_PER_RUN = int(os.getenv("RENEW_BUDGET_PER_RUN", "0"))
 RESPONSES_CHECK_MINUTES = int(os.getenv("RESPONSES_CHECK_MINUTES", "5"))
+# Как часто сравнивать снимки грузов (лента изменений по OfferCount)
+LOAD_FEED_SECONDS = int(os.getenv("LOAD_FEED_SECONDS", "60"))
+# Проверка новых откликов (секунды)
+RESPONSES_CHECK_SECONDS = int(os.getenv("RESPONSES_CHECK_SECONDS", "10"))
+
+# Жёсткие дедлайны задач (секунды) — зависшая задача отменяется
+UPDATE_JOB_DEADLINE_SECONDS = int(os.getenv("UPDATE_JOB_DEADLINE_SECONDS", "900"))
+RESPONSES_JOB_DEADLINE_SECONDS = int(os.getenv("RESPONSES_JOB_DEADLINE_SECONDS", "30"))
+FEED_JOB_DEADLINE_SECONDS = int(os.getenv("FEED_JOB_DEADLINE_SECONDS", "120"))
+
+# Сколько отрисованных откликов держать в кэше
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "5000"))
+
+# Упреждающая загрузка откликов после уведомления
+PREFETCH_TTL_SECONDS = int(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", "2"))
+PREFETCH_PER_MINUTE = int(os.getenv("PREFETCH_PER_MINUTE", "20"))
+PREFETCH_CACHE_SIZE = int(os.getenv("PREFETCH_CACHE_SIZE", "200"))
+
+# =============================================
+# Хранилище состояния (FSM и сессии)
+# =============================================
 
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "data/bot_state.sqlite3")
+# Неактивные сессии удаляются через столько часов
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", "720"))
+# Как часто сбрасывать изменения из памяти в базу
+STORAGE_FLUSH_SECONDS = float(os.getenv("STORAGE_FLUSH_SECONDS", "1"))
+# Как часто перечитывать из базы FSM и сессии, изменённые другими процессами
+STORAGE_REFRESH_SECONDS = float(os.getenv("STORAGE_REFRESH_SECONDS", "5"))
 
+# =============================================
+# Локальное зеркало грузов и откликов (поиск / история)
+# =============================================
+
+MIRROR_DB_PATH = os.getenv("MIRROR_DB_PATH", "data/mirror.sqlite3")
+MIRROR_FLUSH_SECONDS = int(os.getenv("MIRROR_FLUSH_SECONDS", "5"))
+MIRROR_BATCH_SIZE = int(os.getenv("MIRROR_BATCH_SIZE", "500"))
+
+# Статистика цен (analytics.py): последние N откликов на маршрут
+# и сколько ResponseId помнить, чтобы не учитывать отклик дважды
+ANALYTICS_ROUTE_WINDOW = int(os.getenv("ANALYTICS_ROUTE_WINDOW", "1000"))
+ANALYTICS_SEEN_SIZE = int(os.getenv("ANALYTICS_SEEN_SIZE", "100000"))
+
+# =============================================
+# Логирование
+# =============================================
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# JSON-строки (1) или обычный текст (0)
+LOG_JSON = os.getenv("LOG_JSON", "1") == "1"
+# Не больше N одинаковых сообщений в минуту (0 — без ограничения)
+LOG_SAMPLE_PER_MINUTE = int(os.getenv("LOG_SAMPLE_PER_MINUTE", "30"))
+
+# =============================================
+# Отладка
+# =============================================
+
+# Путь к кассете для записи трафика ATI/Telegram (пусто — запись выключена)
+CASSETTE_RECORD_PATH = os.getenv("CASSETTE_RECORD_PATH", "")
+
+# Трассировка апдейтов (tracing.py): JSONL со спанами обработчиков, запросов
+# к ATI, отрисовки и отправки (пусто — выключено); доля трассируемых апдейтов
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+
+# Вынос тяжёлой работы из цикла событий (offload.py): ответы ATI больше
+# OFFLOAD_JSON_BYTES разбираются в пуле потоков, как и отрисовка откликов,
+# если их не меньше OFFLOAD_MIN_ITEMS. Грузы приходят страницами по
+# LOADS_PAGE_SIZE — для их разбора свой порог, по умолчанию целая страница
+OFFLOAD_JSON_BYTES = int(os.getenv("OFFLOAD_JSON_BYTES", "262144"))
+OFFLOAD_MIN_ITEMS = int(os.getenv("OFFLOAD_MIN_ITEMS", "300"))
+OFFLOAD_LOADS_MIN_ITEMS = int(os.getenv("OFFLOAD_LOADS_MIN_ITEMS", str(LOADS_PAGE_SIZE)))
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", "1"))
+
+# Кэш ответов /firms/mycontact и /firms/contacts для check_contacts.py
+# (ключи — отпечаток токена и id фирмы, сами токены не сохраняются)
+CONTACTS_CACHE_PATH = os.getenv("CONTACTS_CACHE_PATH", "data/contacts_cache.json")
+CONTACTS_CACHE_HOURS = float(os.getenv("CONTACTS_CACHE_HOURS", "24"))
+
+# Мониторинг цикла событий (loop_monitor.py): шаг замера задержки,
+# порог зависания и сэмплирование стека во время зависаний
+LOOP_MONITOR_INTERVAL_MS = int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+LOOP_LAG_THRESHOLD_MS = int(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_PROFILE = os.getenv("LOOP_PROFILE", "1") == "1"
+LOOP_SAMPLE_MS = int(os.getenv("LOOP_SAMPLE_MS", "5"))
+
+# Telegram user_id администраторов (через запятую) — им доступна /debug
+ADMIN_USER_IDS = {
+    int(v) for v in os.getenv("ADMIN_USER_IDS", "").replace(" ", "").split(",") if v
+}
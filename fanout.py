@@ -0,0 +1,67 @@
+# =============================================
+# fanout.py
+# Рассылка одного уведомления во много чатов: параллельно,
+# пачками в пределах лимита Telegram, с повтором после RetryAfter
+# =============================================
+
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError, TelegramRetryAfter
+
+import metrics
+
+logger = logging.getLogger("fanout")
+
+
+async def send_one(bot, chat_id: int, text: str, kwargs: dict):
+    """
+    Отправка с одним повтором после RetryAfter; остальные ошибки поднимаются
+    """
+    try:
+        await bot.send_message(chat_id, text, **kwargs)
+    except TelegramRetryAfter as e:
+        # Telegram просит подождать — один повтор после паузы
+        metrics.inc("fanout_retry_after")
+        await asyncio.sleep(e.retry_after)
+        await bot.send_message(chat_id, text, **kwargs)
+
+    metrics.inc("fanout_sent")
+
+
+async def _send(bot, chat_id: int, text: str, kwargs: dict) -> bool:
+    try:
+        await send_one(bot, chat_id, text, kwargs)
+        return True
+    except TelegramForbiddenError:
+        logger.warning("бот заблокирован или удалён из чата", extra={"chat_id": chat_id})
+    except TelegramAPIError as e:
+        logger.error("ошибка отправки: %s", e, extra={"chat_id": chat_id})
+
+    metrics.inc("fanout_failed")
+    return False
+
+
+async def send_all(bot, messages: list, per_second: int) -> int:
+    """
+    messages — [(chat_id, text, kwargs для send_message), ...].
+    Отправляет пачками по per_second сообщений: внутри пачки — параллельно,
+    между пачками — пауза до конца секунды. Ошибки отдельных чатов
+    логируются и не прерывают рассылку. Возвращает число доставленных.
+    """
+    delivered = 0
+
+    for start in range(0, len(messages), per_second):
+        batch = messages[start:start + per_second]
+        started = time.monotonic()
+
+        results = await asyncio.gather(*(
+            _send(bot, chat_id, text, kwargs) for chat_id, text, kwargs in batch
+        ))
+        delivered += sum(results)
+
+        if start + per_second < len(messages):
+            await asyncio.sleep(max(0.0, 1.0 - (time.monotonic() - started)))
+
+    return delivered
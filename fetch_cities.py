@@ -8,8 +8,15 @@ import sys
 
 ATI_BASE_URL = "https://api.ati.su"
 
-try:
-    from config import MANAGERS
+
+def get_token() -> str:
+    # config читается только при запуске, а не при импорте модуля
+    try:
+        from config import MANAGERS
+    except Exception as e:
+        print(f"Ошибка импорта config.py: {e}")
+        sys.exit(1)
+
     first_manager = next(
         (v for v in MANAGERS.values() if v.get("access_token") and "ВАШ_ACCESS_TOKEN" not in v.get("access_token", "")),
         None
@@ -17,22 +24,22 @@ try:
     if not first_manager:
         print("Ошибка: нет валидного access_token в config.py")
         sys.exit(1)
-    TOKEN = first_manager["access_token"]
-except Exception as e:
-    print(f"Ошибка импорта config.py: {e}")
-    sys.exit(1)
+    return first_manager["access_token"]
+
+
+def get_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {get_token()}",
+        "Content-Type": "application/json",
+    }
 
-HEADERS = {
-    "Authorization": f"Bearer {TOKEN}",
-    "Content-Type": "application/json",
-}
 
 if __name__ == "__main__":
     print("Загружаю города из АТИ.СУ API...")
 
     url = f"{ATI_BASE_URL}/v1.0/dictionaries/cities"
     with httpx.Client(timeout=60.0) as client:
-        response = client.get(url, headers=HEADERS)
+        response = client.get(url, headers=get_headers())
 
     if response.status_code != 200:
         print(f"Ошибка: {response.status_code} {response.text[:300]}")
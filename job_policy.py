@@ -0,0 +1,92 @@
+# =============================================
+# job_policy.py
+# Политика выполнения фоновых задач:
+# не больше одного запуска на менеджера, жёсткий дедлайн, учёт пропусков
+# =============================================
+
+import asyncio
+import functools
+import logging
+import time
+
+from apscheduler.events import (
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_ERROR,
+)
+
+import metrics
+
+logger = logging.getLogger("scheduler")
+
+# Параметры планировщика для всех задач:
+# max_instances=1 — пока задача менеджера выполняется, следующий запуск пропускается;
+# coalesce=True — накопившиеся пропущенные запуски схлопываются в один.
+JOB_DEFAULTS = {
+    "max_instances": 1,
+    "coalesce": True,
+}
+
+
+def misfire_grace_seconds(interval_seconds: float) -> int:
+    """
+    Запуск, опоздавший больше чем на половину интервала, пропускается —
+    следующий всё равно скоро придёт
+    """
+    return max(1, int(interval_seconds / 2))
+
+
+def with_deadline(job, deadline_seconds: float, interval_seconds: float):
+    """
+    Оборачивает задачу вида job(manager_key) дедлайном с отменой
+    и метриками длительности / превышения интервала
+    """
+    job_name = job.__name__
+
+    @functools.wraps(job)
+    async def wrapper(manager_key: str):
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(job(manager_key), timeout=deadline_seconds)
+        except asyncio.TimeoutError:
+            metrics.inc("job_deadline_exceeded", job=job_name, manager=manager_key)
+            logger.warning(
+                "⏱ %s отменена по дедлайну %s с", job_name, deadline_seconds,
+                extra={"manager": manager_key},
+            )
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.observe("job_seconds", elapsed, job=job_name, manager=manager_key)
+
+            if elapsed > interval_seconds:
+                metrics.inc("job_overran", job=job_name, manager=manager_key)
+
+    return wrapper
+
+
+def _split_job_id(job_id: str) -> tuple[str, str]:
+    # id задач имеют вид "<вид>_<manager_key>"
+    kind, _, manager_key = job_id.partition("_")
+    return kind, manager_key
+
+
+def _on_job_event(event):
+    kind, manager_key = _split_job_id(event.job_id)
+
+    if event.code == EVENT_JOB_MAX_INSTANCES:
+        metrics.inc("job_skipped_running", job=kind, manager=manager_key)
+    elif event.code == EVENT_JOB_MISSED:
+        metrics.inc("job_misfired", job=kind, manager=manager_key)
+    elif event.code == EVENT_JOB_ERROR:
+        metrics.inc("job_failed", job=kind, manager=manager_key)
+
+
+def install(scheduler):
+    """
+    Подписывает метрики на события планировщика (пропуски, опоздания, ошибки)
+    """
+    scheduler.add_listener(
+        _on_job_event,
+        EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED | EVENT_JOB_ERROR,
+    )
@@ -0,0 +1,149 @@
+# =============================================
+# load_feed.py
+# Лента изменений грузов: сравнение снимков get_my_loads
+# =============================================
+
+from ati_client import get_my_loads, parse_loads, IncompleteLoadsError
+from config import LOAD_FEED_SECONDS
+from state import get_load_snapshot, set_load_snapshot, get_feed_loads, set_feed_loads
+
+# Сколько секунд список грузов из ленты считается свежим для других задач
+FEED_LOADS_MAX_AGE = LOAD_FEED_SECONDS * 2
+
+# Типы событий
+LOAD_NEW = "new"
+LOAD_REMOVED = "removed"
+OFFERS_INCREASED = "offers"
+RENEW_CHANGED = "renewable"
+
+
+def snapshot_entry(load: dict) -> tuple:
+    """
+    Компактная запись снимка для разобранного груза (parse_load)
+    """
+    return load["response_count"], bool(load["can_renew"])
+
+
+def diff_load(prev_entry: tuple | None, load: dict) -> list:
+    """
+    События по одному грузу относительно его записи в прошлом снимке
+    """
+    count, can_renew = snapshot_entry(load)
+
+    if prev_entry is None:
+        return [{
+            "type": LOAD_NEW,
+            "load_id": load["id"],
+            "load": load,
+            "old_count": 0,
+            "new_count": count,
+        }]
+
+    prev_count, prev_can_renew = prev_entry
+    events = []
+
+    if count > prev_count:
+        events.append({
+            "type": OFFERS_INCREASED,
+            "load_id": load["id"],
+            "load": load,
+            "old_count": prev_count,
+            "new_count": count,
+        })
+
+    if can_renew != prev_can_renew:
+        events.append({
+            "type": RENEW_CHANGED,
+            "load_id": load["id"],
+            "load": load,
+            "can_renew": can_renew,
+        })
+
+    return events
+
+
+async def poll_load_changes(manager_key: str, on_load=None) -> list:
+    """
+    Загружает грузы менеджера постранично и возвращает список событий
+    относительно предыдущего снимка. on_load(load) вызывается для каждого
+    разобранного груза (например, для локального зеркала).
+
+    Первый вызов только запоминает снимок и событий не даёт.
+    Если загрузка не вернула ни одного груза, снимок не меняется —
+    сетевая ошибка не должна выглядеть как «все грузы удалены».
+    Неполный список (IncompleteLoadsError) даёт события только по
+    полученным грузам: без LOAD_REMOVED, полученные записи вливаются
+    в прошлый снимок, список для iter_loads не запоминается.
+    """
+    prev = get_load_snapshot(manager_key)
+    snapshot = {}
+    loads = []
+    events = []
+    complete = True
+
+    try:
+        async for page in get_my_loads(manager_key):
+            for load in await parse_loads(page):
+                snapshot[load["id"]] = snapshot_entry(load)
+                loads.append(load)
+
+                if on_load is not None:
+                    on_load(load)
+
+                if prev is not None:
+                    events += diff_load(prev.get(load["id"]), load)
+    except IncompleteLoadsError:
+        complete = False
+
+    if not snapshot:
+        return []
+
+    if not complete:
+        # без первого полного снимка не запоминаем ничего: иначе грузы
+        # с недополученных страниц потом придут как LOAD_NEW
+        if prev is not None:
+            set_load_snapshot(manager_key, {**prev, **snapshot})
+        return events
+
+    if prev is not None:
+        for load_id in prev.keys() - snapshot.keys():
+            events.append({
+                "type": LOAD_REMOVED,
+                "load_id": load_id,
+                "load": None,
+            })
+
+    set_load_snapshot(manager_key, snapshot)
+    set_feed_loads(manager_key, loads)
+
+    return events
+
+
+def note_response_sent(manager_key: str, load_id: str):
+    """
+    Отклик отправлен основным путём (/loads/new/responses) — счётчик
+    в снимке растёт, чтобы лента не приняла его за пропущенный и не
+    дослала вместо него старый отклик
+    """
+    snapshot = get_load_snapshot(manager_key)
+    if snapshot is None or load_id not in snapshot:
+        return
+    count, can_renew = snapshot[load_id]
+    snapshot[load_id] = (count + 1, can_renew)
+
+
+async def iter_loads(manager_key: str, fresh: bool = False):
+    """
+    Разобранные грузы менеджера постранично.
+
+    Если лента опрашивала ATI недавно (FEED_LOADS_MAX_AGE), отдаёт её список
+    одной страницей без запроса; fresh=True — всегда загружает заново.
+    """
+    loads = None if fresh else get_feed_loads(manager_key, FEED_LOADS_MAX_AGE)
+
+    if loads is not None:
+        yield loads
+        return
+
+    async for page in get_my_loads(manager_key):
+        yield await parse_loads(page)
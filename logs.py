@@ -0,0 +1,165 @@
+# =============================================
+# logs.py
+# Неблокирующее логирование: QueueHandler + фоновый QueueListener,
+# JSON-строки со структурными полями и сэмплирование частых сообщений
+# =============================================
+
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+# Атрибуты, которые есть у любой LogRecord; всё остальное пришло через extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "suppressed",
+}
+
+
+def structured_fields(record: logging.LogRecord) -> dict:
+    """
+    Поля из extra={...} (manager, load_id, chat_id, task, trace_id, ...)
+    """
+    return {
+        name: value
+        for name, value in vars(record).items()
+        if name not in _STANDARD_ATTRS and value is not None
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+
+        entry.update(structured_fields(record))
+
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Человекочитаемый формат для локального запуска: структурные поля в конце строки
+    """
+
+    def __init__(self):
+        super().__init__("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+
+        fields = [f"{name}={value}" for name, value in structured_fields(record).items()]
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            fields.append(f"suppressed={suppressed}")
+
+        if not fields:
+            return line
+
+        # поля — в первой строке, трейсбек (если есть) остаётся ниже
+        first, newline, rest = line.partition("\n")
+        return f"{first} | {' '.join(fields)}{newline}{rest}"
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Стандартный prepare() склеивает трейсбек с текстом сообщения и стирает
+    exc_info — здесь трейсбек форматируется до очереди и едет в exc_text
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+
+        if record.stack_info:
+            record.exc_text = "\n".join(filter(None, (record.exc_text, record.stack_info)))
+        record.stack_info = None
+
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает не больше limit сообщений одного шаблона (logger + msg)
+    за окно window секунд. WARNING и выше проходят всегда.
+    Число отброшенных попадает в поле suppressed следующего пропущенного.
+    """
+
+    def __init__(self, limit: int, window: float = 60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (logger, msg) -> [начало окна, пропущено в окне, отброшено]
+        self._buckets: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+
+        if bucket is None or now - bucket[0] >= self.window:
+            dropped = bucket[2] if bucket else 0
+            self._buckets[key] = [now, 1, 0]
+            record.suppressed = dropped
+            return True
+
+        if bucket[1] < self.limit:
+            bucket[1] += 1
+            record.suppressed, bucket[2] = bucket[2], 0
+            return True
+
+        bucket[2] += 1
+        return False
+
+
+def setup_logging(level: str = "INFO", json_format: bool = True,
+                  sample_per_minute: int = 0) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер: запись в очередь (без I/O в event loop),
+    вывод в stdout из фонового потока. Возвращает запущенный listener —
+    его нужно остановить при завершении (listener.stop()).
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if json_format else TextFormatter())
+
+    queue_handler = _QueueHandler(log_queue)
+    if sample_per_minute:
+        queue_handler.addFilter(SamplingFilter(sample_per_minute))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level.upper())
+
+    # httpx пишет строку на каждый запрос — у ati_client есть свой структурный лог
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    listener.start()
+
+    return listener
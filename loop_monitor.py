@@ -0,0 +1,220 @@
+# =============================================
+# loop_monitor.py
+# Здоровье цикла событий: задержка цикла (loop lag), поиск
+# блокирующих колбэков и снимки стека во время зависаний
+# =============================================
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from html import escape
+
+import metrics
+
+logger = logging.getLogger("loop")
+
+# Сколько кадров стека хранить в одном сэмпле
+_STACK_DEPTH = 12
+
+
+def _frame_stack(frame) -> tuple:
+    """
+    Стек потока цикла от внешнего вызова к внутреннему: ("file.py:12 func", ...)
+    """
+    stack = []
+    while frame is not None and len(stack) < _STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno} {code.co_name}")
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class LoopMonitor:
+    """
+    Два наблюдателя:
+
+    - heartbeat-корутина в цикле событий: просыпается каждые interval секунд
+      и меряет, насколько позже обещанного (loop_lag_seconds);
+    - watchdog-поток: если heartbeat не отметился дольше interval + threshold,
+      цикл считается заблокированным; при profile=True поток каждые
+      sample_interval секунд снимает стек потока цикла (sys._current_frames),
+      после зависания собирает снимок с самыми частыми стеками.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1,
+                 profile: bool = True, sample_interval: float = 0.005,
+                 keep_snapshots: int = 10):
+        self.interval = interval
+        self.threshold = threshold
+        self.profile = profile
+        self.sample_interval = sample_interval
+
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.snapshots: deque = deque(maxlen=keep_snapshots)
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._beat = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    # -----------------------------------------
+    # Heartbeat (в цикле событий)
+    # -----------------------------------------
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+
+            lag = max(0.0, now - started - self.interval)
+            self.last_lag = lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+
+            metrics.observe("loop_lag_seconds", lag)
+            if lag > self.threshold:
+                metrics.inc("loop_lag_spikes")
+
+    # -----------------------------------------
+    # Watchdog (отдельный поток)
+    # -----------------------------------------
+
+    def _blocked_for(self) -> float:
+        return time.monotonic() - self._beat - self.interval
+
+    def _current_task_name(self) -> str:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return ""
+        return task.get_name() if task else ""
+
+    def _watch(self):
+        while not self._stopped.wait(self.sample_interval):
+            if self._blocked_for() <= self.threshold:
+                continue
+
+            stall_beat = self._beat
+            started = time.monotonic()
+            task_name = self._current_task_name()
+            stacks: Counter = Counter()
+
+            # цикл заблокирован — сэмплируем, пока heartbeat снова не отметится
+            while self._beat == stall_beat and not self._stopped.is_set():
+                if self.profile:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    if frame is not None:
+                        stacks[_frame_stack(frame)] += 1
+                time.sleep(self.sample_interval)
+
+            self._record_stall(time.monotonic() - started + self.threshold, task_name, stacks)
+
+    def _record_stall(self, duration: float, task_name: str, stacks: Counter):
+        self.stalls += 1
+        metrics.inc("loop_stalls")
+        metrics.observe("loop_stall_seconds", duration)
+
+        samples = sum(stacks.values())
+        top = [
+            {"share": count / samples, "stack": list(stack)}
+            for stack, count in stacks.most_common(3)
+        ] if samples else []
+
+        self.snapshots.append({
+            "at": time.time(),
+            "duration": duration,
+            "task": task_name,
+            "samples": samples,
+            "top": top,
+        })
+
+        hot = top[0]["stack"][-1] if top else "?"
+        logger.warning(
+            "цикл событий был заблокирован %.0f мс: %s", duration * 1000, hot,
+            extra={"task": task_name},
+        )
+
+    # -----------------------------------------
+    # Запуск и остановка
+    # -----------------------------------------
+
+    def start(self):
+        """
+        Вызывать изнутри работающего цикла событий
+        """
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+
+        self._task = asyncio.create_task(self._heartbeat(), name="loop-monitor")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+        logger.info(
+            "мониторинг цикла: шаг %s с, порог %s с, профилирование: %s",
+            self.interval, self.threshold, self.profile,
+        )
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    # -----------------------------------------
+    # Отчёт для /debug
+    # -----------------------------------------
+
+    def report(self, max_snapshots: int = 3) -> list:
+        lag = metrics.snapshot()["observations"].get("loop_lag_seconds")
+
+        lines = [
+            f"⏱ lag сейчас: {self.last_lag * 1000:.1f} мс, макс: {self.max_lag * 1000:.1f} мс",
+        ]
+        if lag:
+            lines.append(f"   среднее: {lag['avg'] * 1000:.1f} мс по {lag['count']} замерам")
+        lines.append(f"🧊 зависаний > {self.threshold * 1000:.0f} мс: {self.stalls}")
+
+        for snap in list(self.snapshots)[-max_snapshots:][::-1]:
+            when = time.strftime("%H:%M:%S", time.localtime(snap["at"]))
+            lines.append(
+                f"\n<b>{when}</b> {snap['duration'] * 1000:.0f} мс, "
+                f"задача: {escape(snap['task']) or '—'}, сэмплов: {snap['samples']}"
+            )
+            for entry in snap["top"][:2]:
+                lines.append(f"  {entry['share']:.0%}:")
+                lines += [f"    {escape(frame)}" for frame in entry["stack"][-5:]]
+
+        return lines
+
+
+_monitor: LoopMonitor | None = None
+
+
+def get_loop_monitor() -> LoopMonitor:
+    """
+    Общий монитор процесса с настройками из config
+    """
+    global _monitor
+
+    if _monitor is None:
+        from config import LOOP_MONITOR_INTERVAL_MS, LOOP_LAG_THRESHOLD_MS, LOOP_PROFILE, LOOP_SAMPLE_MS
+        _monitor = LoopMonitor(
+            interval=LOOP_MONITOR_INTERVAL_MS / 1000,
+            threshold=LOOP_LAG_THRESHOLD_MS / 1000,
+            profile=LOOP_PROFILE,
+            sample_interval=LOOP_SAMPLE_MS / 1000,
+        )
+
+    return _monitor
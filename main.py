@@ -2,25 +2,65 @@
 
 import asyncio
 import logging
-from aiogram import Bot
-from telegram_bot import bot, dp
-from scheduler import start_scheduler
-from config import TELEGRAM_BOT_TOKEN
 
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
+from config import (
+    CASSETTE_RECORD_PATH,
+    TRACE_PATH,
+    TRACE_SAMPLE_RATE,
+    LOG_LEVEL,
+    LOG_JSON,
+    LOG_SAMPLE_PER_MINUTE,
 )
+from logs import setup_logging
+
+# логирование настраиваем до импорта модулей, которые пишут в лог при загрузке
+log_listener = setup_logging(LOG_LEVEL, LOG_JSON, LOG_SAMPLE_PER_MINUTE)
+
+from app import create_app
+from loop_monitor import get_loop_monitor
+from mirror import get_mirror
+from tracing import install_tracing, uninstall_tracing
+
+logger = logging.getLogger("main")
 
 
 async def main():
-    print("🚀 Запуск бота...")
-    start_scheduler()
-    print("✅ Планировщик запущен")
-    print("✅ Бот запущен и ожидает сообщений")
-    await dp.start_polling(bot)
+    logger.info("🚀 Запуск бота...")
+
+    monitor = get_loop_monitor()
+    monitor.start()
+
+    app = create_app()
+
+    recorder = None
+    if CASSETTE_RECORD_PATH:
+        from cassette import install_recorder
+        recorder = install_recorder(CASSETTE_RECORD_PATH, app.dp)
+
+    if TRACE_PATH:
+        install_tracing(TRACE_PATH, app.dp, app.bot, TRACE_SAMPLE_RATE)
+
+    # справочник городов, статистика цен по маршрутам и планировщик
+    app.start()
+    logger.info("✅ Планировщик запущен")
+    logger.info("✅ Бот запущен и ожидает сообщений")
+
+    try:
+        await app.dp.start_polling(app.bot)
+    finally:
+        app.stop()
+        monitor.stop()
+        # строки зеркала, накопленные с последней пачки, иначе теряются при остановке
+        await get_mirror().flush()
+        # несброшенные FSM и сессии; start_polling хранилище не закрывает
+        await app.dp.storage.close()
+        if recorder:
+            recorder.close()
+        uninstall_tracing()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    finally:
+        log_listener.stop()
@@ -0,0 +1,378 @@
+# =============================================
+# managers.py
+# Реестр менеджеров: загрузка из JSON / YAML / SQLite,
+# индексы для поиска за O(1), добавление и удаление без перезапуска
+# =============================================
+
+import json
+import logging
+import os
+import sqlite3
+from collections.abc import Mapping
+
+logger = logging.getLogger("managers")
+
+# Формат записи менеджера:
+# {
+#     "key": "alexander",            # идентификатор (manager_key) во всём коде
+#     "name": "Александр",
+#     "access_token": "...",
+#     "contact_id": 123,
+#     "chat_id": 111,                # куда слать уведомления
+#     "user_ids": [111],             # кому разрешён доступ (по умолчанию — chat_id)
+# }
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS managers (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    access_token TEXT NOT NULL,
+    contact_id INTEGER NOT NULL DEFAULT 0,
+    chat_id INTEGER NOT NULL DEFAULT 0,
+    user_ids TEXT NOT NULL DEFAULT '[]'
+)
+"""
+
+
+def normalize_record(record: dict) -> dict:
+    key = str(record["key"]).strip()
+    if not key:
+        raise ValueError("у менеджера пустой key")
+
+    chat_id = int(record.get("chat_id") or 0)
+    user_ids = [int(u) for u in (record.get("user_ids") or []) if u]
+    if not user_ids and chat_id:
+        # как и раньше: chat_id личного чата совпадает с user_id
+        user_ids = [chat_id]
+
+    return {
+        "key": key,
+        "name": record.get("name") or key,
+        "access_token": record.get("access_token") or "",
+        "contact_id": int(record.get("contact_id") or 0),
+        "chat_id": chat_id,
+        "user_ids": user_ids,
+    }
+
+
+# =============================================
+# Источники
+# =============================================
+
+def _sqlite_paths(path: str) -> list:
+    return [path, path + "-wal"]
+
+
+def read_source(path: str) -> list:
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in (".sqlite", ".sqlite3", ".db"):
+        # mode=rw: отсутствующий файл — ошибка, а не новая пустая база
+        db = sqlite3.connect(f"file:{path}?mode=rw", uri=True)
+        try:
+            db.execute(_SQLITE_SCHEMA)
+            rows = db.execute(
+                "SELECT key, name, access_token, contact_id, chat_id, user_ids FROM managers"
+            ).fetchall()
+        finally:
+            db.close()
+
+        return [
+            {
+                "key": key, "name": name, "access_token": token, "contact_id": contact_id,
+                "chat_id": chat_id, "user_ids": json.loads(user_ids or "[]"),
+            }
+            for key, name, token, contact_id, chat_id, user_ids in rows
+        ]
+
+    return read_document(path, "managers")
+
+
+def read_document(path: str, root: str) -> list:
+    """
+    Список записей из JSON / YAML: либо сам список, либо {root: [...]}
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    with open(path, "r", encoding="utf-8") as f:
+        if ext in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("для YAML-файлов установите PyYAML: pip install pyyaml")
+            data = yaml.safe_load(f) or []
+        else:
+            data = json.load(f)
+
+    if isinstance(data, dict):
+        data = data.get(root) or []
+
+    return data
+
+
+def write_source(path: str, records: list):
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in (".sqlite", ".sqlite3", ".db"):
+        db = sqlite3.connect(path)
+        try:
+            db.execute(_SQLITE_SCHEMA)
+            with db:
+                db.execute("DELETE FROM managers")
+                db.executemany(
+                    "INSERT INTO managers (key, name, access_token, contact_id, chat_id, user_ids)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (r["key"], r["name"], r["access_token"], r["contact_id"],
+                         r["chat_id"], json.dumps(r["user_ids"]))
+                        for r in records
+                    ],
+                )
+        finally:
+            db.close()
+        return
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if ext in (".yaml", ".yml"):
+            import yaml
+            yaml.safe_dump({"managers": records}, f, allow_unicode=True, sort_keys=False)
+        else:
+            json.dump({"managers": records}, f, ensure_ascii=False, indent=2)
+
+    os.replace(tmp_path, path)
+
+
+# =============================================
+# Реестр
+# =============================================
+
+class _IndexView(Mapping):
+    """
+    Живое read-only представление индекса реестра (например, user_id -> manager_key)
+    """
+
+    def __init__(self, index: dict, ensure_loaded):
+        self._index = index
+        self._ensure_loaded = ensure_loaded
+
+    def __getitem__(self, item):
+        self._ensure_loaded()
+        return self._index[item]
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._index)
+
+
+class _ChatIdsView(Mapping):
+    """
+    manager_key -> chat_id (то, чем раньше был config.TELEGRAM_CHAT_IDS)
+    """
+
+    def __init__(self, by_key: dict, ensure_loaded):
+        self._by_key = by_key
+        self._ensure_loaded = ensure_loaded
+
+    def __getitem__(self, key: str) -> int:
+        self._ensure_loaded()
+        return self._by_key[key]["chat_id"]
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return iter(self._by_key)
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_key)
+
+
+class ManagerRegistry(Mapping):
+    """
+    manager_key -> запись менеджера. Ведёт словари-индексы по user_id, chat_id,
+    contact_id и токену, поэтому поиск не требует перебора.
+
+    Подписчики subscribe(callback) получают callback(added, removed) со списками
+    ключей после каждой перезагрузки или изменения.
+
+    Реестр с path читается при первом обращении (lazy), а не при создании —
+    импорт config не трогает файл.
+    """
+
+    def __init__(self, records: list | None = None, path: str = ""):
+        self.path = path
+        self._by_key: dict[str, dict] = {}
+        self._by_user: dict[int, str] = {}
+        self._by_chat: dict[int, str] = {}
+        self._by_contact: dict[int, str] = {}
+        self._by_token: dict[str, str] = {}
+        self._listeners: list = []
+        self._mtime: float | None = None
+
+        # живые представления для кода, который работает со словарями из config
+        self.chat_ids = _ChatIdsView(self._by_key, self._ensure_loaded)
+        self.users = _IndexView(self._by_user, self._ensure_loaded)
+
+        if records is not None:
+            self._apply([normalize_record(r) for r in records])
+
+    @classmethod
+    def from_file(cls, path: str, lazy: bool = False) -> "ManagerRegistry":
+        registry = cls(path=path)
+        if not lazy:
+            registry.reload()
+        return registry
+
+    def _ensure_loaded(self):
+        # _mtime ставится первым же reload()
+        if self.path and self._mtime is None:
+            self.reload()
+
+    # -----------------------------------------
+    # Mapping: MANAGERS[key]["access_token"] и т.п.
+    # -----------------------------------------
+
+    def __getitem__(self, key: str) -> dict:
+        self._ensure_loaded()
+        return self._by_key[key]
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return iter(list(self._by_key))
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._by_key)
+
+    # -----------------------------------------
+    # Индексы
+    # -----------------------------------------
+
+    def by_user(self, user_id: int) -> str | None:
+        self._ensure_loaded()
+        return self._by_user.get(user_id)
+
+    def by_chat(self, chat_id: int) -> str | None:
+        self._ensure_loaded()
+        return self._by_chat.get(chat_id)
+
+    def by_contact(self, contact_id: int) -> str | None:
+        self._ensure_loaded()
+        return self._by_contact.get(int(contact_id or 0))
+
+    def by_token(self, token: str) -> str | None:
+        self._ensure_loaded()
+        return self._by_token.get(token)
+
+    def _index(self, record: dict):
+        key = record["key"]
+
+        for user_id in record["user_ids"]:
+            self._by_user[user_id] = key
+        if record["chat_id"]:
+            self._by_chat[record["chat_id"]] = key
+        if record["contact_id"]:
+            self._by_contact[record["contact_id"]] = key
+        if record["access_token"]:
+            self._by_token[record["access_token"]] = key
+
+    def _unindex(self, record: dict):
+        key = record["key"]
+
+        for index, value in (
+            *((self._by_user, u) for u in record["user_ids"]),
+            (self._by_chat, record["chat_id"]),
+            (self._by_contact, record["contact_id"]),
+            (self._by_token, record["access_token"]),
+        ):
+            if index.get(value) == key:
+                del index[value]
+
+    # -----------------------------------------
+    # Изменения
+    # -----------------------------------------
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def _apply(self, records: list) -> tuple[list, list]:
+        new = {r["key"]: r for r in records}
+
+        added = [k for k in new if k not in self._by_key]
+        removed = [k for k in self._by_key if k not in new]
+        changed = [k for k in new if k in self._by_key and new[k] != self._by_key[k]]
+
+        for key in removed + changed:
+            self._unindex(self._by_key.pop(key))
+
+        for key in added + changed:
+            self._by_key[key] = new[key]
+            self._index(new[key])
+
+        if added or removed or changed:
+            logger.info(
+                "[Managers] добавлено: %s, удалено: %s, изменено: %s",
+                added, removed, changed,
+            )
+
+        for callback in self._listeners:
+            if added or removed:
+                callback(added, removed)
+
+        return added, removed
+
+    def _source_mtime(self) -> float:
+        return max(
+            (os.path.getmtime(p) for p in _sqlite_paths(self.path) if os.path.exists(p)),
+            default=0.0,
+        )
+
+    def reload(self) -> tuple[list, list]:
+        """
+        Перечитывает источник и применяет разницу к индексам
+        """
+        if not self.path:
+            return [], []
+
+        self._mtime = self._source_mtime()
+        records = [normalize_record(r) for r in read_source(self.path)]
+        return self._apply(records)
+
+    def reload_if_changed(self) -> tuple[list, list]:
+        if not self.path or self._source_mtime() == self._mtime:
+            return [], []
+
+        # файл удалён или ещё не записан — остаёмся на текущем реестре
+        if not os.path.exists(self.path):
+            return [], []
+
+        try:
+            return self.reload()
+        except Exception as e:
+            # битый файл не должен ронять бота — остаёмся на старом реестре
+            logger.error("[Managers] ошибка чтения %s: %s", self.path, e)
+            return [], []
+
+    def _save(self):
+        if not self.path:
+            return
+        write_source(self.path, list(self._by_key.values()))
+        self._mtime = self._source_mtime()
+
+    def upsert(self, record: dict, persist: bool = True):
+        self._ensure_loaded()
+        record = normalize_record(record)
+        records = {**self._by_key, record["key"]: record}
+        self._apply(list(records.values()))
+        if persist:
+            self._save()
+
+    def remove(self, key: str, persist: bool = True):
+        self._ensure_loaded()
+        self._apply([r for k, r in self._by_key.items() if k != key])
+        if persist:
+            self._save()
@@ -0,0 +1,82 @@
+# =============================================
+# metrics.py
+# Простые метрики внутри процесса: счётчики и наблюдения
+# =============================================
+
+from collections import defaultdict
+
+# (имя, метки) -> значение
+_counters: dict[tuple, float] = defaultdict(float)
+# (имя, метки) -> {"count", "sum", "max"}
+_observations: dict[tuple, dict] = {}
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    _counters[_key(name, labels)] += value
+
+
+def observe(name: str, value: float, **labels):
+    key = _key(name, labels)
+    obs = _observations.get(key)
+
+    if obs is None:
+        _observations[key] = {"count": 1, "sum": value, "max": value}
+        return
+
+    obs["count"] += 1
+    obs["sum"] += value
+    if value > obs["max"]:
+        obs["max"] = value
+
+
+def get_counter(name: str, **labels) -> float:
+    return _counters.get(_key(name, labels), 0)
+
+
+def _format_key(key: tuple) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    inner = ",".join(f"{k}={v}" for k, v in labels)
+    return f"{name}{{{inner}}}"
+
+
+def snapshot() -> dict:
+    """
+    Текущее состояние всех метрик в виде {"name{label=value}": ...}
+    """
+    return {
+        "counters": {_format_key(k): v for k, v in _counters.items()},
+        "observations": {
+            _format_key(k): {
+                "count": o["count"],
+                "avg": o["sum"] / o["count"],
+                "max": o["max"],
+            }
+            for k, o in _observations.items()
+        },
+    }
+
+
+def format_text(prefix: str = "") -> str:
+    """
+    Метрики построчно (для вывода в чат / лог), с фильтром по префиксу имени
+    """
+    snap = snapshot()
+    lines = []
+
+    for name, value in sorted(snap["counters"].items()):
+        if name.startswith(prefix):
+            lines.append(f"{name} = {value:g}")
+
+    for name, o in sorted(snap["observations"].items()):
+        if name.startswith(prefix):
+            lines.append(
+                f"{name}: n={o['count']} avg={o['avg']:.3f} max={o['max']:.3f}"
+            )
+
+    return "\n".join(lines)
@@ -0,0 +1,329 @@
+# =============================================
+# mirror.py
+# Локальное зеркало грузов и откликов (SQLite + FTS5):
+# история изменений и быстрый поиск без запросов к ATI
+# =============================================
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("mirror")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS loads (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    manager TEXT NOT NULL,
+    load_id TEXT NOT NULL,
+    seen REAL NOT NULL,
+    status TEXT NOT NULL,
+    from_city TEXT,
+    to_city TEXT,
+    weight TEXT,
+    cargo_name TEXT,
+    response_count INTEGER,
+    can_renew INTEGER
+);
+CREATE INDEX IF NOT EXISTS loads_by_id ON loads (manager, load_id, seq);
+
+CREATE TABLE IF NOT EXISTS responses (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    manager TEXT NOT NULL,
+    load_id TEXT NOT NULL,
+    response_id TEXT NOT NULL,
+    seen REAL NOT NULL,
+    outdated INTEGER NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_load ON responses (manager, load_id, seq);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5 (
+    manager UNINDEXED,
+    kind UNINDEXED,
+    load_id UNINDEXED,
+    ref UNINDEXED,
+    body,
+    tokenize = 'unicode61'
+);
+"""
+
+
+def normalize_phone(value: str) -> str:
+    digits = re.sub(r"\D", "", value or "")
+    if digits.startswith("8") and len(digits) == 11:
+        digits = "7" + digits[1:]
+    return digits
+
+
+def _load_fingerprint(load: dict) -> tuple:
+    return (
+        load["from_city"], load["to_city"], str(load["weight"]), load["cargo_name"],
+        load["response_count"], bool(load["can_renew"]),
+    )
+
+
+def _response_fingerprint(r: dict) -> str:
+    return json.dumps(r, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _response_search_body(r: dict) -> str:
+    firm = r.get("FirmInfo") or {}
+    contact = firm.get("Contact") or {}
+
+    phones = [
+        normalize_phone(contact.get(k) or "") for k in ("Mobile", "Telephone")
+    ]
+
+    return " ".join(str(p) for p in (
+        firm.get("FullFirmName"), r.get("FirmName"), contact.get("Name"),
+        *phones, r.get("Note"),
+    ) if p)
+
+
+def _fts_query(text: str) -> str:
+    """
+    Пользовательский запрос -> запрос FTS5: каждое слово как префикс, все слова обязательны
+    """
+    words = re.findall(r"\w+", text.lower())
+    phone = normalize_phone(text)
+
+    if phone and len(phone) >= 5 and len(phone) == len(re.sub(r"\D", "", text)):
+        words = [phone]
+
+    return " ".join(f'"{w}"*' for w in words)
+
+
+class Mirror:
+    """
+    Append-only зеркало: новая строка пишется, только если груз или отклик
+    изменился с прошлого раза (после перезапуска процесса — первая встреча
+    каждого груза и отклика пишется заново). Данные копятся в памяти и пишутся пачкой
+    в фоновом потоке (flush), поиск и история — тоже в потоке.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.batch_size = batch_size
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+        self._pending_loads: list = []
+        self._pending_responses: list = []
+        # последние записанные версии: (manager, load_id) -> отпечаток груза
+        # и (manager, load_id) -> {response_id: отпечаток}; снятый груз
+        # уносит свои отклики (remove_load), так что словари не растут без конца
+        self._last_loads: dict[tuple, tuple] = {}
+        self._last_responses: dict[tuple, dict] = {}
+
+    # -----------------------------------------
+    # Приём данных (в цикле событий, без I/O)
+    # -----------------------------------------
+
+    def add_load(self, manager_key: str, load: dict):
+        key = (manager_key, load["id"])
+        fingerprint = _load_fingerprint(load)
+
+        if self._last_loads.get(key) == fingerprint:
+            return
+
+        self._last_loads[key] = fingerprint
+        self._pending_loads.append((manager_key, load["id"], time.time(), "active", load))
+
+    def remove_load(self, manager_key: str, load_id: str):
+        key = (manager_key, str(load_id))
+        self._last_responses.pop(key, None)
+        if self._last_loads.pop(key, None) is None:
+            return
+        self._pending_loads.append((manager_key, str(load_id), time.time(), "removed", None))
+
+    def add_responses(self, manager_key: str, load_id: str, responses: list):
+        last = self._last_responses.setdefault((manager_key, str(load_id)), {})
+
+        for r in responses:
+            response_id = str(r.get("ResponseId"))
+            raw = _response_fingerprint(r)
+            fingerprint = hash(raw)
+
+            if last.get(response_id) == fingerprint:
+                continue
+
+            last[response_id] = fingerprint
+            self._pending_responses.append((manager_key, str(load_id), response_id, time.time(), r, raw))
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending_loads) + len(self._pending_responses)
+
+    # -----------------------------------------
+    # Запись пачкой
+    # -----------------------------------------
+
+    def _write(self, loads: list, responses: list):
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN")
+            try:
+                for manager_key, load_id, seen, status, load in loads:
+                    if load is None:
+                        cur.execute(
+                            "INSERT INTO loads (manager, load_id, seen, status) VALUES (?, ?, ?, ?)",
+                            (manager_key, load_id, seen, status),
+                        )
+                        continue
+
+                    cur.execute(
+                        "INSERT INTO loads (manager, load_id, seen, status, from_city, to_city,"
+                        " weight, cargo_name, response_count, can_renew)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            manager_key, load_id, seen, status, load["from_city"], load["to_city"],
+                            str(load["weight"]), load["cargo_name"], load["response_count"],
+                            int(bool(load["can_renew"])),
+                        ),
+                    )
+                    cur.execute(
+                        "INSERT INTO search (manager, kind, load_id, ref, body) VALUES (?, 'load', ?, ?, ?)",
+                        (
+                            manager_key, load_id, cur.lastrowid,
+                            f"{load['from_city']} {load['to_city']} {load['cargo_name']} {load.get('load_number') or ''} {load_id}",
+                        ),
+                    )
+
+                for manager_key, load_id, response_id, seen, r, raw in responses:
+                    cur.execute(
+                        "INSERT INTO responses (manager, load_id, response_id, seen, outdated, raw)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (manager_key, load_id, response_id, seen, int(bool(r.get("IsOutdated"))), raw),
+                    )
+                    cur.execute(
+                        "INSERT INTO search (manager, kind, load_id, ref, body) VALUES (?, 'response', ?, ?, ?)",
+                        (manager_key, load_id, cur.lastrowid, _response_search_body(r)),
+                    )
+
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        if not self.pending:
+            return
+
+        loads, self._pending_loads = self._pending_loads, []
+        responses, self._pending_responses = self._pending_responses, []
+
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(self._write, loads, responses)
+        except sqlite3.Error as e:
+            logger.error("[Mirror] ошибка записи: %s", e)
+            return
+
+        logger.debug(
+            "[Mirror] записано грузов: %s, откликов: %s", len(loads), len(responses),
+            extra={"latency": round(time.monotonic() - started, 3)},
+        )
+
+    async def maybe_flush(self):
+        if self.pending >= self.batch_size:
+            await self.flush()
+
+    # -----------------------------------------
+    # Поиск и история
+    # -----------------------------------------
+
+    def _search(self, manager_key: str, text: str, limit: int) -> list:
+        query = _fts_query(text)
+        if not query:
+            return []
+
+        with self._lock:
+            hits = self._db.execute(
+                "SELECT kind, load_id, ref FROM search WHERE search MATCH ? AND manager = ?"
+                " ORDER BY rank LIMIT ?",
+                (query, manager_key, limit * 3),
+            ).fetchall()
+
+            results = []
+            seen = set()
+            for kind, load_id, ref in hits:
+                if kind == "load":
+                    if ("load", load_id) in seen:
+                        continue
+                    seen.add(("load", load_id))
+                    row = self._db.execute(
+                        "SELECT from_city, to_city, weight, seen FROM loads WHERE seq = ?", (ref,)
+                    ).fetchone()
+                    results.append({"kind": "load", "load_id": load_id, "row": row})
+                else:
+                    row = self._db.execute(
+                        "SELECT response_id, raw, seen FROM responses WHERE seq = ?", (ref,)
+                    ).fetchone()
+                    if row is None or ("response", row[0]) in seen:
+                        continue
+                    seen.add(("response", row[0]))
+                    results.append({"kind": "response", "load_id": load_id, "response": json.loads(row[1])})
+
+                if len(results) >= limit:
+                    break
+
+            return results
+
+    async def search(self, manager_key: str, text: str, limit: int = 20) -> list:
+        return await asyncio.to_thread(self._search, manager_key, text, limit)
+
+    def _history(self, manager_key: str, load_id: str) -> dict:
+        with self._lock:
+            snapshots = self._db.execute(
+                "SELECT seen, status, from_city, to_city, weight, response_count, can_renew"
+                " FROM loads WHERE manager = ? AND load_id = ? ORDER BY seq",
+                (manager_key, load_id),
+            ).fetchall()
+
+            # последняя версия каждого отклика
+            responses = self._db.execute(
+                "SELECT raw, seen FROM responses WHERE seq IN ("
+                " SELECT MAX(seq) FROM responses WHERE manager = ? AND load_id = ? GROUP BY response_id"
+                ") ORDER BY seq",
+                (manager_key, load_id),
+            ).fetchall()
+
+        return {
+            "snapshots": snapshots,
+            "responses": [json.loads(raw) for raw, _ in responses],
+        }
+
+    async def history(self, manager_key: str, load_id: str) -> dict:
+        return await asyncio.to_thread(self._history, manager_key, load_id)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_mirror: Mirror | None = None
+
+
+def get_mirror() -> Mirror:
+    """
+    Общее зеркало процесса; база открывается при первом обращении
+    """
+    global _mirror
+
+    if _mirror is None:
+        from config import MIRROR_DB_PATH, MIRROR_BATCH_SIZE
+        _mirror = Mirror(MIRROR_DB_PATH, batch_size=MIRROR_BATCH_SIZE)
+
+    return _mirror
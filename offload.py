@@ -0,0 +1,119 @@
+# =============================================
+# offload.py
+# Тяжёлая синхронная работа (разбор больших JSON, маппинг грузов,
+# отрисовка длинных списков) — в отдельном потоке, а не в цикле событий
+# =============================================
+
+import asyncio
+import functools
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from json.decoder import scanstring
+
+import metrics
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        from config import OFFLOAD_WORKERS
+        _executor = ThreadPoolExecutor(max_workers=OFFLOAD_WORKERS, thread_name_prefix="offload")
+
+    return _executor
+
+
+async def run(fn, *args, size: int, threshold: int, kind: str):
+    """
+    fn(*args) прямо в цикле, если size меньше порога, иначе — в пуле потоков
+    """
+    if size < threshold:
+        return fn(*args)
+
+    metrics.inc("offload_jobs", kind=kind)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args))
+
+
+# =============================================
+# Разбор JSON по частям
+# =============================================
+#
+# json.loads — один вызов C-кода, который держит GIL до конца: в потоке
+# он блокирует цикл событий так же, как и без потока. Здесь внешний массив
+# (и объекты-обёртки над ним, например {"loads": [...]}) обходится вручную,
+# а каждый элемент массива разбирается отдельным вызовом raw_decode —
+# между вызовами GIL отдаётся циклу.
+
+_decoder = json.JSONDecoder()
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+def _skip(text: str, idx: int) -> int:
+    return _WS.match(text, idx).end()
+
+
+def _value(text: str, idx: int):
+    idx = _skip(text, idx)
+    ch = text[idx:idx + 1]
+
+    if ch == "[":
+        items = []
+        idx = _skip(text, idx + 1)
+        if text[idx:idx + 1] == "]":
+            return items, idx + 1
+
+        while True:
+            item, idx = _decoder.raw_decode(text, _skip(text, idx))
+            items.append(item)
+
+            idx = _skip(text, idx)
+            ch = text[idx:idx + 1]
+            if ch == "]":
+                return items, idx + 1
+            if ch != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, idx)
+            idx += 1
+
+    if ch != "{":
+        return _decoder.raw_decode(text, idx)
+
+    obj = {}
+    idx = _skip(text, idx + 1)
+    if text[idx:idx + 1] == "}":
+        return obj, idx + 1
+
+    while True:
+        if text[idx:idx + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, idx)
+        key, idx = scanstring(text, idx + 1)
+
+        idx = _skip(text, idx)
+        if text[idx:idx + 1] != ":":
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, idx)
+
+        obj[key], idx = _value(text, idx + 1)
+
+        idx = _skip(text, idx)
+        ch = text[idx:idx + 1]
+        if ch == "}":
+            return obj, idx + 1
+        if ch != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, idx)
+        idx = _skip(text, idx + 1)
+
+
+def decode_json(text: str):
+    """
+    То же, что json.loads(text), но внешний массив — по элементам
+    """
+    value, idx = _value(text, 0)
+
+    idx = _skip(text, idx)
+    if idx != len(text):
+        raise json.JSONDecodeError("Extra data", text, idx)
+
+    return value
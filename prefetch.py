@@ -0,0 +1,172 @@
+# =============================================
+# prefetch.py
+# Упреждающая загрузка откликов: после уведомления «🔔 Новый отклик»
+# полный список откликов груза (и рейтинги перевозчиков) загружается
+# в фоне, чтобы кнопка «📋 Показать все отклики» отвечала из кэша
+# =============================================
+
+import asyncio
+import logging
+import time
+
+import metrics
+from ati_client import get_load_responses, get_firm_rating
+from render_cache import RenderCache
+
+logger = logging.getLogger("prefetch")
+
+
+def _firm_contact_ids(r: dict) -> tuple:
+    firm = r.get("FirmInfo") or {}
+    contact = firm.get("Contact") or {}
+
+    firm_id = firm.get("FirmId") or firm.get("Id") or r.get("FirmId")
+    contact_id = contact.get("Id") or r.get("ContactId")
+
+    return firm_id, contact_id
+
+
+class ResponsesPrefetcher:
+    """
+    Кэш откликов по (manager_key, load_id) с фоновым наполнением.
+
+    Бюджет: не больше max_concurrent загрузок одновременно, не больше
+    per_minute упреждающих загрузок в минуту на менеджера, каждая — не дольше
+    timeout секунд вместе с ожиданием очереди. Рейтинги догружаются только
+    для откликов без TotalScore и не больше max_ratings на груз.
+    В кэше — не больше max_entries грузов (LRU).
+    """
+
+    def __init__(self, ttl: float, max_concurrent: int, per_minute: int,
+                 timeout: float = 15.0, max_ratings: int = 10, max_entries: int = 200):
+        self.ttl = ttl
+        self.per_minute = per_minute
+        self.timeout = timeout
+        self.max_ratings = max_ratings
+
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        # (manager_key, load_id) -> (истекает, отклики)
+        self._cache = RenderCache(max_entries, name="prefetch")
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        # manager_key -> [начало минуты, запусков в минуте]
+        self._budget: dict[str, list] = {}
+
+    def _fresh(self, key: tuple) -> list | None:
+        entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        if entry:
+            self._cache.discard(key)
+        return None
+
+    def _take_budget(self, manager_key: str) -> bool:
+        now = time.monotonic()
+        window = self._budget.get(manager_key)
+
+        if window is None or now - window[0] >= 60:
+            self._budget[manager_key] = [now, 1]
+            return True
+
+        if window[1] >= self.per_minute:
+            return False
+
+        window[1] += 1
+        return True
+
+    def schedule(self, manager_key: str, load_id: str):
+        """
+        Запускает фоновую загрузку, если отклики груза ещё не в кэше
+        """
+        key = (manager_key, str(load_id))
+
+        if key in self._inflight or self._fresh(key) is not None:
+            return
+
+        if not self._take_budget(manager_key):
+            metrics.inc("prefetch_skipped_budget", manager=manager_key)
+            return
+
+        task = asyncio.create_task(self._prefetch(key))
+        self._inflight[key] = task
+        task.add_done_callback(self._forget_task(key))
+
+    def _forget_task(self, key: tuple):
+        def done(task: asyncio.Task):
+            # после invalidate на месте задачи может быть уже новая
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        return done
+
+    def invalidate(self, manager_key: str, load_id: str):
+        """
+        Убирает отклики из кэша; идущая загрузка устаревает — её результат
+        не кэшируется и не отдаётся, а schedule запустит новую
+        """
+        key = (manager_key, str(load_id))
+        self._cache.discard(key)
+        self._inflight.pop(key, None)
+
+    async def _prefetch(self, key: tuple) -> list | None:
+        manager_key, load_id = key
+
+        try:
+            # ожидание свободного места тоже в пределах timeout
+            responses = await asyncio.wait_for(self._load_limited(manager_key, load_id), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("prefetch_timeout", manager=manager_key)
+            logger.warning("упреждающая загрузка не уложилась в %s с", self.timeout,
+                           extra={"manager": manager_key, "load_id": load_id})
+            return None
+
+        # пустой ответ не кэшируем — это может быть ошибка ATI;
+        # устаревшую (invalidate во время загрузки) — тоже
+        if responses and self._inflight.get(key) is asyncio.current_task():
+            self._cache.put(key, (time.monotonic() + self.ttl, responses))
+
+        metrics.inc("prefetch_done", manager=manager_key)
+        return responses
+
+    async def _load_limited(self, manager_key: str, load_id: str) -> list:
+        async with self._semaphore:
+            return await self._load(manager_key, load_id)
+
+    async def _load(self, manager_key: str, load_id: str) -> list:
+        responses = await get_load_responses(manager_key, load_id)
+
+        missing = [
+            r for r in responses
+            if not r.get("IsOutdated")
+            and (r.get("FirmInfo") or {}).get("TotalScore") is None
+            and all(_firm_contact_ids(r))
+        ][:self.max_ratings]
+
+        if missing:
+            scores = await asyncio.gather(*(
+                get_firm_rating(manager_key, *_firm_contact_ids(r)) for r in missing
+            ))
+            for r, score in zip(missing, scores):
+                if score is not None:
+                    r.setdefault("FirmInfo", {})["TotalScore"] = score
+
+        return responses
+
+    async def get_responses(self, manager_key: str, load_id: str) -> list:
+        """
+        Отклики из кэша; если загрузка уже идёт — дожидаемся её; иначе обычный запрос
+        """
+        key = (manager_key, str(load_id))
+
+        cached = self._fresh(key)
+        if cached is not None:
+            metrics.inc("prefetch_hit", manager=manager_key)
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            metrics.inc("prefetch_join", manager=manager_key)
+            responses = await asyncio.shield(task)
+            if responses is not None:
+                return responses
+
+        metrics.inc("prefetch_miss", manager=manager_key)
+        return await get_load_responses(manager_key, load_id)
@@ -0,0 +1,89 @@
+# profile_startup.py
+# Время холодного старта: python profile_startup.py [--runs 5] [--top telegram_bot]
+#
+# Каждая цель запускается в отдельном процессе (python -c "..."), время
+# меряется внутри процесса — без старта самого интерпретатора. Берётся
+# минимум и медиана по нескольким запускам.
+# --top <цель> дополнительно показывает модули с самым долгим импортом
+# (по python -X importtime).
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+TARGETS = {
+    "config": "import config",
+    "ati_client": "import ati_client",
+    "scheduler": "import scheduler",
+    "telegram_bot": "import telegram_bot",
+    "create_app()": "import app; app.create_app()",
+    "fetch_cities": "import fetch_cities",
+    "check_contacts": "import check_contacts",
+}
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # токен нужен только для проверки формата, база состояния — во временной папке
+    env.setdefault("TELEGRAM_BOT_TOKEN", "42:PROFILE")
+    env.setdefault("STATE_DB_PATH", os.path.join(tempfile.mkdtemp(), "profile.sqlite3"))
+    return env
+
+
+def run_once(code: str, env: dict) -> float | None:
+    timed = f"import time\n_t = time.perf_counter()\n{code}\nprint(time.perf_counter() - _t)"
+    result = subprocess.run([sys.executable, "-c", timed], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    if result.returncode:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def import_top(code: str, env: dict, limit: int = 15) -> list:
+    """
+    [(собственное время, модуль), ...] по убыванию
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), name.strip()))
+
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", choices=TARGETS, help="самые долгие импорты для цели")
+    args = parser.parse_args()
+
+    env = _env()
+
+    # первый запуск прогревает дисковый кэш — не считаем
+    for code in TARGETS.values():
+        run_once(code, env)
+
+    print(f"{'цель':16} {'мин, мс':>9} {'медиана, мс':>12}")
+    for name, code in TARGETS.items():
+        times = [run_once(code, env) for _ in range(args.runs)]
+        if None in times:
+            print(f"{name:16} {'ошибка':>9}")
+            continue
+        print(f"{name:16} {min(times) * 1000:9.1f} {statistics.median(times) * 1000:12.1f}")
+
+    if args.top:
+        print(f"\nСамые долгие импорты ({args.top}):")
+        for self_us, module in import_top(TARGETS[args.top], env):
+            print(f"  {self_us / 1000:8.1f} мс  {module}")
+
+
+if __name__ == "__main__":
+    main()
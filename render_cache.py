@@ -0,0 +1,53 @@
+# =============================================
+# render_cache.py
+# Ограниченный LRU-кэш готовых HTML-фрагментов
+# =============================================
+
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    LRU на OrderedDict: при переполнении выкидывается давно не использованный фрагмент.
+    Под замком — длинные списки отрисовываются в пуле потоков (offload.py)
+    """
+
+    def __init__(self, maxsize: int, name: str = "render"):
+        self.maxsize = maxsize
+        self.name = name
+        self._items: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            if len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
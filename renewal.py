@@ -0,0 +1,68 @@
+# =============================================
+# renewal.py
+# Порядок автообновления грузов: когда обновлений меньше, чем грузов
+# (бюджет или 429 от ATI), первыми обновляются те, кому это нужнее
+# =============================================
+
+import time
+from datetime import datetime
+
+import metrics
+
+# Приоритет (меньше — раньше):
+#   1. закреплённые менеджером (📌);
+#   2. меньше откликов (OfferCount) — грузу больше всего нужна видимость;
+#   3. дольше всего не обновлялся ботом (никогда — считается самым старым).
+
+
+def priority(load: dict, pinned: set, last_renewed: dict, now: datetime) -> tuple:
+    renewed_at = last_renewed.get(load["id"])
+    age = (now - renewed_at).total_seconds() if renewed_at else float("inf")
+
+    return (
+        load["id"] not in pinned,
+        load["response_count"],
+        -age,
+    )
+
+
+def plan(loads: list, pinned: set, last_renewed: dict, budget: int = 0) -> tuple[list, list, list]:
+    """
+    (к обновлению по приоритету, сверх бюджета, обновлять нельзя);
+    budget=0 — без ограничения
+    """
+    now = datetime.now()
+
+    blocked = [load for load in loads if not load["can_renew"]]
+    ready = sorted(
+        (load for load in loads if load["can_renew"]),
+        key=lambda load: priority(load, pinned, last_renewed, now),
+    )
+
+    if budget and len(ready) > budget:
+        return ready[:budget], ready[budget:], blocked
+
+    return ready, [], blocked
+
+
+async def renew_in_order(manager_key: str, loads: list, renew) -> tuple[list, list]:
+    """
+    Обновляет грузы по очереди через renew(manager_key, load_id).
+    После 429 останавливается: (результаты, не дошедшие до очереди грузы).
+    У каждого результата — latency, время ответа ATI в секундах.
+    """
+    results = []
+
+    for i, load in enumerate(loads):
+        started = time.monotonic()
+        result = await renew(manager_key, load["id"])
+        result["latency"] = time.monotonic() - started
+        results.append((load, result))
+
+        metrics.observe("renew_latency_seconds", result["latency"], manager=manager_key)
+
+        if result.get("rate_limited"):
+            metrics.inc("renew_rate_limited", manager=manager_key)
+            return results, loads[i + 1:]
+
+    return results, []
@@ -0,0 +1,240 @@
+# replay.py
+# Воспроизведение кассеты (cassette.py) для нагрузочного теста:
+#   python replay.py traffic.jsonl.gz --speed 10 --as-manager alexander --with-jobs
+#
+# ATI подменяется локальным транспортом, отдающим записанные ответы,
+# Telegram — сессией-заглушкой без сети. Апдейты из кассеты идут в dp
+# с исходными интервалами, ускоренными в speed раз. База состояния и
+# зеркало — во временной папке, если STATE_DB_PATH / MIRROR_DB_PATH не заданы.
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+
+# до импорта config: Bot проверяет формат токена, а прогон не должен
+# писать в рабочие базы состояния и зеркала
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "42:REPLAY")
+_tmp_dir = tempfile.mkdtemp(prefix="replay-")
+os.environ.setdefault("STATE_DB_PATH", os.path.join(_tmp_dir, "state.sqlite3"))
+os.environ.setdefault("MIRROR_DB_PATH", os.path.join(_tmp_dir, "mirror.sqlite3"))
+
+import httpx
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Chat, Message, Update
+
+import ati_client
+import config
+from cassette import load_cassette
+from mirror import get_mirror
+from logs import setup_logging
+
+# Параметры запроса, которые меняются от запуска к запуску
+_VOLATILE_PARAMS = {"dateFrom"}
+
+
+def _request_key(method: str, path: str, params: dict) -> tuple:
+    stable = tuple(sorted((k, str(v)) for k, v in params.items() if k not in _VOLATILE_PARAMS))
+    return method, path, stable
+
+
+def _discard(queue: deque | None, entry: dict):
+    # по идентичности: одинаковые ответы — разные записи; последнюю оставляем для повторов
+    if not queue or len(queue) < 2:
+        return
+    for i, e in enumerate(queue):
+        if e is entry:
+            del queue[i]
+            return
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    Отдаёт записанные ответы ATI по порядку для каждого запроса;
+    когда записи кончаются — повторяет последнюю
+    """
+
+    def __init__(self, entries: list):
+        self._exact = defaultdict(deque)
+        self._by_path = defaultdict(deque)
+        self._last = {}
+        self.calls = 0
+
+        for e in entries:
+            self._exact[_request_key(e["method"], e["path"], e["params"])].append(e)
+            self._by_path[(e["method"], e["path"])].append(e)
+
+    def _pick(self, key: tuple):
+        exact = self._exact.get(key)
+        by_path = self._by_path.get(key[:2])
+        queue = exact or by_path
+
+        if queue:
+            entry = queue[0]
+            if len(queue) > 1:
+                queue.popleft()
+                # запись использована — убираем её и из второго индекса
+                if queue is exact:
+                    _discard(by_path, entry)
+                else:
+                    _discard(self._exact.get(_request_key(entry["method"], entry["path"], entry["params"])), entry)
+            self._last[key] = entry
+            return entry
+        return self._last.get(key)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        entry = self._pick(_request_key(request.method, request.url.path, dict(request.url.params)))
+
+        if entry is None:
+            return httpx.Response(404, json={"error": "not recorded"}, request=request)
+
+        body = entry["body"]
+        kwargs = {"text": body} if isinstance(body, str) else {"json": body}
+
+        return httpx.Response(entry["status"], headers=entry.get("headers"), request=request, **kwargs)
+
+
+class StubSession(BaseSession):
+    """
+    Сессия Telegram без сети: считает вызовы и возвращает правдоподобные ответы
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = defaultdict(int)
+        self._message_id = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+
+        if method.__returning__ is Message:
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", 0) or 0
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=int(chat_id), type="private"),
+            )
+
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        if False:
+            yield b""
+
+    async def close(self):
+        pass
+
+
+async def _feed_updates(dp, bot, updates: list, speed: float):
+    started = time.monotonic()
+
+    for entry in updates:
+        delay = entry["t"] / speed - (time.monotonic() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        update = Update.model_validate(entry["update"], context={"bot": bot})
+        await dp.feed_update(bot, update)
+
+
+async def _run_jobs(duration: float, speed: float):
+    from scheduler import check_new_responses_job, load_feed_job
+
+    interval = config.RESPONSES_CHECK_SECONDS / speed
+    feed_interval = config.LOAD_FEED_SECONDS / speed
+    deadline = time.monotonic() + duration
+    next_feed = 0.0
+
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        run_feed = now >= next_feed
+        if run_feed:
+            next_feed = now + feed_interval
+
+        for manager_key in config.MANAGERS:
+            await check_new_responses_job(manager_key)
+            if run_feed:
+                await load_feed_job(manager_key)
+
+        await asyncio.sleep(interval)
+
+
+def _update_user_id(update: dict) -> int | None:
+    for field in ("message", "callback_query", "edited_message"):
+        if field in update:
+            return (update[field].get("from") or {}).get("id")
+    return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение кассеты ATI/Telegram")
+    parser.add_argument("cassette")
+    parser.add_argument("--speed", type=float, default=1.0, help="1, 10, 100 ...")
+    parser.add_argument("--as-manager", help="считать всех пользователей из кассеты этим менеджером")
+    parser.add_argument("--with-jobs", action="store_true", help="гонять задачи планировщика")
+    args = parser.parse_args()
+
+    log_listener = setup_logging(config.LOG_LEVEL, config.LOG_JSON, config.LOG_SAMPLE_PER_MINUTE)
+
+    entries = load_cassette(args.cassette)
+    ati_entries = [e for e in entries if e["kind"] == "ati"]
+    updates = [e for e in entries if e["kind"] == "tg"]
+
+    transport = ReplayTransport(ati_entries)
+    ati_client.set_transport(transport)
+
+    from app import create_app
+    app = create_app()
+
+    session = StubSession()
+    app.bot.session = session
+
+    # уведомления должны куда-то уходить, даже если chat_id не настроены;
+    # реестр меняем только в памяти — файл MANAGERS_FILE не трогаем
+    user_ids = {_update_user_id(entry["update"]) for entry in updates} - {None}
+
+    for key in list(config.MANAGERS):
+        record = dict(config.MANAGERS[key])
+        if not record["chat_id"]:
+            record["chat_id"] = 1
+        if key == args.as_manager:
+            record["user_ids"] = sorted(set(record["user_ids"]) | user_ids)
+        elif args.as_manager:
+            record["user_ids"] = [u for u in record["user_ids"] if u not in user_ids]
+        config.MANAGERS.upsert(record, persist=False)
+
+    duration = (updates[-1]["t"] if updates else 0) / args.speed
+    if args.with_jobs:
+        duration = max(duration, (entries[-1]["t"] if entries else 0) / args.speed)
+
+    print(f"▶️ {len(updates)} апдейтов, {len(ati_entries)} ответов ATI, скорость {args.speed}x")
+
+    started = time.monotonic()
+    tasks = [_feed_updates(app.dp, app.bot, updates, args.speed)]
+    if args.with_jobs:
+        tasks.append(_run_jobs(duration, args.speed))
+    try:
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+    finally:
+        # как main.py: хвост зеркала и несброшенные FSM и сессии
+        mirror = get_mirror()
+        await mirror.flush()
+        mirror.close()
+        await app.dp.storage.close()
+
+    print(f"⏹ готово за {elapsed:.1f} с")
+    print(f"   запросов к ATI: {transport.calls}")
+    for name, count in sorted(session.calls.items()):
+        print(f"   {name}: {count}")
+
+    log_listener.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,22 +1,101 @@
+import asyncio
+import logging
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta
 
-from config import MANAGERS, UPDATE_INTERVAL_MINUTES
+from config import (
+    MANAGERS,
+    UPDATE_INTERVAL_MINUTES,
+    LOAD_FEED_SECONDS,
+    RESPONSES_CHECK_SECONDS,
+    UPDATE_JOB_DEADLINE_SECONDS,
+    RESPONSES_JOB_DEADLINE_SECONDS,
+    FEED_JOB_DEADLINE_SECONDS,
+    MIRROR_FLUSH_SECONDS,
+    MANAGERS_RELOAD_SECONDS,
+    SUBSCRIPTIONS_FILE,
+    SUBSCRIPTIONS_RELOAD_SECONDS,
+    RENEW_BUDGET_PER_RUN,
+)
 from state import (
     is_auto_update_enabled,
+    forget_load,
     set_last_update_time,
+    get_last_renewed,
+    set_load_renewed,
+    get_pinned_loads,
     get_last_response_check,
     set_last_response_check,
+    add_known_response,
+    is_known_response,
 )
 
 from ati_client import (
-    get_my_loads,
+    IncompleteLoadsError,
+    get_load_responses,
     renew_load,
-    parse_load,
     get_new_responses,
 )
+from load_feed import (
+    poll_load_changes,
+    iter_loads,
+    note_response_sent,
+    LOAD_NEW,
+    LOAD_REMOVED,
+    OFFERS_INCREASED,
+    RENEW_CHANGED,
+)
+from mirror import get_mirror
+from subscriptions import get_subscriptions
+from analytics import price_analytics
+
+import job_policy
+import renewal
+
+logger = logging.getLogger("scheduler")
 
-scheduler = AsyncIOScheduler()
+scheduler = AsyncIOScheduler(job_defaults=job_policy.JOB_DEFAULTS)
+
+# Куда отправлять уведомления — подключается фабрикой приложения (app.py),
+# чтобы планировщик не импортировал telegram_bot
+_notifier: dict = {}
+
+
+def bind_notifier(new_response, update_result):
+    _notifier["new_response"] = new_response
+    _notifier["update_result"] = update_result
+
+
+def _notify(kind: str):
+    notifier = _notifier.get(kind)
+    if notifier is None:
+        raise RuntimeError(
+            f"scheduler: уведомления не подключены ({kind}) — "
+            "создайте приложение через app.create_app() или вызовите bind_notifier()"
+        )
+    return notifier
+
+
+# Отклик отправляют и проверка новых откликов, и лента изменений:
+# проверка known_responses -> отправка -> отметка идут под замком менеджера
+_response_locks: dict = {}
+
+
+async def _send_response(manager_key: str, load: dict, r: dict) -> bool:
+    """
+    Отправляет отклик, если он ещё не известен; True — если отправлен.
+    Известным он становится только после отправки в чат менеджера.
+    """
+    load_id = str(load["id"])
+    response_id = str(r.get("ResponseId"))
+
+    async with _response_locks.setdefault(manager_key, asyncio.Lock()):
+        if is_known_response(manager_key, load_id, response_id):
+            return False
+        await _notify("new_response")(manager_key, load, [r])
+        add_known_response(manager_key, load_id, response_id)
+        return True
 
 
 # =============================================
@@ -27,48 +106,94 @@ async def update_loads_job(manager_key: str):
     if not is_auto_update_enabled(manager_key):
         return
 
-    print(f"[{manager_key}] автообновление грузов")
+    logger.info("автообновление грузов", extra={"manager": manager_key})
+
+    # для приоритета нужен весь список — собираем страницы целиком
+    # (список из ленты изменений, если она опрашивала ATI недавно)
+    loads = []
+    complete = True
+    try:
+        async for page in iter_loads(manager_key):
+            loads.extend(page)
+    except IncompleteLoadsError:
+        complete = False
+        logger.warning("список грузов неполный, обновляются полученные",
+                       extra={"manager": manager_key})
 
-    loads_raw = await get_my_loads(manager_key)
-    if not loads_raw:
+    # новый запуск — лента снова может обновлять грузы после 429
+    _feed_renew_paused.discard(manager_key)
+
+    if not loads:
         return
 
-    results = []
+    # снятые с публикации грузы больше не нужны в истории обновлений и закреплённых
+    # (только по полному списку — иначе пропали бы грузы с недополученных страниц)
+    if complete:
+        current = {load["id"] for load in loads}
+        for load_id in (set(get_last_renewed(manager_key)) | get_pinned_loads(manager_key)) - current:
+            forget_load(manager_key, load_id)
 
-    for load_raw in loads_raw:
-        load = parse_load(load_raw)
-
-        if not load["can_renew"]:
-            results.append({
-                "success": False,
-                "from_city": load["from_city"],
-                "to_city": load["to_city"],
-                "weight": load["weight"],
-                "reason": load["renew_restriction"] or "ещё не прошёл час",
-                "load_id": load["id"],
-            })
-            continue
+    queue, over_budget, blocked = renewal.plan(
+        loads, get_pinned_loads(manager_key), get_last_renewed(manager_key), RENEW_BUDGET_PER_RUN,
+    )
 
-        result = await renew_load(manager_key, load["id"])
+    renewed, rate_limited = await renewal.renew_in_order(manager_key, queue, renew_load)
 
-        result.update({
+    def result_for(load: dict, **fields) -> dict:
+        return {
             "from_city": load["from_city"],
             "to_city": load["to_city"],
             "weight": load["weight"],
             "load_id": load["id"],
-        })
+            **fields,
+        }
+
+    results = []
+
+    for load, result in renewed:
+        if result.get("success"):
+            set_load_renewed(manager_key, load["id"])
+        results.append(result_for(load, **result))
+
+    if rate_limited:
+        logger.warning(
+            "ATI ограничил обновления, отложено грузов: %s", len(rate_limited),
+            extra={"manager": manager_key},
+        )
+
+    for load in rate_limited:
+        results.append(result_for(load, success=False, reason="отложено: лимит запросов ATI"))
+
+    for load in over_budget:
+        results.append(result_for(load, success=False, reason="отложено: исчерпан бюджет обновлений"))
 
-        results.append(result)
+    for load in blocked:
+        results.append(result_for(
+            load, success=False, reason=load["renew_restriction"] or "ещё не прошёл час",
+        ))
 
     set_last_update_time(manager_key)
 
-    from telegram_bot import notify_update_result
-    await notify_update_result(manager_key, results)
+    await _notify("update_result")(manager_key, results)
 
 
 # =============================================
 # ⚡ НОВЫЕ ОТКЛИКИ
 # =============================================
+async def _loads_map(manager_key: str, fresh: bool = False) -> tuple[dict, bool]:
+    """
+    load_id -> груз и признак, что список полный
+    """
+    loads_map = {}
+    try:
+        async for page in iter_loads(manager_key, fresh=fresh):
+            for load in page:
+                loads_map[str(load["id"])] = load
+    except IncompleteLoadsError:
+        return loads_map, False
+    return loads_map, True
+
+
 async def check_new_responses_job(manager_key: str):
 
     last_check = get_last_response_check(manager_key)
@@ -85,58 +210,274 @@ async def check_new_responses_job(manager_key: str):
         return
 
     # 👉 получаем только свои грузы
-    loads_raw = await get_my_loads(manager_key)
+    loads_map, complete = await _loads_map(manager_key)
 
-    loads_map = {}
-    for l in loads_raw:
-        parsed = parse_load(l)
-        loads_map[str(parsed["id"])] = parsed
+    # отклик на груз, выложенный после опроса ленты, — список перезагружается
+    if any(str(r.get("LoadId")) not in loads_map for r in responses):
+        loads_map, complete = await _loads_map(manager_key, fresh=True)
 
-    from telegram_bot import notify_new_response
+    mirror = get_mirror()
+    retry = False
 
     for r in responses:
-        print("👉 NEW RESPONSE:", r.get("ResponseId"), r.get("LoadId"))
-
         load_id = str(r.get("LoadId"))
+        log_fields = {"manager": manager_key, "load_id": load_id, "response_id": r.get("ResponseId")}
+
+        logger.info("👉 NEW RESPONSE", extra=log_fields)
 
         # ❗ ключевая проверка — только свои грузы
         if load_id not in loads_map:
-            print(f"⛔ Пропуск: груз {load_id} не принадлежит {manager_key}")
+            # при неполном списке это может быть свой груз с недополученной страницы
+            if not complete:
+                retry = True
+            logger.debug("⛔ Пропуск: груз не принадлежит менеджеру", extra=log_fields)
             continue
 
-        load = loads_map[load_id]
+        mirror.add_responses(manager_key, load_id, [r])
+
+        # уже отправленный лентой изменений (load_feed_job) пропускается;
+        # ошибка отправки в чат менеджера поднимается дальше: отклик не помечается
+        # известным и время проверки не сдвигается — он придёт при следующем опросе
+        if await _send_response(manager_key, loads_map[load_id], r):
+            logger.info("🔥 SENT TO TELEGRAM", extra=log_fields)
+            note_response_sent(manager_key, load_id)
+
+    if retry:
+        # время проверки не сдвигаем — пропущенные отклики придут при следующем
+        # опросе, уже отправленные отсекутся по known_responses
+        logger.warning("список грузов неполный, отклики будут проверены повторно",
+                       extra={"manager": manager_key})
+    else:
+        set_last_response_check(manager_key, datetime.utcnow())
+    await mirror.maybe_flush()
+
+
+# =============================================
+# 📈 ЛЕНТА ИЗМЕНЕНИЙ ГРУЗОВ (fallback для /loads/new/responses)
+# =============================================
+def _response_order(r: dict) -> tuple:
+    # ResponseId растёт со временем; нечисловые — после числовых
+    response_id = str(r.get("ResponseId"))
+    return (0, int(response_id), "") if response_id.isdigit() else (1, 0, response_id)
+
+
+async def notify_offers_delta(manager_key: str, load: dict, delta: int):
+    """
+    Догружает отклики груза, у которого вырос OfferCount, и отправляет
+    те, что ещё не были отправлены (не больше, чем прирост счётчика).
+    Отклики, отправленные основным путём, в прирост уже не входят —
+    их учитывает note_response_sent.
+    """
+    responses = await get_load_responses(manager_key, load["id"])
+    get_mirror().add_responses(manager_key, load["id"], responses)
+
+    unknown = [
+        r for r in responses
+        if not r.get("IsOutdated")
+        and not is_known_response(manager_key, load["id"], str(r.get("ResponseId")))
+    ]
+
+    if not unknown:
+        return
+
+    # порядок ответа ATI не гарантирован — новые отклики в конце
+    unknown.sort(key=_response_order)
+
+    # остальные неизвестные отклики — старые, до первого снимка
+    for r in unknown[:-delta]:
+        add_known_response(manager_key, load["id"], str(r.get("ResponseId")))
+
+    for r in unknown[-delta:]:
+        logger.info(
+            "📈 отклик из ленты изменений",
+            extra={"manager": manager_key, "load_id": load["id"], "response_id": r.get("ResponseId")},
+        )
+        await _send_response(manager_key, load, r)
+
+    price_analytics.record_many(load, responses)
+
+
+# Менеджеры, у которых ATI ответил 429 на обновление из ленты: до следующего
+# update_loads_job лента грузы не обновляет
+_feed_renew_paused: set = set()
+
+
+async def renew_from_feed(manager_key: str, loads: list):
+    """
+    Обновляет грузы, которые лента увидела снова доступными для обновления,
+    в порядке и в пределах бюджета renewal.plan
+    """
+    if manager_key in _feed_renew_paused:
+        return
+
+    queue, _, _ = renewal.plan(
+        loads, get_pinned_loads(manager_key), get_last_renewed(manager_key), RENEW_BUDGET_PER_RUN,
+    )
+    renewed, rate_limited = await renewal.renew_in_order(manager_key, queue, renew_load)
+
+    for load, result in renewed:
+        if result.get("success"):
+            set_load_renewed(manager_key, load["id"])
+        logger.info(
+            "обновление по ленте: %s", result,
+            extra={"manager": manager_key, "load_id": load["id"]},
+        )
+
+    if any(result.get("rate_limited") for _, result in renewed):
+        # остальные грузы обновит плановый запуск
+        _feed_renew_paused.add(manager_key)
+        logger.warning(
+            "ATI ограничил обновления из ленты, отложено грузов: %s", len(rate_limited),
+            extra={"manager": manager_key},
+        )
+
+
+async def load_feed_job(manager_key: str):
+
+    mirror = get_mirror()
+    renewable = []
+
+    events = await poll_load_changes(
+        manager_key,
+        on_load=lambda load: mirror.add_load(manager_key, load),
+    )
 
-        print("🔥 SENDING TO TELEGRAM", manager_key)
+    for event in events:
+        load = event["load"]
 
-        await notify_new_response(manager_key, load, [r])
+        if event["type"] == LOAD_REMOVED:
+            mirror.remove_load(manager_key, event["load_id"])
+            forget_load(manager_key, event["load_id"])
 
-    set_last_response_check(manager_key, datetime.utcnow())
+        elif event["type"] in (LOAD_NEW, OFFERS_INCREASED):
+            delta = event["new_count"] - event["old_count"]
+            if delta > 0:
+                await notify_offers_delta(manager_key, load, delta)
+
+        elif event["type"] == RENEW_CHANGED:
+            # груз снова можно поднять — обновляем только такие, не весь список
+            if event["can_renew"] and is_auto_update_enabled(manager_key):
+                renewable.append(load)
+
+    if renewable:
+        await renew_from_feed(manager_key, renewable)
+
+
+# =============================================
+# 🗃 ЗАПИСЬ ЗЕРКАЛА
+# =============================================
+async def mirror_flush_job():
+    await get_mirror().flush()
 
 
 # =============================================
 # 🚀 ЗАПУСК
 # =============================================
+def add_manager_job(job, kind: str, manager_key: str,
+                    interval_seconds: int, deadline_seconds: int, first_run: datetime):
+    scheduler.add_job(
+        job_policy.with_deadline(job, deadline_seconds, interval_seconds),
+        trigger="interval",
+        seconds=interval_seconds,
+        args=[manager_key],
+        id=f"{kind}_{manager_key}",
+        next_run_time=first_run,
+        misfire_grace_time=job_policy.misfire_grace_seconds(interval_seconds),
+    )
+
+
+# виды задач, которые заводятся на каждого менеджера
+MANAGER_JOB_KINDS = ("update", "responses", "feed")
+
+
+def add_manager_jobs(manager_key: str):
+
+    add_manager_job(
+        update_loads_job, "update", manager_key,
+        interval_seconds=UPDATE_INTERVAL_MINUTES * 60,
+        deadline_seconds=UPDATE_JOB_DEADLINE_SECONDS,
+        first_run=datetime.now() + timedelta(hours=1),
+    )
+
+    add_manager_job(
+        check_new_responses_job, "responses", manager_key,
+        interval_seconds=RESPONSES_CHECK_SECONDS,
+        deadline_seconds=RESPONSES_JOB_DEADLINE_SECONDS,
+        first_run=datetime.now() + timedelta(seconds=10),
+    )
+
+    add_manager_job(
+        load_feed_job, "feed", manager_key,
+        interval_seconds=LOAD_FEED_SECONDS,
+        deadline_seconds=FEED_JOB_DEADLINE_SECONDS,
+        first_run=datetime.now() + timedelta(seconds=15),
+    )
+
+
+def remove_manager_jobs(manager_key: str):
+    for kind in MANAGER_JOB_KINDS:
+        if scheduler.get_job(f"{kind}_{manager_key}"):
+            scheduler.remove_job(f"{kind}_{manager_key}")
+    _response_locks.pop(manager_key, None)
+    _feed_renew_paused.discard(manager_key)
+
+
+def _on_managers_changed(added: list, removed: list):
+    # реестр изменился на ходу — трогаем задачи только этих менеджеров
+    for manager_key in removed:
+        remove_manager_jobs(manager_key)
+        logger.info("задачи сняты", extra={"manager": manager_key})
+
+    for manager_key in added:
+        add_manager_jobs(manager_key)
+        logger.info("задачи добавлены", extra={"manager": manager_key})
+
+
+# =============================================
+# 👥 ПЕРЕЧИТЫВАНИЕ РЕЕСТРА МЕНЕДЖЕРОВ
+# =============================================
+async def managers_reload_job():
+    MANAGERS.reload_if_changed()
+
+
+async def subscriptions_reload_job():
+    get_subscriptions().reload_if_changed()
+
+
 def start_scheduler():
 
-    for manager_key in MANAGERS.keys():
+    job_policy.install(scheduler)
 
+    scheduler.add_job(
+        mirror_flush_job,
+        trigger="interval",
+        seconds=MIRROR_FLUSH_SECONDS,
+        id="mirror",
+        misfire_grace_time=job_policy.misfire_grace_seconds(MIRROR_FLUSH_SECONDS),
+    )
+
+    if MANAGERS.path:
         scheduler.add_job(
-            update_loads_job,
+            managers_reload_job,
             trigger="interval",
-            minutes=UPDATE_INTERVAL_MINUTES,
-            args=[manager_key],
-            id=f"update_{manager_key}",
-            next_run_time=datetime.now() + timedelta(hours=1),
+            seconds=MANAGERS_RELOAD_SECONDS,
+            id="managers",
+            misfire_grace_time=job_policy.misfire_grace_seconds(MANAGERS_RELOAD_SECONDS),
         )
 
+    if SUBSCRIPTIONS_FILE:
         scheduler.add_job(
-            check_new_responses_job,
+            subscriptions_reload_job,
             trigger="interval",
-            seconds=10,
-            args=[manager_key],
-            id=f"responses_{manager_key}",
-            next_run_time=datetime.now() + timedelta(seconds=10),
+            seconds=SUBSCRIPTIONS_RELOAD_SECONDS,
+            id="subscriptions",
+            misfire_grace_time=job_policy.misfire_grace_seconds(SUBSCRIPTIONS_RELOAD_SECONDS),
         )
 
+    for manager_key in MANAGERS.keys():
+        add_manager_jobs(manager_key)
+
+    MANAGERS.subscribe(_on_managers_changed)
+
     scheduler.start()
-    print("✅ scheduler запущен")
\ No newline at end of file
+    logger.info("✅ scheduler запущен")
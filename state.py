@@ -1,31 +1,105 @@
 # state.py
 
+import time
 from datetime import datetime
 from config import MANAGERS
 
-# Состояние для каждого менеджера — при старте автообновление ВЫКЛЮЧЕНО
-state = {
-    key: {
+def _new_manager_state() -> dict:
+    return {
         "auto_update": False,
         "last_update_time": None,
         # известные отклики: load_id -> [response_id, ...]
         "known_responses": {},
         # инициализированы ли known_responses при первом запуске планировщика
         "responses_initialized": False,
+        # последний снимок грузов для ленты изменений: load_id -> (OfferCount, CanBeRenewed)
+        "load_snapshot": None,
+        # разобранные грузы из последнего опроса ленты и когда он был (time.monotonic)
+        "feed_loads": None,
+        "feed_loads_at": 0.0,
+        # когда бот последний раз обновил груз: load_id -> datetime
+        # (вместе с pinned_loads сохраняется в хранилище сессий)
+        "last_renewed": {},
+        # грузы, закреплённые менеджером (📌) — обновляются первыми
+        "pinned_loads": set(),
     }
-    for key in MANAGERS.keys()
-}
+
+
+class _ManagerStates(dict):
+    """
+    manager_key -> состояние; запись создаётся при первом обращении,
+    чтобы импорт state не читал реестр менеджеров
+    """
+
+    def __missing__(self, key: str) -> dict:
+        if key not in MANAGERS:
+            raise KeyError(key)
+        return self.setdefault(key, _new_manager_state())
+
+
+# Состояние для каждого менеджера — при старте автообновление ВЫКЛЮЧЕНО
+state = _ManagerStates()
+
+
+def _on_managers_changed(added: list, removed: list):
+    # менеджеры из реестра, добавленные на ходу, получают чистое состояние
+    for key in added:
+        state.setdefault(key, _new_manager_state())
+    for key in removed:
+        state.pop(key, None)
+        for chat_id in [c for c, m in active_managers.items() if m == key]:
+            del active_managers[chat_id]
+
+
+MANAGERS.subscribe(_on_managers_changed)
 
 # Активный менеджер для каждого chat_id (chat_id -> manager_key)
 active_managers: dict[int, str] = {}
 
+# Постоянное хранилище сессий (storage.SQLiteStorage), подключается при старте бота
+_session_store = None
+
+
+def _on_sessions_expired(chat_ids: list):
+    # сессии, удалённые хранилищем по TTL, — больше не активны
+    for chat_id in chat_ids:
+        active_managers.pop(chat_id, None)
+
+
+def bind_session_store(store):
+    global _session_store
+    _session_store = store
+    active_managers.update(store.load_sessions())
+    store.subscribe_expired(_on_sessions_expired)
+
+    pinned_loads, last_renewed = store.load_manager_loads()
+    for manager_key in MANAGERS.keys():
+        manager_state = state[manager_key]
+        manager_state["pinned_loads"] |= pinned_loads.get(manager_key, set())
+        manager_state["last_renewed"].update({
+            load_id: datetime.fromtimestamp(ts)
+            for load_id, ts in last_renewed.get(manager_key, {}).items()
+        })
+
 
 def get_active_manager(chat_id: int) -> str | None:
-    return active_managers.get(chat_id)
+    if not _session_store:
+        return active_managers.get(chat_id)
+
+    # хранилище перечитывает сессию из базы — её мог сменить другой процесс
+    manager_key = _session_store.get_session(chat_id)
+    if manager_key not in MANAGERS:
+        active_managers.pop(chat_id, None)
+        return None
+
+    active_managers[chat_id] = manager_key
+    return manager_key
 
 
 def set_active_manager(chat_id: int, manager_key: str):
     active_managers[chat_id] = manager_key
+    if _session_store:
+        _session_store.set_session(chat_id, manager_key)
 
 
 def is_auto_update_enabled(manager_key: str) -> bool:
@@ -49,6 +123,33 @@ def get_last_update_time(manager_key: str) -> datetime | None:
     return state[manager_key]["last_update_time"]
 
 
+def get_last_renewed(manager_key: str) -> dict:
+    return state[manager_key]["last_renewed"]
+
+
+def set_load_renewed(manager_key: str, load_id: str):
+    now = datetime.now()
+    state[manager_key]["last_renewed"][load_id] = now
+    if _session_store:
+        _session_store.set_renewed(manager_key, load_id, now.timestamp())
+
+
+def get_pinned_loads(manager_key: str) -> set:
+    return state[manager_key]["pinned_loads"]
+
+
+def toggle_pinned_load(manager_key: str, load_id: str) -> bool:
+    pinned = state[manager_key]["pinned_loads"]
+    if load_id in pinned:
+        pinned.discard(load_id)
+    else:
+        pinned.add(load_id)
+
+    if _session_store:
+        _session_store.set_pinned(manager_key, load_id, load_id in pinned)
+    return load_id in pinned
+
+
 def get_known_responses(manager_key: str) -> dict:
     return state[manager_key]["known_responses"]
 
@@ -59,6 +160,10 @@ def add_known_response(manager_key: str, load_id: str, response_id: str):
     state[manager_key]["known_responses"][load_id].append(response_id)
 
 
+def is_known_response(manager_key: str, load_id: str, response_id: str) -> bool:
+    return response_id in state[manager_key]["known_responses"].get(load_id, ())
+
+
 def is_responses_initialized(manager_key: str) -> bool:
     return state[manager_key]["responses_initialized"]
 
@@ -66,6 +171,50 @@ def is_responses_initialized(manager_key: str) -> bool:
 def set_responses_initialized(manager_key: str):
     state[manager_key]["responses_initialized"] = True
 
+def get_load_snapshot(manager_key: str) -> dict | None:
+    return state[manager_key]["load_snapshot"]
+
+
+def set_load_snapshot(manager_key: str, snapshot: dict):
+    state[manager_key]["load_snapshot"] = snapshot
+
+
+def get_feed_loads(manager_key: str, max_age: float) -> list | None:
+    manager_state = state[manager_key]
+    if manager_state["feed_loads"] is None:
+        return None
+    if time.monotonic() - manager_state["feed_loads_at"] > max_age:
+        return None
+    return manager_state["feed_loads"]
+
+
+def set_feed_loads(manager_key: str, loads: list):
+    state[manager_key]["feed_loads"] = loads
+    state[manager_key]["feed_loads_at"] = time.monotonic()
+
+
+def forget_load(manager_key: str, load_id: str):
+    # груз снят с публикации — его отклики, закрепление и история обновлений не нужны
+    manager_state = state[manager_key]
+    manager_state["known_responses"].pop(load_id, None)
+
+    if _session_store and load_id in manager_state["pinned_loads"]:
+        _session_store.set_pinned(manager_key, load_id, False)
+    if _session_store and load_id in manager_state["last_renewed"]:
+        _session_store.set_renewed(manager_key, load_id, None)
+
+    manager_state["pinned_loads"].discard(load_id)
+    manager_state["last_renewed"].pop(load_id, None)
+
+    # и из ленты: список заменяется целиком — его может перебирать iter_loads
+    if manager_state["load_snapshot"]:
+        manager_state["load_snapshot"].pop(load_id, None)
+    if manager_state["feed_loads"]:
+        manager_state["feed_loads"] = [
+            load for load in manager_state["feed_loads"] if str(load["id"]) != load_id
+        ]
+
+
 _last_response_check = {}
 
 def get_last_response_check(manager):
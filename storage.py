@@ -0,0 +1,414 @@
+# =============================================
+# storage.py
+# Постоянное хранилище FSM и сессий на SQLite
+# с отложенной записью (write-back) и TTL неактивных сессий
+# =============================================
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger("storage")
+
+# Как часто переписывать время последнего обращения при одном только чтении
+_TOUCH_RESOLUTION = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fsm (
+    key TEXT PRIMARY KEY,
+    state TEXT,
+    data TEXT NOT NULL,
+    touched REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    chat_id INTEGER PRIMARY KEY,
+    manager_key TEXT NOT NULL,
+    touched REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pinned_loads (
+    manager TEXT NOT NULL,
+    load_id TEXT NOT NULL,
+    PRIMARY KEY (manager, load_id)
+);
+CREATE TABLE IF NOT EXISTS renewed_loads (
+    manager TEXT NOT NULL,
+    load_id TEXT NOT NULL,
+    renewed REAL NOT NULL,
+    PRIMARY KEY (manager, load_id)
+);
+CREATE INDEX IF NOT EXISTS fsm_touched ON fsm (touched);
+CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched);
+"""
+
+
+def _key_str(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id,
+        key.chat_id,
+        key.user_id,
+        key.thread_id,
+        key.business_connection_id,
+        key.destiny,
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище aiogram поверх SQLite (WAL, можно открыть из нескольких процессов).
+
+    Чтение и запись идут в кэш в памяти; изменения сбрасываются в базу
+    фоновой задачей раз в flush_interval секунд одной транзакцией.
+    Записи кэша без несохранённых изменений перечитываются из базы не реже
+    раза в refresh_interval секунд — так процессы с общим файлом видят
+    изменения друг друга (с этой задержкой; при одновременной записи
+    одного ключа побеждает последний сброс).
+    Записи, к которым не обращались дольше ttl секунд, удаляются.
+    Тот же файл хранит сессии (chat_id -> manager_key), закреплённые грузы
+    и время последнего обновления грузов ботом для state.py.
+    """
+
+    def __init__(self, path: str, ttl: float, flush_interval: float = 1.0,
+                 refresh_interval: float = 5.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db_lock = threading.Lock()
+
+        # key -> {"state", "data", "touched", "stored_touched", "loaded"}
+        self._fsm: dict[str, dict] = {}
+        # chat_id -> {"manager_key", "touched", "stored_touched", "loaded"}
+        self._sessions: dict[int, dict] = {}
+        self._dirty_fsm: set[str] = set()
+        self._dirty_sessions: set[int] = set()
+        # (manager, load_id) -> закреплён / время обновления (None — удалить)
+        self._dirty_pins: dict[tuple, bool] = {}
+        self._dirty_renewed: dict[tuple, float | None] = {}
+        # callback(chat_ids) — сессии, удалённые по TTL
+        self._expire_listeners: list = []
+
+        self._flusher: asyncio.Task | None = None
+        self._last_expire = time.time()
+
+    # -----------------------------------------
+    # FSM
+    # -----------------------------------------
+
+    def _is_stale(self, entry: dict | None, dirty: bool) -> bool:
+        # несохранённые изменения этого процесса важнее того, что в базе
+        if entry is None:
+            return True
+        return not dirty and time.time() - entry["loaded"] > self.refresh_interval
+
+    def _fsm_entry(self, key: str) -> dict:
+        entry = self._fsm.get(key)
+
+        if self._is_stale(entry, key in self._dirty_fsm):
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT state, data, touched FROM fsm WHERE key = ?", (key,)
+                ).fetchone()
+
+            if row:
+                entry = {"state": row[0], "data": json.loads(row[1]), "stored_touched": row[2]}
+            else:
+                entry = {"state": None, "data": {}, "stored_touched": 0.0}
+
+            entry["loaded"] = time.time()
+            self._fsm[key] = entry
+
+        entry["touched"] = time.time()
+        if entry["touched"] - entry["stored_touched"] > _TOUCH_RESOLUTION:
+            self._mark_fsm(key)
+
+        return entry
+
+    def _mark_fsm(self, key: str):
+        self._dirty_fsm.add(key)
+        self._ensure_flusher()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key_str(key)
+        entry = self._fsm_entry(k)
+        entry["state"] = state.state if isinstance(state, State) else state
+        self._mark_fsm(k)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._fsm_entry(_key_str(key))["state"]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = _key_str(key)
+        entry = self._fsm_entry(k)
+        entry["data"] = data.copy()
+        self._mark_fsm(k)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._fsm_entry(_key_str(key))["data"].copy()
+
+    # -----------------------------------------
+    # Сессии: chat_id -> manager_key
+    # -----------------------------------------
+
+    def load_sessions(self) -> dict[int, str]:
+        cutoff = time.time() - self.ttl
+
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT chat_id, manager_key, touched FROM sessions WHERE touched >= ?", (cutoff,)
+            ).fetchall()
+
+        now = time.time()
+        for chat_id, manager_key, touched in rows:
+            self._sessions[chat_id] = {
+                "manager_key": manager_key,
+                "touched": touched,
+                "stored_touched": touched,
+                "loaded": now,
+            }
+
+        return {chat_id: manager_key for chat_id, manager_key, _ in rows}
+
+    def set_session(self, chat_id: int, manager_key: str):
+        now = time.time()
+        self._sessions[chat_id] = {
+            "manager_key": manager_key,
+            "touched": now,
+            "stored_touched": self._sessions.get(chat_id, {}).get("stored_touched", 0.0),
+            "loaded": now,
+        }
+        self._dirty_sessions.add(chat_id)
+        self._ensure_flusher()
+
+    def get_session(self, chat_id: int) -> str | None:
+        """
+        manager_key сессии (с перечитыванием из базы, если запись устарела)
+        и отметка об обращении
+        """
+        entry = self._sessions.get(chat_id)
+
+        if self._is_stale(entry, chat_id in self._dirty_sessions):
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT manager_key, touched FROM sessions WHERE chat_id = ? AND touched >= ?",
+                    (chat_id, time.time() - self.ttl),
+                ).fetchone()
+
+            if row is None:
+                self._sessions.pop(chat_id, None)
+                return None
+
+            entry = {"manager_key": row[0], "stored_touched": row[1], "loaded": time.time()}
+            self._sessions[chat_id] = entry
+
+        self.touch_session(chat_id)
+        return entry["manager_key"]
+
+    def touch_session(self, chat_id: int):
+        entry = self._sessions.get(chat_id)
+        if entry is None:
+            return
+
+        entry["touched"] = time.time()
+        if entry["touched"] - entry["stored_touched"] > _TOUCH_RESOLUTION:
+            self._dirty_sessions.add(chat_id)
+            self._ensure_flusher()
+
+    # -----------------------------------------
+    # Грузы менеджеров: закрепление и последнее обновление
+    # -----------------------------------------
+
+    def load_manager_loads(self) -> tuple[dict, dict]:
+        """
+        ({manager: {load_id, ...}}, {manager: {load_id: renewed}})
+        """
+        with self._db_lock:
+            pins = self._db.execute("SELECT manager, load_id FROM pinned_loads").fetchall()
+            renewed = self._db.execute("SELECT manager, load_id, renewed FROM renewed_loads").fetchall()
+
+        pinned_loads: dict[str, set] = {}
+        for manager, load_id in pins:
+            pinned_loads.setdefault(manager, set()).add(load_id)
+
+        last_renewed: dict[str, dict] = {}
+        for manager, load_id, ts in renewed:
+            last_renewed.setdefault(manager, {})[load_id] = ts
+
+        return pinned_loads, last_renewed
+
+    def set_pinned(self, manager: str, load_id: str, pinned: bool):
+        self._dirty_pins[(manager, load_id)] = pinned
+        self._ensure_flusher()
+
+    def set_renewed(self, manager: str, load_id: str, renewed: float | None):
+        self._dirty_renewed[(manager, load_id)] = renewed
+        self._ensure_flusher()
+
+    # -----------------------------------------
+    # Сброс в базу и TTL
+    # -----------------------------------------
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and not self._flusher.done():
+            return
+
+        try:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        except RuntimeError:
+            # нет запущенного цикла (скрипты, тесты) — пишем сразу
+            self._flush_sync(*self._take_dirty())
+
+    async def _flush_loop(self):
+        while self._dirty_fsm or self._dirty_sessions or self._dirty_pins or self._dirty_renewed:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+            if time.time() - self._last_expire > min(self.ttl, 3600):
+                await self.expire()
+
+    def _take_dirty(self) -> tuple[list, list, dict, dict]:
+        fsm_rows = []
+        for key in self._dirty_fsm:
+            entry = self._fsm.get(key)
+            if entry is None:
+                continue
+            entry["stored_touched"] = entry["touched"]
+            fsm_rows.append((key, entry["state"], json.dumps(entry["data"], ensure_ascii=False), entry["touched"]))
+
+        session_rows = []
+        for chat_id in self._dirty_sessions:
+            entry = self._sessions.get(chat_id)
+            if entry is None:
+                continue
+            entry["stored_touched"] = entry["touched"]
+            session_rows.append((chat_id, entry["manager_key"], entry["touched"]))
+
+        self._dirty_fsm.clear()
+        self._dirty_sessions.clear()
+
+        pins, self._dirty_pins = self._dirty_pins, {}
+        renewed, self._dirty_renewed = self._dirty_renewed, {}
+
+        return fsm_rows, session_rows, pins, renewed
+
+    def _flush_sync(self, fsm_rows: list, session_rows: list, pins: dict, renewed: dict):
+        if not fsm_rows and not session_rows and not pins and not renewed:
+            return
+
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO fsm (key, state, data, touched) VALUES (?, ?, ?, ?)",
+                    fsm_rows,
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO sessions (chat_id, manager_key, touched) VALUES (?, ?, ?)",
+                    session_rows,
+                )
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO pinned_loads (manager, load_id) VALUES (?, ?)",
+                    [key for key, pinned in pins.items() if pinned],
+                )
+                self._db.executemany(
+                    "DELETE FROM pinned_loads WHERE manager = ? AND load_id = ?",
+                    [key for key, pinned in pins.items() if not pinned],
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO renewed_loads (manager, load_id, renewed) VALUES (?, ?, ?)",
+                    [(*key, ts) for key, ts in renewed.items() if ts is not None],
+                )
+                self._db.executemany(
+                    "DELETE FROM renewed_loads WHERE manager = ? AND load_id = ?",
+                    [key for key, ts in renewed.items() if ts is None],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _remark_dirty(self, fsm_rows: list, session_rows: list, pins: dict, renewed: dict):
+        # запись не удалась — строки снова грязные и уйдут со следующим сбросом
+        for key, *_ in fsm_rows:
+            if key in self._fsm:
+                self._fsm[key]["stored_touched"] = 0.0
+                self._dirty_fsm.add(key)
+        for chat_id, *_ in session_rows:
+            if chat_id in self._sessions:
+                self._sessions[chat_id]["stored_touched"] = 0.0
+                self._dirty_sessions.add(chat_id)
+        # изменения, сделанные после снимка, новее — их не перетираем
+        for key, pinned in pins.items():
+            self._dirty_pins.setdefault(key, pinned)
+        for key, ts in renewed.items():
+            self._dirty_renewed.setdefault(key, ts)
+
+    async def flush(self):
+        # снимок грязных записей берём в цикле событий, пишем — в потоке
+        dirty = self._take_dirty()
+
+        try:
+            await asyncio.to_thread(self._flush_sync, *dirty)
+        except sqlite3.Error as e:
+            logger.error("[Storage] ошибка записи: %s", e)
+            self._remark_dirty(*dirty)
+
+    def _expire_db(self, cutoff: float) -> tuple[int, list]:
+        with self._db_lock:
+            fsm_deleted = self._db.execute("DELETE FROM fsm WHERE touched < ?", (cutoff,)).rowcount
+            chat_ids = [row[0] for row in self._db.execute(
+                "SELECT chat_id FROM sessions WHERE touched < ?", (cutoff,)
+            ).fetchall()]
+            self._db.execute("DELETE FROM sessions WHERE touched < ?", (cutoff,))
+        return fsm_deleted, chat_ids
+
+    def subscribe_expired(self, callback):
+        self._expire_listeners.append(callback)
+
+    async def expire(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        self._last_expire = now
+
+        for key in [k for k, e in self._fsm.items() if e["touched"] < cutoff and k not in self._dirty_fsm]:
+            del self._fsm[key]
+
+        expired = {c for c, e in self._sessions.items() if e["touched"] < cutoff and c not in self._dirty_sessions}
+        for chat_id in expired:
+            del self._sessions[chat_id]
+
+        fsm_deleted, db_expired = await asyncio.to_thread(self._expire_db, cutoff)
+
+        # в базе время обращения может отставать от памяти — живые сессии не трогаем
+        expired |= {c for c in db_expired if c not in self._sessions}
+
+        if fsm_deleted or expired:
+            logger.info("[Storage] удалено неактивных: fsm=%s, сессий=%s", fsm_deleted, len(expired))
+
+        if expired:
+            for callback in self._expire_listeners:
+                callback(sorted(expired))
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,161 @@
+# =============================================
+# subscriptions.py
+# Подписки на новые отклики: групповые чаты, руководители,
+# подменяющие менеджеры — каждый со своими фильтрами
+# =============================================
+
+import logging
+import os
+from bisect import bisect_right
+
+from ati_client import normalize_price
+from managers import read_document
+
+logger = logging.getLogger("subscriptions")
+
+# Формат подписки (JSON / YAML, список или {"subscriptions": [...]}):
+# {
+#     "id": "team-msk",              # для логов; по умолчанию chat_id
+#     "chat_id": -1001234567890,     # куда слать
+#     "managers": ["alexander"],     # чьи грузы; по умолчанию — всех
+#     "from_city": "Москва",         # фильтр маршрута, любой конец можно опустить
+#     "to_city": "",
+#     "min_rating": 10,              # рейтинг перевозчика (TotalScore), не ниже
+#     "min_price": 50000,            # цена отклика, не ниже
+# }
+
+ANY = "*"
+
+
+def normalize_subscription(record: dict) -> dict:
+    chat_id = int(record["chat_id"])
+
+    managers = record.get("managers") or [ANY]
+    if isinstance(managers, str):
+        managers = [managers]
+    if ANY in managers:
+        managers = [ANY]
+
+    min_rating = record.get("min_rating")
+
+    return {
+        "id": str(record.get("id") or chat_id),
+        "chat_id": chat_id,
+        "managers": [str(m) for m in managers],
+        "from_city": (record.get("from_city") or "").strip().lower(),
+        "to_city": (record.get("to_city") or "").strip().lower(),
+        "min_rating": float(min_rating) if min_rating is not None else None,
+        "min_price": float(record.get("min_price") or 0),
+    }
+
+
+def _response_rating(r: dict) -> float | None:
+    return (r.get("FirmInfo") or {}).get("TotalScore")
+
+
+class SubscriptionIndex:
+    """
+    Неизменяемый индекс подписок.
+
+    Корзины по (менеджер | *, город погрузки | "", город выгрузки | ""):
+    отклик проверяется не больше чем по восьми корзинам. Внутри корзины
+    подписки отсортированы по min_price, поэтому порог цены — бинарный поиск,
+    а рейтинг сверяется только у тех, кому подошла цена.
+    """
+
+    def __init__(self, subscriptions: list):
+        buckets: dict[tuple, list] = {}
+
+        for sub in subscriptions:
+            for manager_key in sub["managers"]:
+                key = (manager_key, sub["from_city"], sub["to_city"])
+                buckets.setdefault(key, []).append(sub)
+
+        # корзина -> (отсортированные min_price, подписки в том же порядке)
+        self._buckets: dict[tuple, tuple[list, list]] = {}
+        for key, subs in buckets.items():
+            subs.sort(key=lambda s: s["min_price"])
+            self._buckets[key] = ([s["min_price"] for s in subs], subs)
+
+        self.size = len(subscriptions)
+
+    def match(self, manager_key: str, load: dict, r: dict) -> list:
+        if not self._buckets:
+            return []
+
+        price = normalize_price(r)
+        value = price[0] if price else 0.0
+        rating = _response_rating(r)
+
+        from_city = (load.get("from_city") or "").strip().lower()
+        to_city = (load.get("to_city") or "").strip().lower()
+
+        matched = []
+
+        # dict.fromkeys — без повторов, если какой-то из городов пустой
+        routes = dict.fromkeys(((from_city, to_city), (from_city, ""), ("", to_city), ("", "")))
+
+        for manager in (manager_key, ANY):
+            for route in routes:
+                bucket = self._buckets.get((manager, *route))
+                if bucket is None:
+                    continue
+
+                prices, subs = bucket
+                for sub in subs[:bisect_right(prices, value)]:
+                    if sub["min_rating"] is None or (rating is not None and rating >= sub["min_rating"]):
+                        matched.append(sub)
+
+        return matched
+
+
+class Subscriptions:
+    """
+    Подписки из SUBSCRIPTIONS_FILE; при изменении файла индекс
+    перестраивается целиком и подменяется одной операцией
+    """
+
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.index = SubscriptionIndex([])
+        self._mtime: float | None = None
+
+    def load(self, records: list):
+        subscriptions = [normalize_subscription(r) for r in records]
+        self.index = SubscriptionIndex(subscriptions)
+        logger.info("[Subscriptions] загружено подписок: %s", len(subscriptions))
+
+    def reload_if_changed(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+
+        try:
+            self.load(read_document(self.path, "subscriptions"))
+        except Exception as e:
+            # битый файл не должен ронять бота — остаёмся на старых подписках
+            logger.error("[Subscriptions] ошибка чтения %s: %s", self.path, e)
+        self._mtime = mtime
+
+    def match(self, manager_key: str, load: dict, r: dict) -> list:
+        return self.index.match(manager_key, load, r)
+
+
+_subscriptions: Subscriptions | None = None
+
+
+def get_subscriptions() -> Subscriptions:
+    """
+    Общие подписки процесса; файл читается при первом обращении
+    """
+    global _subscriptions
+
+    if _subscriptions is None:
+        from config import SUBSCRIPTIONS_FILE
+        _subscriptions = Subscriptions(SUBSCRIPTIONS_FILE)
+        _subscriptions.reload_if_changed()
+
+    return _subscriptions
@@ -1,27 +1,104 @@
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher, F, Router
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.types import (
     Message, CallbackQuery,
     InlineKeyboardMarkup, InlineKeyboardButton,
     ReplyKeyboardMarkup, KeyboardButton,
 )
-from aiogram.fsm.storage.memory import MemoryStorage
+import html
+import logging
+import re
+from contextlib import aclosing
 from datetime import datetime, timedelta
 
 from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_IDS, MANAGERS
+from config import STATE_DB_PATH, SESSION_TTL_HOURS, STORAGE_FLUSH_SECONDS, STORAGE_REFRESH_SECONDS
+from config import RENDER_CACHE_SIZE, ADMIN_USER_IDS, OFFLOAD_MIN_ITEMS, FANOUT_PER_SECOND
+from config import PREFETCH_TTL_SECONDS, PREFETCH_MAX_CONCURRENT, PREFETCH_PER_MINUTE, PREFETCH_CACHE_SIZE
 from state import (
     is_auto_update_enabled, set_auto_update,
     get_last_update_time,
+    bind_session_store,
+    set_load_renewed,
+    get_pinned_loads,
+    toggle_pinned_load,
+    forget_load,
 )
-from config import USERS
-from ati_client import get_my_loads, get_load_responses, renew_load, parse_load
-from ati_client import delete_load
+from storage import SQLiteStorage
+from render_cache import RenderCache
+from prefetch import ResponsesPrefetcher
+from mirror import get_mirror
+from analytics import price_analytics
+from loop_monitor import get_loop_monitor
+from subscriptions import get_subscriptions
+from fanout import send_all, send_one
+import metrics
+import offload
+import tracing
+from ati_client import get_my_loads, get_load_responses, renew_load, parse_load, IncompleteLoadsError
+from load_feed import iter_loads
+from ati_client import delete_load, normalize_price
+
+logger = logging.getLogger("bot")
+
 
 def get_manager_by_user(user_id: int):
-    return USERS.get(user_id)
+    return MANAGERS.by_user(user_id)
+
+
+# Хендлеры регистрируются на router при импорте; Bot, хранилище и
+# Dispatcher создаются позже — в create_dispatcher() / get_bot() (app.py).
+# Router подключается только к одному Dispatcher, поэтому каждый диспетчер
+# получает свою копию — build_router()
+router = Router()
+
+_bot: Bot | None = None
+
+
+def get_bot() -> Bot:
+    global _bot
+
+    if _bot is None:
+        _bot = Bot(token=TELEGRAM_BOT_TOKEN)
+
+    return _bot
+
+
+def create_dispatcher() -> Dispatcher:
+    storage = SQLiteStorage(
+        STATE_DB_PATH,
+        ttl=SESSION_TTL_HOURS * 3600,
+        flush_interval=STORAGE_FLUSH_SECONDS,
+        refresh_interval=STORAGE_REFRESH_SECONDS,
+    )
+    bind_session_store(storage)
+
+    dp = Dispatcher(storage=storage)
+    dp.include_router(build_router())
+    return dp
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+
+def build_router() -> Router:
+    """
+    Новый Router с хендлерами и middleware шаблона router
+    """
+    copy = Router(name="bot")
+    for name, observer in router.observers.items():
+        copy.observers[name].handlers.extend(observer.handlers)
+        for middleware in observer.middleware:
+            copy.observers[name].middleware(middleware)
+        for middleware in observer.outer_middleware:
+            copy.observers[name].outer_middleware(middleware)
+    return copy
+
+# Кэш откликов за кнопкой «📋 Показать все отклики»
+prefetcher = ResponsesPrefetcher(
+    ttl=PREFETCH_TTL_SECONDS,
+    max_concurrent=PREFETCH_MAX_CONCURRENT,
+    per_minute=PREFETCH_PER_MINUTE,
+    max_entries=PREFETCH_CACHE_SIZE,
+)
 
 
 # =========================================================
@@ -63,37 +140,46 @@ def format_rating(firm: dict) -> str:
 
 
 def format_price(r: dict) -> str:
-    nds_price = r.get("NdsPrice") or 0
-    not_nds_price = r.get("NotNdsPrice") or 0
-    price_value = r.get("Price") or 0
-    pay_attr = r.get("PayAttributes", 0)
+    price = normalize_price(r)
 
-    try:
-        nds_price = float(nds_price)
-        not_nds_price = float(not_nds_price)
-        price_value = float(price_value)
-    except:
+    if price is None:
         return "—"
 
-    # приоритет — явные поля
-    if nds_price > 0:
-        return f"{int(nds_price):,} ₽ (с НДС)"
-    elif not_nds_price > 0:
-        return f"{int(not_nds_price):,} ₽ (без НДС)"
+    value, with_nds = price
+    return f"{int(value):,} ₽ ({'с НДС' if with_nds else 'без НДС'})"
 
-    # fallback через PayAttributes
-    elif price_value > 0:
-        if pay_attr & 8:
-            return f"{int(price_value):,} ₽ (с НДС)"
-        else:
-            return f"{int(price_value):,} ₽ (без НДС)"
 
-    return "—"
+# Готовые строки откликов: (ResponseId, поля отклика) -> HTML без номера
+_render_cache = RenderCache(RENDER_CACHE_SIZE)
 
 
-def format_response_line(r: dict, i: int) -> str:
+def _freeze(value):
+    # списки и словари из JSON — в кортежи, чтобы отпечаток был ключом кэша
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _response_fingerprint(r: dict) -> tuple:
+    """
+    Все поля, от которых зависит строка отклика
+    """
+    firm = r.get("FirmInfo", {})
+    contact = firm.get("Contact", {})
+
+    return tuple(_freeze(value) for value in (
+        firm.get("FullFirmName"), r.get("FirmName"), firm.get("TotalScore"),
+        contact.get("Name"), contact.get("Mobile"), contact.get("Telephone"),
+        r.get("NdsPrice"), r.get("NotNdsPrice"), r.get("Price"), r.get("PayAttributes"),
+        r.get("Note"),
+    ))
+
+
+def render_response_body(r: dict) -> str:
     """
-    Формирует одну строку отклика
+    Строка отклика без порядкового номера
     """
     firm = r.get("FirmInfo", {})
     contact = firm.get("Contact", {})
@@ -106,7 +192,7 @@ def format_response_line(r: dict, i: int) -> str:
     note = r.get("Note") or "—"
 
     return (
-        f"<b>{i}.</b> {company} {rating}\n"
+        f"{company} {rating}\n"
         f"   👤 {name}\n"
         f"   📞 {phone}\n"
         f"   💰 {price}\n"
@@ -114,6 +200,26 @@ def format_response_line(r: dict, i: int) -> str:
     )
 
 
+def format_response_line(r: dict, i: int) -> str:
+    """
+    Формирует одну строку отклика (из кэша, если отклик не менялся)
+    """
+    response_id = r.get("ResponseId")
+
+    if response_id is None:
+        return f"<b>{i}.</b> {render_response_body(r)}"
+
+    # сам кортеж полей, а не его hash: при совпадении хэшей dict сравнит поля
+    key = (response_id, _response_fingerprint(r))
+    body = _render_cache.get(key)
+
+    if body is None:
+        body = render_response_body(r)
+        _render_cache.put(key, body)
+
+    return f"<b>{i}.</b> {body}"
+
+
 def build_responses_lines(responses: list, title: str = None) -> list:
     """
     Собирает список строк откликов:
@@ -134,6 +240,53 @@ def build_responses_lines(responses: list, title: str = None) -> list:
     return lines
 
 
+async def render_responses_lines(responses: list, title: str = None) -> list:
+    """
+    build_responses_lines; длинные списки отрисовываются в пуле потоков
+    """
+    with tracing.span("render", responses=len(responses)):
+        return await offload.run(
+            build_responses_lines, responses, title,
+            size=len(responses), threshold=OFFLOAD_MIN_ITEMS, kind="render",
+        )
+
+
+# лимит Telegram — 4096 символов на сообщение
+MESSAGE_LIMIT = 4000
+
+
+def split_lines(lines: list, limit: int = MESSAGE_LIMIT) -> list:
+    """
+    Склеивает строки в сообщения не длиннее limit, разрезая только
+    между строками — HTML-теги внутри строки не рвутся
+    """
+    chunks = []
+    current: list = []
+    size = 0
+
+    for line in lines:
+        # одна строка длиннее лимита — на практике не встречается, но не должна ронять отправку
+        if len(line) > limit:
+            line = line[:limit - 1] + "…"
+
+        if current and size + 1 + len(line) > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+
+        current.append(line)
+        size += len(line) + (1 if size else 0)
+
+    if current:
+        chunks.append("\n".join(current))
+
+    return chunks
+
+
+async def answer_lines(message: Message, lines: list, **kwargs):
+    for chunk in split_lines(lines):
+        await message.answer(chunk, **kwargs)
+
+
 # =========================================================
 # КЛАВИАТУРА
 # =========================================================
@@ -154,7 +307,7 @@ def main_keyboard(manager_key: str):
 # СТАРТ
 # =========================================================
 
-@dp.message(Command("start"))
+@router.message(Command("start"))
 async def start(message: Message):
     manager = get_manager_by_user(message.from_user.id)
 
@@ -174,11 +327,63 @@ async def start(message: Message):
     )
 
 
+# =========================================================
+# ЗАКРЕПЛЕНИЕ (приоритет автообновления)
+# =========================================================
+
+PINNED_NOTE = "\n📌 Обновляется первым"
+
+
+def load_keyboard(load_id: str, pinned: bool) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(text="🔄 Обновить", callback_data=f"renew_{load_id}"),
+                InlineKeyboardButton(text="💬 Отклики", callback_data=f"responses_{load_id}"),
+            ],
+            [
+                InlineKeyboardButton(
+                    text="📌 Открепить" if pinned else "📌 Закрепить",
+                    callback_data=f"pin_{load_id}",
+                ),
+                InlineKeyboardButton(text="🗄 В архив", callback_data=f"archive_{load_id}")
+            ]
+        ]
+    )
+
+
+@router.callback_query(F.data.startswith("pin_"))
+async def pin_load_handler(callback: CallbackQuery):
+    load_id = callback.data.replace("pin_", "")
+    manager = get_manager_by_user(callback.from_user.id)
+    if not manager:
+        await callback.answer("❌ Нет доступа")
+        return
+
+    pinned = toggle_pinned_load(manager, load_id)
+
+    if pinned:
+        await callback.answer("📌 Груз будет обновляться первым")
+    else:
+        await callback.answer("Груз откреплён")
+
+    # карточка груза: отметка в тексте и подпись кнопки под новое состояние
+    text = (callback.message.text or "").replace(PINNED_NOTE, "")
+    if pinned:
+        text += PINNED_NOTE
+
+    try:
+        await callback.message.edit_text(text, reply_markup=load_keyboard(load_id, pinned))
+    except TelegramBadRequest as e:
+        # сообщение слишком старое или не изменилось — состояние уже сохранено
+        logger.debug("карточка груза не обновлена: %s", e, extra={"manager": manager, "load_id": load_id})
+
+
 # =========================================================
 # АРХИВ
 # =========================================================
 
-@dp.callback_query(F.data.startswith("archive_"))
+@router.callback_query(F.data.startswith("archive_"))
 async def archive_load_handler(callback: CallbackQuery):
     await callback.answer("Убираем в архив...")
 
@@ -191,6 +396,8 @@ async def archive_load_handler(callback: CallbackQuery):
     result = await delete_load(manager, load_id)
 
     if result["success"]:
+        get_mirror().remove_load(manager, load_id)
+        forget_load(manager, load_id)
         await callback.message.answer("🗄 Груз убран (архив)")
     else:
         await callback.message.answer(f"❌ Ошибка: {result.get('reason')}")
@@ -200,7 +407,7 @@ async def archive_load_handler(callback: CallbackQuery):
 # МОИ ГРУЗЫ
 # =========================================================
 
-@dp.message(F.text == "📋 Мои грузы")
+@router.message(F.text == "📋 Мои грузы")
 async def loads_handler(message: Message):
 
     manager = get_manager_by_user(message.from_user.id)
@@ -208,50 +415,47 @@ async def loads_handler(message: Message):
         await message.answer("❌ Нет доступа")
         return
 
-    loads = await get_my_loads(manager)
+    found = False
 
-    if not loads:
-        await message.answer("Нет грузов")
-        return
+    # 👉 отправляем грузы по мере загрузки страниц
+    # (или сразу — из ленты изменений, если она опрашивала ATI недавно)
+    try:
+        async for page in iter_loads(manager):
+            for load in page:
+                found = True
 
-    for l in loads:
-        load = parse_load(l)
+                weight = f"{load['weight']}т" if load["weight"] != "—" else "—"
 
-        weight = f"{load['weight']}т" if load["weight"] != "—" else "—"
+                responses = await get_load_responses(manager, load["id"])
+                actual_count = len([r for r in responses if not r.get("IsOutdated")]) if responses else 0
 
-        responses = await get_load_responses(manager, load["id"])
-        actual_count = len([r for r in responses if not r.get("IsOutdated")]) if responses else 0
+                text = (
+                    f"{load['from_city']} → {load['to_city']}\n"
+                    f"Вес: {weight}\n"
+                    f"💬 Откликов: {actual_count}\n"
+                )
 
-        text = (
-            f"{load['from_city']} → {load['to_city']}\n"
-            f"Вес: {weight}\n"
-            f"💬 Откликов: {actual_count}\n"
-        )
+                if not load["can_renew"]:
+                    text += f"\n⏳ {load['renew_restriction']}"
 
-        if not load["can_renew"]:
-            text += f"\n⏳ {load['renew_restriction']}"
-
-        keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="🔄 Обновить", callback_data=f"renew_{load['id']}"),
-                    InlineKeyboardButton(text="💬 Отклики", callback_data=f"responses_{load['id']}"),
-                  
-                ],
-                [
-                    InlineKeyboardButton(text="🗄 В архив", callback_data=f"archive_{load['id']}")
-                ]
-            ]
-        )
+                pinned = load["id"] in get_pinned_loads(manager)
+                if pinned:
+                    text += PINNED_NOTE
+
+                await message.answer(text, reply_markup=load_keyboard(load["id"], pinned))
+    except IncompleteLoadsError:
+        await message.answer("⚠️ ATI отдал не все страницы — список неполный, попробуйте позже")
+        return
 
-        await message.answer(text, reply_markup=keyboard)
+    if not found:
+        await message.answer("Нет грузов")
 
 
 # =========================================================
 # АВТООБНОВЛЕНИЕ
 # =========================================================
 
-@dp.message(F.text.startswith("Автообновление"))
+@router.message(F.text.startswith("Автообновление"))
 async def toggle_auto(message: Message):
 
     manager = get_manager_by_user(message.from_user.id)
@@ -272,7 +476,7 @@ async def toggle_auto(message: Message):
 # ДО ОБНОВЛЕНИЯ
 # =========================================================
 
-@dp.message(F.text == "⏱ До обновления")
+@router.message(F.text == "⏱ До обновления")
 async def next_update(message: Message):
 
     manager = get_manager_by_user(message.from_user.id)
@@ -296,17 +500,34 @@ async def next_update(message: Message):
 
 async def notify_new_response(manager_key: str, load: dict, new_responses: list):
 
-    chat_id = TELEGRAM_CHAT_IDS.get(manager_key)
-    if not chat_id:
+    # получатели: свой чат менеджера (все отклики) + подписки со своими фильтрами
+    own_chat_id = TELEGRAM_CHAT_IDS.get(manager_key)
+    recipients: dict[int, list] = {}
+
+    if own_chat_id:
+        recipients[own_chat_id] = list(new_responses)
+
+    subscriptions = get_subscriptions()
+    for r in new_responses:
+        for sub in subscriptions.match(manager_key, load, r):
+            matched = recipients.setdefault(sub["chat_id"], [])
+            if not any(m is r for m in matched):
+                matched.append(r)
+
+    if not recipients:
         return
 
-    lines = [
-        "🔔 Новый отклик",
-        f"{load['from_city']} → {load['to_city']}"
-    ]
+    if own_chat_id:
+        # список откликов изменился — загружаем его заново, пока уходит уведомление
+        prefetcher.invalidate(manager_key, load["id"])
+        prefetcher.schedule(manager_key, load["id"])
+
+    # сравнение с медианой маршрута — до того, как отклик попадёт в статистику
+    hints = {id(r): price_analytics.price_hint(load, r) for r in new_responses}
 
-    lines += build_responses_lines(new_responses)
+    price_analytics.record_many(load, new_responses)
 
+    # кнопка ведёт к грузам менеджера — только в его собственном чате
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [InlineKeyboardButton(
@@ -316,14 +537,78 @@ async def notify_new_response(manager_key: str, load: dict, new_responses: list)
         ]
     )
 
-    await bot.send_message(chat_id, "\n".join(lines), reply_markup=keyboard, parse_mode="HTML")
+    # одинаковый набор откликов — один и тот же текст
+    texts: dict[tuple, str] = {}
+    messages = []
+
+    for chat_id, responses in recipients.items():
+        key = tuple(id(r) for r in responses)
+
+        if key not in texts:
+            lines = [
+                "🔔 Новый отклик",
+                f"{load['from_city']} → {load['to_city']}"
+            ]
+            lines += build_responses_lines(responses)
+            lines += [hints[id(r)] for r in responses if hints[id(r)]]
+            texts[key] = "\n".join(lines)
+
+        kwargs = {"parse_mode": "HTML"}
+        if chat_id == own_chat_id:
+            kwargs["reply_markup"] = keyboard
+
+        messages.append((chat_id, texts[key], kwargs))
+
+    # свой чат — первым; временные ошибки (сеть, RetryAfter после повтора)
+    # поднимаются: планировщик не пометит отклик известным, и он придёт снова.
+    # Постоянные (бот заблокирован, чат не найден) повтором не лечатся —
+    # логируем, а подписчики всё равно получают уведомление
+    own = [m for m in messages if m[0] == own_chat_id]
+    if own:
+        try:
+            await send_one(get_bot(), *own[0])
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            metrics.inc("notify_own_failed", manager=manager_key)
+            logger.error(
+                "уведомление в чат менеджера не доставлено: %s", e,
+                extra={"manager": manager_key, "chat_id": own_chat_id},
+            )
+
+    others = [m for m in messages if m[0] != own_chat_id]
+    if others:
+        await send_all(get_bot(), others, per_second=FANOUT_PER_SECOND)
+
+
+# =========================================================
+# ИТОГ АВТООБНОВЛЕНИЯ
+# =========================================================
+
+async def notify_update_result(manager_key: str, results: list):
+
+    chat_id = TELEGRAM_CHAT_IDS.get(manager_key)
+    if not chat_id:
+        return
+
+    renewed = [r for r in results if r.get("success")]
+    failed = [r for r in results if not r.get("success")]
+
+    lines = [f"🔄 Автообновление: обновлено {len(renewed)} из {len(results)}"]
+
+    for r in renewed:
+        lines.append(f"✅ {r['from_city']} → {r['to_city']}, {r['weight']}т ({r['latency']:.1f} с)")
+
+    for r in failed:
+        lines.append(f"⏳ {r['from_city']} → {r['to_city']} — {r.get('reason') or 'ошибка'}")
+
+    for chunk in split_lines(lines):
+        await get_bot().send_message(chat_id, chunk)
 
 
 # =========================================================
 # ОТКЛИКИ
 # =========================================================
 
-@dp.callback_query(F.data.startswith("responses_"))
+@router.callback_query(F.data.startswith("responses_"))
 async def show_responses(callback: CallbackQuery):
     await callback.answer("Загружаю...")
 
@@ -334,25 +619,26 @@ async def show_responses(callback: CallbackQuery):
         return
 
     responses = await get_load_responses(manager, load_id)
+    get_mirror().add_responses(manager, load_id, responses)
 
     if not responses:
         await callback.message.answer("Откликов нет")
         return
 
-    lines = build_responses_lines(responses, "📋 Отклики:")
+    lines = await render_responses_lines(responses, "📋 Отклики:")
 
     if len(lines) == 1:
         await callback.message.answer("Нет актуальных откликов")
         return
 
-    await callback.message.answer("\n".join(lines), parse_mode="HTML")
+    await answer_lines(callback.message, lines, parse_mode="HTML")
 
 
 # =========================================================
 # ВСЕ ОТКЛИКИ
 # =========================================================
 
-@dp.callback_query(F.data.startswith("all_"))
+@router.callback_query(F.data.startswith("all_"))
 async def all_responses(callback: CallbackQuery):
     await callback.answer("Загружаю...")
 
@@ -362,25 +648,27 @@ async def all_responses(callback: CallbackQuery):
         await callback.message.answer("❌ Нет доступа")
         return
 
-    responses = await get_load_responses(manager, load_id)
+    # обычно уже загружено в фоне после уведомления
+    responses = await prefetcher.get_responses(manager, load_id)
+    get_mirror().add_responses(manager, load_id, responses)
 
     if not responses:
         await callback.message.answer("Нет откликов")
         return
 
-    lines = build_responses_lines(responses, "📋 Все отклики:")
+    lines = await render_responses_lines(responses, "📋 Все отклики:")
 
     if len(lines) == 1:
         await callback.message.answer("Нет актуальных откликов")
         return
 
-    await callback.message.answer("\n".join(lines), parse_mode="HTML")
+    await answer_lines(callback.message, lines, parse_mode="HTML")
 
 # =========================================================
 # ОБНОВИТЬ ВРУЧНУЮ
 # =========================================================
 
-@dp.callback_query(F.data.startswith("renew_"))
+@router.callback_query(F.data.startswith("renew_"))
 async def renew_one(callback: CallbackQuery):
     await callback.answer("Проверяю...")
 
@@ -390,19 +678,28 @@ async def renew_one(callback: CallbackQuery):
         await callback.message.answer("❌ Нет доступа")
         return
 
-    # 👉 получаем все грузы, чтобы найти нужный
-    loads = await get_my_loads(manager)
+    # 👉 листаем грузы постранично, пока не найдём нужный
+    found_any = False
+    load_data = None
 
-    if not loads:
-        await callback.message.answer("Грузы не найдены")
+    try:
+        async with aclosing(get_my_loads(manager)) as pages:
+            async for page in pages:
+                found_any = True
+                for l in page:
+                    if str(l.get("Id")) == load_id:
+                        load_data = parse_load(l)
+                        break
+                if load_data:
+                    break
+    except IncompleteLoadsError:
+        # груз мог быть на недополученной странице
+        await callback.message.answer("⚠️ ATI отдал не все грузы, попробуйте позже")
         return
 
-    # 👉 ищем конкретный груз
-    load_data = None
-    for l in loads:
-        if str(l.get("Id")) == load_id:
-            load_data = parse_load(l)
-            break
+    if not found_any:
+        await callback.message.answer("Грузы не найдены")
+        return
 
     if not load_data:
         await callback.message.answer("Груз не найден (возможно устарел)")
@@ -418,20 +715,170 @@ async def renew_one(callback: CallbackQuery):
     result = await renew_load(manager, load_id)
 
     if result.get("success"):
+        set_load_renewed(manager, load_id)
         await callback.message.answer("✅ Груз обновлён")
     else:
         reason = result.get("reason", "Ошибка обновления")
         await callback.message.answer(f"❌ {reason}")
 
+# =========================================================
+# СТАТИСТИКА ЦЕН ПО МАРШРУТУ
+# =========================================================
+
+def parse_route(text: str) -> tuple[str, str] | None:
+    """
+    "Москва - Казань", "Москва → Казань" или "Москва Казань" -> ("Москва", "Казань")
+    """
+    for sep in ("→", "->", " - ", " — ", ";", ","):
+        if sep in text:
+            from_city, _, to_city = text.partition(sep)
+            if from_city.strip() and to_city.strip():
+                return from_city.strip(), to_city.strip()
+            return None
+
+    parts = text.split()
+    if len(parts) == 2:
+        return parts[0], parts[1]
+
+    return None
+
+
+@router.message(Command("stats"))
+async def stats_handler(message: Message):
+
+    manager = get_manager_by_user(message.from_user.id)
+    if not manager:
+        await message.answer("❌ Нет доступа")
+        return
+
+    route = parse_route((message.text or "").partition(" ")[2])
+    if not route:
+        await message.answer("Использование: /stats <откуда> - <куда>")
+        return
+
+    from_city, to_city = route
+    lines = price_analytics.describe(from_city, to_city)
+
+    if not lines:
+        await message.answer(f"По маршруту {from_city} → {to_city} данных нет")
+        return
+
+    await message.answer(
+        "\n".join([f"📊 {from_city} → {to_city}"] + lines),
+        parse_mode="HTML",
+    )
+
+
+# =========================================================
+# ПОИСК И ИСТОРИЯ (локальное зеркало, без запросов к ATI)
+# =========================================================
+
+@router.message(Command("search"))
+async def search_handler(message: Message):
+
+    manager = get_manager_by_user(message.from_user.id)
+    if not manager:
+        await message.answer("❌ Нет доступа")
+        return
+
+    query = (message.text or "").partition(" ")[2].strip()
+    if not query:
+        await message.answer("Использование: /search <город | компания | телефон>")
+        return
+
+    hits = await get_mirror().search(manager, query)
+
+    if not hits:
+        await message.answer("Ничего не найдено")
+        return
+
+    lines = [f"🔎 Найдено: {len(hits)}"]
+
+    for i, hit in enumerate(hits, start=1):
+        if hit["kind"] == "load":
+            from_city, to_city, weight, _ = hit["row"]
+            lines.append(f"<b>{i}.</b> 🚛 {from_city} → {to_city}, {weight}т\n   {history_command(hit['load_id'])}")
+        else:
+            lines.append(format_response_line(hit["response"], i) + f"\n   {history_command(hit['load_id'])}")
+
+    await answer_lines(message, lines, parse_mode="HTML")
+
+
+_COMMAND_SAFE_ID = re.compile(r"[A-Za-z0-9_]+")
+
+
+def history_command(load_id: str) -> str:
+    """
+    /history_<id> кликабелен, только если id из [A-Za-z0-9_] (ограничение
+    команд Telegram); иначе — /history <id> для копирования
+    """
+    load_id = str(load_id)
+    if _COMMAND_SAFE_ID.fullmatch(load_id):
+        return f"/history_{load_id}"
+    return f"<code>/history {html.escape(load_id)}</code>"
+
+
+@router.message(F.text.regexp(r"^/history(?:_|\s+)(\S+)"))
+async def history_handler(message: Message):
+
+    manager = get_manager_by_user(message.from_user.id)
+    if not manager:
+        await message.answer("❌ Нет доступа")
+        return
+
+    load_id = message.text.replace("/history", "", 1).lstrip("_ ").split()[0]
+    history = await get_mirror().history(manager, load_id)
+
+    if not history["snapshots"] and not history["responses"]:
+        await message.answer("По этому грузу истории нет")
+        return
+
+    lines = [f"📜 История груза {html.escape(load_id)}"]
+
+    # последние 20 версий груза
+    for seen, status, from_city, to_city, weight, count, can_renew in history["snapshots"][-20:]:
+        when = datetime.fromtimestamp(seen).strftime("%d.%m %H:%M")
+        if status == "removed":
+            lines.append(f"{when} 🗄 снят / в архиве")
+        else:
+            lines.append(f"{when} {from_city} → {to_city}, {weight}т, 💬 {count}")
+
+    if history["responses"]:
+        lines.append("")
+        lines += await render_responses_lines(history["responses"], "📋 Отклики:")
+
+    await answer_lines(message, lines, parse_mode="HTML")
+
+
+# =========================================================
+# /debug — здоровье цикла событий (только для администраторов)
+# =========================================================
+
+@router.message(Command("debug"))
+async def debug_command(message: Message):
+
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await message.answer("❌ Нет доступа")
+        return
+
+    lines = ["🩺 <b>Цикл событий</b>"] + get_loop_monitor().report()
+
+    jobs = metrics.format_text("job_")
+    if jobs:
+        lines += ["", "<b>Задачи планировщика</b>"] + [html.escape(line) for line in jobs.splitlines()]
+
+    await answer_lines(message, lines, parse_mode="HTML")
+
+
 # =========================================================
 # ПРИЧИНА НЕИСПРАВНОСТИ
 # =========================================================
-@dp.message()
+@router.message()
 async def debug_handler(message: Message):
     manager = get_manager_by_user(message.from_user.id)
     if not manager:
         return
 
-    print("UNKNOWN MESSAGE:", message.text)
+    logger.info("UNKNOWN MESSAGE: %s", message.text, extra={"manager": manager})
 
 
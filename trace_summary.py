@@ -0,0 +1,127 @@
+# trace_summary.py
+# Самые медленные обработчики по трассам tracing.py:
+#   python trace_summary.py [data/traces.jsonl] [--top 10] [--hours 24]
+#
+# Для каждого обработчика — число апдейтов, p50 / p95 / max и среднее время
+# по частям: запросы к ATI (с разбором JSON), отрисовка, вызовы Bot API.
+# Сортировка — по p95.
+
+import argparse
+import json
+import math
+import os
+import time
+from collections import defaultdict
+
+PARTS = (
+    ("ati.", "ATI"),
+    ("render", "отрисовка"),
+    ("tg.", "Telegram"),
+)
+
+
+def _duration_ms(span: dict) -> float:
+    return (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e6
+
+
+def _percentile(values: list, q: float) -> float:
+    # метод ближайшего ранга: наименьшее значение, не меньше которого доля q замеров
+    values = sorted(values)
+    rank = math.ceil(q * len(values) - 1e-9)
+    return values[min(len(values), max(rank, 1)) - 1]
+
+
+def read_traces(path: str, since_ns: int = 0) -> dict:
+    """
+    trace_id -> {"root": корневой спан, "children": [...]}
+    """
+    traces: dict = defaultdict(lambda: {"root": None, "children": []})
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                span = json.loads(line)
+            except ValueError:
+                continue
+            if span["startTimeUnixNano"] < since_ns:
+                continue
+
+            trace = traces[span["traceId"]]
+            if span["parentSpanId"]:
+                trace["children"].append(span)
+            else:
+                trace["root"] = span
+
+    return {trace_id: t for trace_id, t in traces.items() if t["root"]}
+
+
+def _part_totals(children: list) -> dict:
+    # сумма по спанам: параллельные запросы к ATI складываются,
+    # поэтому части могут в сумме превышать время обработчика
+    totals = defaultdict(float)
+    for span in children:
+        for prefix, label in PARTS:
+            if span["name"].startswith(prefix):
+                totals[label] += _duration_ms(span)
+                break
+    return totals
+
+
+def summarize(traces: dict) -> list:
+    by_handler: dict = defaultdict(lambda: {"durations": [], "parts": defaultdict(float)})
+
+    for trace in traces.values():
+        entry = by_handler[trace["root"]["name"]]
+        entry["durations"].append(_duration_ms(trace["root"]))
+        for label, ms in _part_totals(trace["children"]).items():
+            entry["parts"][label] += ms
+
+    rows = []
+    for name, entry in by_handler.items():
+        durations = entry["durations"]
+        rows.append({
+            "handler": name,
+            "count": len(durations),
+            "p50": _percentile(durations, 0.5),
+            "p95": _percentile(durations, 0.95),
+            "max": max(durations),
+            "parts": {label: ms / len(durations) for label, ms in entry["parts"].items()},
+        })
+
+    return sorted(rows, key=lambda r: r["p95"], reverse=True)
+
+
+def main():
+    from config import TRACE_PATH
+
+    parser = argparse.ArgumentParser(description="Самые медленные обработчики по p95")
+    parser.add_argument("path", nargs="?", default=TRACE_PATH or "data/traces.jsonl")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--hours", type=float, default=0, help="только за последние N часов")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"Нет файла трасс {args.path} — задайте TRACE_PATH и перезапустите бота")
+        return
+
+    since_ns = int((time.time() - args.hours * 3600) * 1e9) if args.hours else 0
+    rows = summarize(read_traces(args.path, since_ns))
+
+    if not rows:
+        print("Трасс нет")
+        return
+
+    labels = [label for _, label in PARTS]
+    header = f"{'обработчик':28} {'n':>6} {'p50, мс':>9} {'p95, мс':>9} {'max, мс':>9}"
+    print(header + "".join(f" {label + ', мс':>15}" for label in labels))
+
+    for row in rows[:args.top]:
+        line = (
+            f"{row['handler'][:28]:28} {row['count']:6} "
+            f"{row['p50']:9.0f} {row['p95']:9.0f} {row['max']:9.0f}"
+        )
+        print(line + "".join(f" {row['parts'].get(label, 0.0):15.0f}" for label in labels))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# =============================================
+# tracing.py
+# Трассировка апдейтов Telegram: от получения апдейта до ответа.
+# Trace id живёт в contextvar и доходит до запросов к ATI, отрисовки
+# и отправки сообщений; спаны пишутся в JSONL (поля как в OTLP JSON)
+# =============================================
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+import httpx
+
+logger = logging.getLogger("tracing")
+
+# (трасса, id текущего спана); задачи asyncio получают копию при создании
+_current: ContextVar[tuple | None] = ContextVar("trace", default=None)
+
+_sink = None
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Trace:
+    """
+    Спаны одного апдейта; корневой спан — от получения апдейта до конца обработки
+    """
+
+    def __init__(self, name: str, started: int | None = None):
+        self.trace_id = _new_id(16)
+        self.root_id = _new_id(8)
+        self.name = name
+        self.started = started or time.time_ns()
+        self.attributes: dict = {}
+        self.spans: list = []
+
+    def add(self, name: str, span_id: str, parent_id: str, started: int, attributes: dict):
+        self.spans.append({
+            "traceId": self.trace_id,
+            "spanId": span_id,
+            "parentSpanId": parent_id,
+            "name": name,
+            "startTimeUnixNano": started,
+            "endTimeUnixNano": time.time_ns(),
+            "attributes": attributes,
+        })
+
+    def finish(self) -> list:
+        self.add(self.name, self.root_id, "", self.started, self.attributes)
+        return self.spans
+
+
+def current_trace_id() -> str | None:
+    current = _current.get()
+    return current[0].trace_id if current else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Дочерний спан текущей трассы; вне трассы (фоновые задачи) ничего не делает
+    """
+    current = _current.get()
+    if current is None:
+        yield
+        return
+
+    trace, parent_id = current
+    span_id = _new_id(8)
+    started = time.time_ns()
+    token = _current.set((trace, span_id))
+
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        trace.add(name, span_id, parent_id, started, attributes)
+
+
+# =============================================
+# Запись спанов
+# =============================================
+
+class JsonlSink:
+    """
+    Спан на строку; запись в файл — в фоновом потоке, не в цикле событий
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-sink", daemon=True)
+        self._thread.start()
+
+    def write(self, spans: list):
+        self._queue.put(spans)
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                spans = self._queue.get()
+                if spans is None:
+                    return
+                for s in spans:
+                    f.write(json.dumps(s, ensure_ascii=False, separators=(",", ":")))
+                    f.write("\n")
+                f.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+# =============================================
+# Точки подключения: роутеры, сессия бота, ati_client, логи
+# (aiogram здесь не импортируется — ati_client подключает модуль ради span())
+# =============================================
+
+# update_id -> время получения ответа getUpdates (time_ns); забирается
+# outer-middleware, старые записи вытесняются
+_received: dict[int, int] = {}
+_RECEIVED_LIMIT = 1000
+
+
+class TracingUpdateMiddleware:
+    """
+    Outer-middleware dp.update: одна трасса на апдейт, с момента, когда он
+    пришёл в ответе getUpdates. Имя трассы — тип события; обработчик
+    (TracingHandlerMiddleware) переименовывает её по своему имени
+    """
+
+    def __init__(self, sample_rate: float = 1.0):
+        self.sample_rate = sample_rate
+
+    async def __call__(self, handler, update, data):
+        received = _received.pop(update.update_id, None)
+
+        if _sink is None or random.random() >= self.sample_rate:
+            return await handler(update, data)
+
+        event_type = update.event_type
+        trace = Trace(f"update.{event_type}", started=received)
+        trace.attributes["event"] = event_type
+
+        user = getattr(update.event, "from_user", None)
+        if user:
+            trace.attributes["user_id"] = user.id
+
+        # сколько сообщение шло до бота (getUpdates); дата — с точностью до секунды,
+        # у CallbackQuery её нет
+        date = getattr(update.event, "date", None)
+        if received and isinstance(date, datetime):
+            delivery_ns = received - int(date.timestamp() * 1e9)
+            trace.attributes["delivery_ms"] = max(0, delivery_ns // 1_000_000)
+
+        token = _current.set((trace, trace.root_id))
+        try:
+            return await handler(update, data)
+        except Exception as e:
+            trace.attributes["error"] = repr(e)
+            raise
+        finally:
+            _current.reset(token)
+            _sink.write(trace.finish())
+
+
+class TracingHandlerMiddleware:
+    """
+    Inner-middleware сообщений и колбэков: имя обработчика для трассы и
+    время в очереди — от получения апдейта до вызова обработчика
+    (задача asyncio, цикл событий, outer-middleware, фильтры)
+    """
+
+    async def __call__(self, handler, event, data):
+        current = _current.get()
+        if current is None:
+            return await handler(event, data)
+
+        trace, _ = current
+        callback = getattr(data.get("handler"), "callback", None)
+        name = getattr(callback, "__name__", None)
+        if name:
+            trace.name = name
+            trace.attributes["handler"] = name
+
+        trace.attributes["queued_ms"] = (time.time_ns() - trace.started) // 1_000_000
+        return await handler(event, data)
+
+
+class TracingRequestMiddleware:
+    """
+    Middleware сессии бота (интерфейс BaseRequestMiddleware):
+    спан на каждый вызов Bot API, время получения апдейтов из getUpdates
+    """
+
+    async def __call__(self, make_request, bot, method):
+        with span(f"tg.{type(method).__name__}"):
+            result = await make_request(bot, method)
+
+        if type(method).__name__ == "GetUpdates" and isinstance(result, list):
+            received = time.time_ns()
+            for update in result:
+                _received[update.update_id] = received
+            # апдейты, не дошедшие до dispatcher (например, при остановке)
+            while len(_received) > _RECEIVED_LIMIT:
+                del _received[next(iter(_received))]
+
+        return result
+
+
+async def on_ati_response(response: httpx.Response):
+    """
+    Хук ati_client: спан запроса к ATI, вместе с чтением тела ответа
+    """
+    current = _current.get()
+    if current is None:
+        return
+
+    await response.aread()
+
+    trace, parent_id = current
+    request = response.request
+    started = request.extensions.get("started")
+    elapsed_ns = int((time.monotonic() - started) * 1e9) if started else 0
+
+    from ati_client import endpoint_name
+    trace.add(
+        f"ati.{request.method} {endpoint_name(request.url.path)}",
+        _new_id(8), parent_id, time.time_ns() - elapsed_ns,
+        {"status": response.status_code, "bytes": len(response.content)},
+    )
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Добавляет trace_id к записям лога, сделанным внутри трассы
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = current_trace_id()
+        if trace_id:
+            record.trace_id = trace_id
+        return True
+
+
+def install_tracing(path: str, dp, bot, sample_rate: float = 1.0) -> JsonlSink:
+    """
+    Включает трассировку: outer-middleware на апдейты dp, inner — на сообщения
+    и колбэки (наследуется вложенными роутерами), middleware сессии бота,
+    хук ati_client и trace_id в логах
+    """
+    global _sink
+    import ati_client
+
+    _sink = JsonlSink(path)
+
+    dp.update.outer_middleware(TracingUpdateMiddleware(sample_rate))
+    handler_middleware = TracingHandlerMiddleware()
+    dp.message.middleware(handler_middleware)
+    dp.callback_query.middleware(handler_middleware)
+
+    bot.session.middleware(TracingRequestMiddleware())
+    ati_client.add_response_hook(on_ati_response)
+
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+
+    logger.info("[Tracing] трассы апдейтов пишутся в %s", path)
+    return _sink
+
+
+def uninstall_tracing():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None